@@ -22,6 +22,53 @@ DEFAULT_CONFIG = {
         '{\n  "is_match": true/false,\n  "reason": "краткое объяснение"\n}\n'
         "Не добавляй никаких ```json и других обёрток — только чистый JSON."
     ),
+    # профиль компании, что не подходит, и примеры оценок — идут в промпт сразу после фильтра
+    "gpt_rubric_text": (
+        "ПРОФИЛЬ КОМПАНИИ МЦЭ ИНЖИНИРИНГ\n"
+        "Подходят тендеры, где предмет закупки — наше оборудование или работы с ним:\n"
+        "• узлы учёта и измерения расхода газа, нефти, конденсата, тепловой энергии; системы измерения количества газа и нефти (СИКГ, СИКН, СИКВ, СИКНС);\n"
+        "• газоанализаторы, системы контроля загазованности, сигнализаторы, поточные и лабораторные газовые хроматографы;\n"
+        "• КИПиА: датчики и преобразователи давления, температуры, расходомеры, счётчики газа и жидкости, вычислители расхода;\n"
+        "• шкафы и щиты автоматики, управления, учёта, телемеханики, автоматизация технологических процессов (АСУ ТП);\n"
+        "• станции и насосы дозирования реагентов, дозирование метанола и ингибиторов;\n"
+        "• поставка, монтаж, пусконаладка, поверка и сервис перечисленного.\n"
+        "\n"
+        "НЕ подходят, даже если в тексте встречаются похожие слова:\n"
+        "• общестрой, ремонт зданий и кровли, отделка, фасады, лифты;\n"
+        "• медицина, лекарства, СИЗ, одежда, текстиль, продукты, вода, питание;\n"
+        "• канцелярия, картриджи, оргтехника, мебель, книги, игрушки;\n"
+        "• уборка, клининг, охрана, вывоз мусора, перевозки;\n"
+        "• бытовые счётчики воды и электроэнергии для ЖКХ без узлов учёта, если это розничная поставка приборов в квартиры;\n"
+        "• закупки, где наше оборудование упомянуто лишь как малая часть общестроя.\n"
+        "\n"
+        "ПРИМЕРЫ\n"
+        "Тендер: «Поставка узла учёта газа на ГРС», в спецификации: расходомер ультразвуковой, вычислитель расхода, блок-бокс.\n"
+        '{"is_match": true, "reason": "Поставка узла учёта газа с расходомером и вычислителем — наш профиль"}\n'
+        "Тендер: «Техническое обслуживание систем контроля загазованности котельных».\n"
+        '{"is_match": true, "reason": "Сервис систем контроля загазованности — наше направление"}\n'
+        "Тендер: «Поставка станции дозирования метанола для куста скважин».\n"
+        '{"is_match": true, "reason": "Станция дозирования метанола — профильное оборудование"}\n'
+        "Тендер: «Капитальный ремонт административного здания», среди работ — замена электросчётчиков.\n"
+        '{"is_match": false, "reason": "Общестрой, счётчики — малая часть работ"}\n'
+        "Тендер: «Поставка медицинских газоанализаторов крови для больницы».\n"
+        '{"is_match": false, "reason": "Медицинское оборудование, не промышленный газоанализ"}\n'
+        "Тендер: «Поставка картриджей и бумаги офисной».\n"
+        '{"is_match": false, "reason": "Канцелярия и расходники, не наш профиль"}\n'
+        "Тендер: «Пусконаладочные работы АСУ ТП компрессорной станции», шкафы управления, контроллеры, датчики давления и температуры.\n"
+        '{"is_match": true, "reason": "Пусконаладка АСУ ТП со шкафами и КИП — профиль компании"}\n'
+        "Тендер: «Поверка и калибровка манометров, датчиков давления и расходомеров».\n"
+        '{"is_match": true, "reason": "Поверка КИП и расходомеров — наш сервис"}\n'
+        "Тендер: «Поставка поточного газового хроматографа для ПХГ».\n"
+        '{"is_match": true, "reason": "Поточный хроматограф для газа — ключевое направление"}\n'
+        "Тендер: «Поставка квартирных счётчиков холодной и горячей воды для управляющей компании».\n"
+        '{"is_match": false, "reason": "Бытовые счётчики для ЖКХ, не промышленный учёт"}\n'
+        "Тендер: «Строительство газопровода-отвода», отдельным лотом — поставка СИКГ.\n"
+        '{"is_match": true, "reason": "Отдельный лот на поставку СИКГ — можно участвовать"}\n'
+        "Тендер: «Ремонт кровли и фасада котельной».\n"
+        '{"is_match": false, "reason": "Ремонт здания котельной, без оборудования учёта и автоматики"}\n'
+        "Тендер: «Поставка шкафа телемеханики и сигнализаторов загазованности для ГРП».\n"
+        '{"is_match": true, "reason": "Телемеханика и сигнализаторы загазованности для ГРП — наш профиль"}'
+    ),
     # фильтры Ростендера
     "keywords": [],            # положительные слова
     "exclude_keywords": [],    # исключения
@@ -30,6 +77,9 @@ DEFAULT_CONFIG = {
     # параметры поиска
     "search_days": 3,          # за сколько дней смотреть тендеры
     "max_pages": 2,            # сколько страниц Ростендера листать
+
+    # выдача
+    "compact_mode": False,     # короткие карточки, склеенные по нескольку в сообщение
 }
 
 
@@ -87,6 +137,19 @@ def set_gpt_filter_text(text: str) -> None:
         _write_config_raw(cfg)
 
 
+def get_gpt_rubric_text() -> str:
+    with _lock:
+        cfg = _read_config_raw()
+    return cfg.get("gpt_rubric_text", DEFAULT_CONFIG["gpt_rubric_text"])
+
+
+def set_gpt_rubric_text(text: str) -> None:
+    with _lock:
+        cfg = _read_config_raw()
+        cfg["gpt_rubric_text"] = text
+        _write_config_raw(cfg)
+
+
 # ============= ROSTENDER KEYWORDS / EXCLUDE / CITY =============
 
 
@@ -199,3 +262,19 @@ def set_max_pages(pages: int) -> None:
         cfg["max_pages"] = p
         _write_config_raw(cfg)
 
+
+
+# ============= COMPACT MODE =============
+
+
+def get_compact_mode() -> bool:
+    with _lock:
+        cfg = _read_config_raw()
+    return bool(cfg.get("compact_mode", DEFAULT_CONFIG["compact_mode"]))
+
+
+def set_compact_mode(enabled: bool) -> None:
+    with _lock:
+        cfg = _read_config_raw()
+        cfg["compact_mode"] = bool(enabled)
+        _write_config_raw(cfg)
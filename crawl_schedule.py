@@ -0,0 +1,236 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import zlib
+from contextlib import asynccontextmanager
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from threading import Lock
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from json_store import data_path, read_json, write_json_atomic
+
+log = logging.getLogger(__name__)
+
+# Фоновая проверка по расписанию: чат подписывается (/subscribe), и бот сам гоняет
+# проверку раз в interval минут, присылая только новые подходящие тендеры.
+#
+#   SCHEDULE_INTERVAL_MIN  — интервал по умолчанию, минут (не меньше SCHEDULE_MIN_INTERVAL_MIN);
+#   SCHEDULE_QUIET_HOURS   — тихие часы по умолчанию, «22-8» (местное время; пусто — без них);
+#   SCHEDULE_MAX_PARALLEL  — сколько фоновых проверок идёт одновременно на весь бот;
+#   SCHEDULE_WARM_SECONDS  — сколько результат фоновой проверки отдаётся по кнопке без нового обхода.
+#
+# Запуски разнесены по времени: у каждого чата свой сдвиг внутри интервала (от chat_id),
+# плюс общий семафор — Ростендер и OpenAI не получают все чаты разом.
+# Нужен JobQueue: pip install "python-telegram-bot[job-queue]".
+SUBSCRIPTIONS_PATH = data_path("subscriptions.json")
+SCHEDULE_INTERVAL_MIN = int(os.getenv("SCHEDULE_INTERVAL_MIN", "60") or 60)
+SCHEDULE_MIN_INTERVAL_MIN = 15
+SCHEDULE_QUIET_HOURS = os.getenv("SCHEDULE_QUIET_HOURS", "22-8").strip()
+SCHEDULE_MAX_PARALLEL = int(os.getenv("SCHEDULE_MAX_PARALLEL", "1") or 1)
+SCHEDULE_WARM_SECONDS = float(os.getenv("SCHEDULE_WARM_SECONDS", "1800") or 1800)
+# после старта бота первую фоновую проверку не раньше, чем через столько секунд
+SCHEDULE_FIRST_DELAY = 30
+
+JOB_PREFIX = "crawl:"
+
+Callback = Callable[[Any], Awaitable[None]]
+
+
+@dataclass
+class Subscription:
+    chat_id: int
+    interval_min: int = SCHEDULE_INTERVAL_MIN
+    quiet_hours: str = SCHEDULE_QUIET_HOURS
+    created: str = ""
+    last_run: Optional[str] = None
+    last_new: int = 0
+
+
+def parse_quiet_hours(text: str) -> Optional[Tuple[int, int]]:
+    """
+    «22-8» -> (22, 8); пусто, «0», «нет» — тихих часов нет. Мусор — ValueError.
+    """
+    text = (text or "").strip().lower()
+    if text in ("", "0", "нет", "no", "off"):
+        return None
+    start, sep, end = text.partition("-")
+    if not sep or not start.strip().isdigit() or not end.strip().isdigit():
+        raise ValueError(f"тихие часы в формате 22-8, а не {text!r}")
+    start_h, end_h = int(start), int(end)
+    if not (0 <= start_h <= 23 and 0 <= end_h <= 23) or start_h == end_h:
+        raise ValueError(f"часы от 0 до 23 и не равные друг другу: {text!r}")
+    return start_h, end_h
+
+
+def in_quiet_hours(quiet_hours: str, now: Optional[datetime] = None) -> bool:
+    try:
+        span = parse_quiet_hours(quiet_hours)
+    except ValueError:
+        return False
+    if span is None:
+        return False
+    hour = (now or datetime.now()).hour
+    start, end = span
+    # 22-8 переходит через полночь, 1-6 — нет
+    return start <= hour < end if start < end else hour >= start or hour < end
+
+
+def stagger_offset(chat_id: int, interval_s: float) -> float:
+    """
+    Сдвиг первого запуска внутри интервала: постоянный для чата и равномерный по чатам.
+    """
+    fraction = zlib.crc32(str(chat_id).encode("utf-8")) / 0xFFFFFFFF
+    return SCHEDULE_FIRST_DELAY + fraction * max(interval_s - SCHEDULE_FIRST_DELAY, 0)
+
+
+def job_name(chat_id: int) -> str:
+    return f"{JOB_PREFIX}{chat_id}"
+
+
+# ================== ПОДПИСКИ ==================
+
+
+class SubscriptionStore:
+    def __init__(self, path: str = SUBSCRIPTIONS_PATH) -> None:
+        self.path = path
+        self._lock = Lock()
+        self._subs: Dict[str, Subscription] = {}
+        self._loaded = False
+
+    def _ensure_loaded(self) -> None:
+        if self._loaded:
+            return
+        for key, raw in (read_json(self.path, {}) or {}).items():
+            try:
+                self._subs[key] = Subscription(**raw)
+            except TypeError as e:
+                log.warning("Подписка %s не прочиталась: %s", key, e)
+        self._loaded = True
+
+    def _save(self) -> None:
+        try:
+            write_json_atomic(self.path, {k: asdict(s) for k, s in self._subs.items()})
+        except Exception as e:
+            log.warning("Не удалось сохранить подписки: %s", e)
+
+    def get(self, chat_id: int) -> Optional[Subscription]:
+        with self._lock:
+            self._ensure_loaded()
+            return self._subs.get(str(chat_id))
+
+    def all(self) -> List[Subscription]:
+        with self._lock:
+            self._ensure_loaded()
+            return list(self._subs.values())
+
+    def subscribe(
+        self,
+        chat_id: int,
+        interval_min: Optional[int] = None,
+        quiet_hours: Optional[str] = None,
+    ) -> Subscription:
+        with self._lock:
+            self._ensure_loaded()
+            sub = self._subs.get(str(chat_id)) or Subscription(
+                chat_id=chat_id, created=datetime.now().isoformat(timespec="seconds")
+            )
+            if interval_min is not None:
+                sub.interval_min = max(int(interval_min), SCHEDULE_MIN_INTERVAL_MIN)
+            if quiet_hours is not None:
+                sub.quiet_hours = quiet_hours
+            self._subs[str(chat_id)] = sub
+            self._save()
+            return sub
+
+    def unsubscribe(self, chat_id: int) -> bool:
+        with self._lock:
+            self._ensure_loaded()
+            removed = self._subs.pop(str(chat_id), None) is not None
+            if removed:
+                self._save()
+            return removed
+
+    def touch(self, chat_id: int, new_matches: int) -> None:
+        with self._lock:
+            self._ensure_loaded()
+            sub = self._subs.get(str(chat_id))
+            if sub is None:
+                return
+            sub.last_run = datetime.now().isoformat(timespec="seconds")
+            sub.last_new = new_matches
+            self._save()
+
+
+_store: Optional[SubscriptionStore] = None
+_store_lock = Lock()
+
+
+def get_subscriptions() -> SubscriptionStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = SubscriptionStore()
+        return _store
+
+
+# ================== JOBQUEUE ==================
+
+
+def schedule_chat(job_queue: Any, sub: Subscription, callback: Callback) -> Any:
+    """
+    (Пере)ставим повторяющуюся задачу чата; старую с тем же именем снимаем.
+    """
+    unschedule_chat(job_queue, sub.chat_id)
+    interval_s = sub.interval_min * 60
+    first = stagger_offset(sub.chat_id, interval_s)
+    log.info(
+        "Фоновая проверка чата %s: каждые %d мин, первая через %.0f с, тихие часы %s",
+        sub.chat_id,
+        sub.interval_min,
+        first,
+        sub.quiet_hours or "нет",
+    )
+    return job_queue.run_repeating(
+        callback,
+        interval=interval_s,
+        first=first,
+        name=job_name(sub.chat_id),
+        chat_id=sub.chat_id,
+    )
+
+
+def unschedule_chat(job_queue: Any, chat_id: int) -> None:
+    for job in job_queue.get_jobs_by_name(job_name(chat_id)):
+        job.schedule_removal()
+
+
+def schedule_all(job_queue: Any, callback: Callback) -> int:
+    subs = get_subscriptions().all()
+    for sub in subs:
+        schedule_chat(job_queue, sub, callback)
+    return len(subs)
+
+
+def next_run(job_queue: Any, chat_id: int) -> Optional[datetime]:
+    if job_queue is None:
+        return None
+    jobs = job_queue.get_jobs_by_name(job_name(chat_id))
+    return jobs[0].next_t if jobs else None
+
+
+_slots: Optional[asyncio.Semaphore] = None
+
+
+@asynccontextmanager
+async def schedule_slot() -> AsyncIterator[None]:
+    """
+    Общий на бот лимит одновременных фоновых проверок (SCHEDULE_MAX_PARALLEL).
+    """
+    global _slots
+    if _slots is None:
+        _slots = asyncio.Semaphore(max(SCHEDULE_MAX_PARALLEL, 1))
+    async with _slots:
+        yield
@@ -0,0 +1,370 @@
+from __future__ import annotations
+
+import hashlib
+import logging
+import re
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from threading import Lock
+from typing import Any, Dict, List, Optional, Set
+
+from json_store import data_path, read_json, write_json_atomic
+
+log = logging.getLogger(__name__)
+
+DEDUP_INDEX_PATH = data_path("dedup_index.json")
+
+SIMHASH_BITS = 64
+# 4 полосы по 16 бит: при расстоянии Хэмминга <= 3 хотя бы одна полоса
+# гарантированно совпадает целиком (принцип Дирихле), поэтому LSH не теряет пары.
+LSH_BANDS = 4
+MAX_HAMMING_DISTANCE = 3
+RETENTION_DAYS = 30
+
+# веса признаков: ключевые поля весят больше отдельных слов названия
+TITLE_WORD_WEIGHT = 1
+TITLE_SHINGLE_WEIGHT = 2
+KEY_FIELD_WEIGHT = 4
+
+# служебные слова, которые меняются между перепубликациями и не несут смысла
+_NOISE_WORDS = {
+    "повторно",
+    "повторная",
+    "повторный",
+    "переторжка",
+    "лот",
+    "лота",
+    "извещение",
+    "закупка",
+    "закупки",
+    "на",
+    "для",
+    "и",
+    "в",
+    "по",
+    "с",
+    "нужд",
+}
+
+_lock = Lock()
+
+
+def _normalize_title(title: str) -> List[str]:
+    """
+    Нормализация названия:
+    - нижний регистр, ё -> е;
+    - выкидываем пунктуацию, номера и служебные слова перепубликаций.
+    """
+    t = (title or "").lower().replace("ё", "е")
+    t = re.sub(r"[^\w\s]", " ", t)
+    words = [w for w in t.split() if not w.isdigit() and w not in _NOISE_WORDS]
+    return words
+
+
+def _price_bucket(price: Optional[int]) -> Optional[str]:
+    """
+    Цена с точностью до 2 значащих цифр: копеечные правки НМЦК
+    при перепубликации не должны разводить тендеры по разным кластерам.
+    """
+    if not price:
+        return None
+    digits = len(str(price))
+    step = 10 ** max(digits - 2, 0)
+    return str(round(price / step) * step)
+
+
+def _features(tender: Any) -> Dict[str, int]:
+    words = _normalize_title(getattr(tender, "title", "") or "")
+    feats: Dict[str, int] = {}
+
+    for w in words:
+        feats[f"w:{w}"] = feats.get(f"w:{w}", 0) + TITLE_WORD_WEIGHT
+    for a, b in zip(words, words[1:]):
+        key = f"s:{a} {b}"
+        feats[key] = feats.get(key, 0) + TITLE_SHINGLE_WEIGHT
+
+    customer = getattr(tender, "customer", None)
+    if customer:
+        feats["c:" + " ".join(_normalize_title(customer))] = KEY_FIELD_WEIGHT
+
+    price = _price_bucket(getattr(tender, "price", None))
+    if price:
+        feats["p:" + price] = KEY_FIELD_WEIGHT
+
+    end_dt = getattr(tender, "end_datetime", None)
+    if end_dt is not None:
+        try:
+            feats["e:" + end_dt.strftime("%Y-%m-%d")] = KEY_FIELD_WEIGHT
+        except Exception:
+            pass
+
+    return feats
+
+
+def simhash(tender: Any) -> int:
+    """
+    64-битный SimHash по нормализованному названию и ключевым полям
+    (заказчик, цена, срок окончания).
+    """
+    acc = [0] * SIMHASH_BITS
+    for feat, weight in _features(tender).items():
+        h = int.from_bytes(
+            hashlib.blake2b(feat.encode("utf-8"), digest_size=8).digest(),
+            "big",
+        )
+        for bit in range(SIMHASH_BITS):
+            if h >> bit & 1:
+                acc[bit] += weight
+            else:
+                acc[bit] -= weight
+
+    value = 0
+    for bit in range(SIMHASH_BITS):
+        if acc[bit] > 0:
+            value |= 1 << bit
+    return value
+
+
+def _bands(value: int) -> List[str]:
+    width = SIMHASH_BITS // LSH_BANDS
+    mask = (1 << width) - 1
+    return [f"{i}:{value >> (i * width) & mask:x}" for i in range(LSH_BANDS)]
+
+
+@dataclass
+class TenderCluster:
+    cluster_id: str
+    representative: Any
+    members: List[Any] = field(default_factory=list)   # тендеры этого запуска
+    earlier_numbers: List[str] = field(default_factory=list)  # видели в прошлых запусках
+    verdict: Optional[dict] = None   # {"is_match", "reason", "confidence", "fingerprint", "at"}
+    first_seen: bool = True   # ни один тендер кластера раньше в индекс не попадал
+
+    @property
+    def duplicates(self) -> List[Any]:
+        return [t for t in self.members if t is not self.representative]
+
+
+class DedupIndex:
+    """
+    Персистентный индекс почти-дубликатов.
+
+    entries:  номер тендера -> {"h": simhash, "c": id кластера, "seen": дата}
+    clusters: id кластера   -> {"members": [...], "verdict": {...} | None}
+    Полосы LSH в файл не пишем — пересобираем при загрузке.
+
+    Каждый запуск работает со своей копией (проверки в разных чатах идут
+    параллельно), поэтому save() не перезаписывает файл, а под блокировкой
+    перечитывает его и вливает только то, что этот запуск поменял.
+    """
+
+    def __init__(
+        self,
+        path: str = DEDUP_INDEX_PATH,
+        max_distance: int = MAX_HAMMING_DISTANCE,
+        retention_days: int = RETENTION_DAYS,
+    ) -> None:
+        self.path = path
+        self.max_distance = max_distance
+        self.retention_days = retention_days
+        self.entries: Dict[str, dict] = {}
+        self.clusters: Dict[str, dict] = {}
+        self._bands: Dict[str, Set[str]] = {}
+        # что поменял этот запуск — только это и вливаем в файл при save()
+        self._touched: Set[str] = set()
+        self._verdicts: Set[str] = set()
+        # кластер -> когда сбросили вердикт (тендер перепубликован с другим содержимым)
+        self._cleared: Dict[str, str] = {}
+
+    # ---------- загрузка / сохранение ----------
+
+    @classmethod
+    def load(cls, path: str = DEDUP_INDEX_PATH) -> "DedupIndex":
+        index = cls(path=path)
+        with _lock:
+            raw = read_json(path, {})
+        index.entries = dict(raw.get("entries") or {})
+        index.clusters = dict(raw.get("clusters") or {})
+        index._prune()
+        index._rebuild_bands()
+        return index
+
+    def save(self) -> None:
+        with _lock:
+            raw = read_json(self.path, {})
+            self._merge(dict(raw.get("entries") or {}), dict(raw.get("clusters") or {}))
+            write_json_atomic(
+                self.path,
+                {"entries": self.entries, "clusters": self.clusters},
+            )
+        self._touched.clear()
+        self._verdicts.clear()
+        self._cleared.clear()
+
+    def _merge(self, entries: Dict[str, dict], clusters: Dict[str, dict]) -> None:
+        """
+        Вливаем изменения этого запуска в то, что сейчас лежит в файле:
+        - новый номер добавляем; номер, который параллельный запуск уже положил
+          в свой кластер, там и оставляем (обновляем «seen» и хэш содержимого);
+        - сброшенный вердикт сбрасываем, если в файле он не новее сброса;
+        - вердикт берём свежее по времени;
+        - состав кластеров пересобираем по entries.
+        """
+        for number in self._touched:
+            ours = self.entries.get(number)
+            if ours is None:
+                continue
+            theirs = entries.get(number)
+            if theirs is None:
+                entries[number] = ours
+            else:
+                theirs["seen"] = max(theirs.get("seen", ""), ours.get("seen", ""))
+                theirs["h"] = ours["h"]
+
+        verdicts = {cid: c.get("verdict") for cid, c in clusters.items()}
+        for cid, cleared_at in self._cleared.items():
+            theirs = verdicts.get(cid)
+            if theirs and theirs.get("at", "") <= cleared_at:
+                verdicts[cid] = None
+        for cid in self._verdicts:
+            ours = (self.clusters.get(cid) or {}).get("verdict")
+            theirs = verdicts.get(cid)
+            if ours and (not theirs or ours.get("at", "") >= theirs.get("at", "")):
+                verdicts[cid] = ours
+
+        members: Dict[str, List[str]] = {}
+        for number, entry in entries.items():
+            members.setdefault(entry["c"], []).append(number)
+        self.entries = entries
+        self.clusters = {cid: {"members": m, "verdict": verdicts.get(cid)} for cid, m in members.items()}
+        self._prune()
+        self._rebuild_bands()
+
+    def _prune(self) -> None:
+        """
+        Забываем тендеры старше retention_days, чтобы файл не рос бесконечно.
+        """
+        min_seen = (date.today() - timedelta(days=self.retention_days)).isoformat()
+        stale = [n for n, e in self.entries.items() if e.get("seen", "") < min_seen]
+        for number in stale:
+            entry = self.entries.pop(number)
+            cluster = self.clusters.get(entry["c"])
+            if cluster is not None:
+                cluster["members"] = [m for m in cluster["members"] if m != number]
+                if not cluster["members"]:
+                    self.clusters.pop(entry["c"], None)
+        if stale:
+            log.info("Индекс дублей: удалено %d устаревших записей", len(stale))
+
+    def _rebuild_bands(self) -> None:
+        self._bands = {}
+        for number, entry in self.entries.items():
+            self._add_bands(number, int(entry["h"], 16))
+
+    def _add_bands(self, number: str, value: int) -> None:
+        for band in _bands(value):
+            self._bands.setdefault(band, set()).add(number)
+
+    # ---------- поиск / кластеризация ----------
+
+    def _find_cluster(self, value: int) -> Optional[str]:
+        candidates: Set[str] = set()
+        for band in _bands(value):
+            candidates |= self._bands.get(band, set())
+
+        best: Optional[tuple[int, str]] = None
+        for number in candidates:
+            entry = self.entries[number]
+            dist = bin(value ^ int(entry["h"], 16)).count("1")
+            if dist <= self.max_distance and (best is None or dist < best[0]):
+                best = (dist, entry["c"])
+        return best[1] if best else None
+
+    def assign(self, tender: Any) -> str:
+        """
+        Кладём тендер в индекс и возвращаем id его кластера.
+        Тот же номер всегда попадает в тот же кластер. Если под тем же номером
+        пришло другое содержимое (перепубликация с новым названием, ценой или
+        сроком), вердикт кластера сбрасываем — его нужно получить заново.
+        """
+        number = str(getattr(tender, "number", ""))
+        today = date.today().isoformat()
+        value = simhash(tender)
+
+        entry = self.entries.get(number)
+        if entry is not None:
+            if entry.get("seen") != today:
+                entry["seen"] = today
+                self._touched.add(number)
+            if entry["h"] != f"{value:x}":
+                entry["h"] = f"{value:x}"
+                self._add_bands(number, value)
+                self._touched.add(number)
+                self._clear_verdict(entry["c"])
+            return entry["c"]
+
+        cluster_id = self._find_cluster(value) or number
+        cluster = self.clusters.setdefault(cluster_id, {"members": [], "verdict": None})
+        cluster["members"].append(number)
+
+        self.entries[number] = {"h": f"{value:x}", "c": cluster_id, "seen": today}
+        self._add_bands(number, value)
+        self._touched.add(number)
+        return cluster_id
+
+    def group(self, tenders: List[Any], fingerprint: Optional[str] = None) -> List[TenderCluster]:
+        """
+        Группируем тендеры запуска в кластеры (порядок — по первому вхождению).
+        Вердикт кластера отдаём только если он получен с тем же fingerprint
+        (промпт + модель), иначе его нужно пересчитать.
+        """
+        by_id: Dict[str, TenderCluster] = {}
+        known_before = set(self.entries)
+        for t in tenders:
+            known = str(getattr(t, "number", "")) in known_before
+            cid = self.assign(t)
+            cluster = by_id.get(cid)
+            if cluster is None:
+                cluster = TenderCluster(cluster_id=cid, representative=t)
+                by_id[cid] = cluster
+            cluster.members.append(t)
+            if known:
+                cluster.first_seen = False
+
+        for cid, cluster in by_id.items():
+            current = {str(getattr(t, "number", "")) for t in cluster.members}
+            stored = self.clusters.get(cid, {})
+            cluster.earlier_numbers = [m for m in stored.get("members", []) if m not in current]
+            if cluster.earlier_numbers:
+                cluster.first_seen = False
+            verdict = stored.get("verdict")
+            if verdict and (fingerprint is None or verdict.get("fingerprint") == fingerprint):
+                cluster.verdict = verdict
+
+        return list(by_id.values())
+
+    def _clear_verdict(self, cluster_id: str) -> None:
+        cluster = self.clusters.get(cluster_id)
+        if cluster is not None and cluster.get("verdict"):
+            log.info("Индекс дублей: содержимое кластера %s изменилось — вердикт сброшен", cluster_id)
+            cluster["verdict"] = None
+        self._cleared[cluster_id] = datetime.now().isoformat(timespec="seconds")
+        self._verdicts.discard(cluster_id)
+
+    def set_verdict(
+        self,
+        cluster_id: str,
+        is_match: bool,
+        reason: str,
+        fingerprint: Optional[str] = None,
+        confidence: Optional[float] = None,
+    ) -> None:
+        cluster = self.clusters.setdefault(cluster_id, {"members": [], "verdict": None})
+        cluster["verdict"] = {
+            "is_match": bool(is_match),
+            "reason": reason,
+            "confidence": confidence,
+            "fingerprint": fingerprint,
+            "at": datetime.now().isoformat(timespec="seconds"),
+        }
+        self._verdicts.add(cluster_id)
@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+from datetime import date, datetime, timedelta
+from threading import Lock
+from typing import Any, Dict, Iterable, Optional
+
+from json_store import data_path, read_json, write_json_atomic
+
+log = logging.getLogger(__name__)
+
+# Что уже присылали в каждый чат: chat_id -> номер тендера -> {"h": хэш содержимого, "at": когда}.
+# Сверяемся до карточек, ИИ и отправки: повторный запуск работает только с новыми тендерами.
+# Хэш — по полям из каталога (детали к этому моменту ещё не загружены): если у тендера
+# поменялись срок, цена или название, он снова считается новым.
+DELIVERED_PATH = data_path("delivered.json")
+DELIVERED_RETENTION_DAYS = int(os.getenv("DELIVERED_RETENTION_DAYS", "45") or 45)
+
+STATUS_NEW = "new"
+STATUS_SEEN = "seen"
+STATUS_CHANGED = "changed"    # номер присылали, но содержимое с тех пор поменялось
+
+
+def content_hash(tender: Any) -> str:
+    end_dt = getattr(tender, "end_datetime", None)
+    parts = [
+        getattr(tender, "title", "") or "",
+        str(getattr(tender, "price_raw", None) or getattr(tender, "price", None) or ""),
+        end_dt.isoformat() if end_dt is not None else "",
+    ]
+    return hashlib.blake2b("\n".join(parts).encode("utf-8"), digest_size=8).hexdigest()
+
+
+class DeliveryLedger:
+    def __init__(self, path: str = DELIVERED_PATH, retention_days: int = DELIVERED_RETENTION_DAYS) -> None:
+        self.path = path
+        self.retention_days = retention_days
+        self._lock = Lock()
+        self._chats: Dict[str, Dict[str, dict]] = {}
+        self._loaded = False
+
+    def _ensure_loaded(self) -> None:
+        if self._loaded:
+            return
+        self._chats = dict(read_json(self.path, {}) or {})
+        self._prune()
+        self._loaded = True
+
+    def _prune(self) -> None:
+        """
+        Старые отметки забываем: тендеры столько не живут, а файл не должен расти.
+        """
+        min_at = (date.today() - timedelta(days=self.retention_days)).isoformat()
+        removed = 0
+        for chat_key in list(self._chats):
+            entries = self._chats[chat_key]
+            stale = [n for n, e in entries.items() if e.get("at", "") < min_at]
+            for number in stale:
+                del entries[number]
+            removed += len(stale)
+            if not entries:
+                del self._chats[chat_key]
+        if removed:
+            log.info("Журнал доставки: удалено %d устаревших записей", removed)
+
+    def _save(self) -> None:
+        try:
+            write_json_atomic(self.path, self._chats)
+        except Exception as e:
+            log.warning("Не удалось сохранить журнал доставки: %s", e)
+
+    # ---------- чтение ----------
+
+    def status(self, chat_id: int, tenders: Iterable[Any]) -> Dict[str, str]:
+        """
+        номер -> STATUS_NEW / STATUS_SEEN / STATUS_CHANGED для этого чата.
+        """
+        with self._lock:
+            self._ensure_loaded()
+            entries = self._chats.get(str(chat_id), {})
+            result: Dict[str, str] = {}
+            for t in tenders:
+                number = str(getattr(t, "number", ""))
+                entry = entries.get(number)
+                if entry is None:
+                    result[number] = STATUS_NEW
+                elif entry.get("h") == content_hash(t):
+                    result[number] = STATUS_SEEN
+                else:
+                    result[number] = STATUS_CHANGED
+            return result
+
+    # ---------- запись ----------
+
+    def mark(self, chat_id: int, tenders: Iterable[Any]) -> None:
+        """
+        Отмечаем доставленные тендеры (вызывать после успешной отправки).
+        """
+        now = datetime.now().isoformat(timespec="seconds")
+        with self._lock:
+            self._ensure_loaded()
+            entries = self._chats.setdefault(str(chat_id), {})
+            for t in tenders:
+                entries[str(getattr(t, "number", ""))] = {"h": content_hash(t), "at": now}
+            self._save()
+
+
+_ledger: Optional[DeliveryLedger] = None
+_ledger_lock = Lock()
+
+
+def get_delivery_ledger() -> DeliveryLedger:
+    global _ledger
+    with _ledger_lock:
+        if _ledger is None:
+            _ledger = DeliveryLedger()
+        return _ledger
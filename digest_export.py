@@ -0,0 +1,189 @@
+from __future__ import annotations
+
+import codecs
+import csv
+import html
+import importlib.util
+import logging
+import os
+import tempfile
+from datetime import date, datetime
+from typing import IO, Any, Iterator, List, Optional, Tuple
+
+from results_cache import KIND_LOCAL, KIND_MATCHED, KIND_ORDER, KIND_REJECTED, KIND_SEEN, ResultItem, ResultSet
+
+log = logging.getLogger(__name__)
+
+# Выгрузка результатов запуска одним документом: CSV, XLSX (если стоит openpyxl) или HTML.
+# Строки пишем сразу во временный файл по одной — весь документ в памяти не собираем;
+# до DIGEST_SPOOL_BYTES файл живёт в памяти, дальше уходит на диск.
+DIGEST_FORMAT = os.getenv("DIGEST_FORMAT", "csv").strip().lower() or "csv"
+DIGEST_SPOOL_BYTES = 1024 * 1024
+
+FORMAT_CSV = "csv"
+FORMAT_XLSX = "xlsx"
+FORMAT_HTML = "html"
+
+STATUS_TITLES = {
+    KIND_MATCHED: "подходит",
+    KIND_REJECTED: "отклонён ИИ",
+    KIND_LOCAL: "без проверки ИИ",
+    KIND_SEEN: "уже присылал",
+}
+
+COLUMNS = [
+    "Статус",
+    "Номер",
+    "Название",
+    "Город",
+    "Регион",
+    "Цена",
+    "Опубликован",
+    "Окончание приёма",
+    "Приоритет МЦЭ",
+    "Ключевые слова",
+    "Комментарий",
+    "Уверенность ИИ",
+    "Ссылка",
+]
+
+Row = Tuple[Any, ...]
+
+
+def xlsx_available() -> bool:
+    return importlib.util.find_spec("openpyxl") is not None
+
+
+def available_formats() -> List[str]:
+    formats = [FORMAT_CSV, FORMAT_HTML]
+    if xlsx_available():
+        formats.insert(1, FORMAT_XLSX)
+    return formats
+
+
+def _date_text(value: Any, with_time: bool = False) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.strftime("%d.%m.%Y %H:%M" if with_time else "%d.%m.%Y")
+    if isinstance(value, date):
+        return value.strftime("%d.%m.%Y")
+    return str(value)
+
+
+def _row(kind: str, item: ResultItem) -> Row:
+    status = STATUS_TITLES[kind]
+    if kind == KIND_MATCHED and item.local_only:
+        status = "подходит (без ИИ)"
+    return (
+        status,
+        item.number,
+        item.title,
+        item.city,
+        item.region,
+        "" if item.price_raw is None else str(item.price_raw),
+        _date_text(item.published),
+        _date_text(item.end_datetime, with_time=True),
+        "" if item.priority is None else item.priority,
+        ", ".join(item.keywords),
+        item.reason,
+        "" if item.confidence is None else round(item.confidence, 2),
+        item.url,
+    )
+
+
+def iter_rows(result: ResultSet) -> Iterator[Row]:
+    """
+    Подходящие, отклонённые, кандидаты без проверки ИИ, затем уже присланные раньше.
+    """
+    for kind in KIND_ORDER:
+        for item in result.sections.get(kind) or ():
+            yield _row(kind, item)
+
+
+# ================== ФОРМАТЫ ==================
+
+
+class _Utf8Writer:
+    def __init__(self, out: IO[bytes]) -> None:
+        self.out = out
+
+    def write(self, text: str) -> None:
+        self.out.write(text.encode("utf-8"))
+
+
+def _write_csv(rows: Iterator[Row], out: IO[bytes]) -> None:
+    # BOM и «;» — чтобы русский Excel открыл файл двойным щелчком без мастера импорта
+    out.write(codecs.BOM_UTF8)
+    writer = csv.writer(_Utf8Writer(out), delimiter=";")
+    writer.writerow(COLUMNS)
+    for row in rows:
+        writer.writerow(row)
+
+
+def _write_xlsx(rows: Iterator[Row], out: IO[bytes]) -> None:
+    from openpyxl import Workbook
+
+    # write_only: строки уходят во временный XML по мере append, а не копятся в памяти
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Тендеры")
+    ws.freeze_panes = "A2"
+    ws.append(COLUMNS)
+    for row in rows:
+        ws.append(list(row))
+    wb.save(out)
+
+
+def _write_html(rows: Iterator[Row], out: IO[bytes], title: str) -> None:
+    def w(text: str) -> None:
+        out.write(text.encode("utf-8"))
+
+    w(
+        "<!DOCTYPE html><html lang=\"ru\"><head><meta charset=\"utf-8\">"
+        f"<title>{html.escape(title)}</title>"
+        "<style>body{font:13px sans-serif}table{border-collapse:collapse}"
+        "td,th{border:1px solid #ccc;padding:3px 6px;vertical-align:top}"
+        "th{background:#eee;position:sticky;top:0}</style></head><body>"
+        f"<h3>{html.escape(title)}</h3><table><tr>"
+    )
+    w("".join(f"<th>{html.escape(c)}</th>" for c in COLUMNS) + "</tr>\n")
+    url_index = COLUMNS.index("Ссылка")
+    for row in rows:
+        cells = []
+        for i, value in enumerate(row):
+            text = html.escape(str(value))
+            if i == url_index and value:
+                text = f'<a href="{text}">открыть</a>'
+            cells.append(f"<td>{text}</td>")
+        w("<tr>" + "".join(cells) + "</tr>\n")
+    w("</table></body></html>\n")
+
+
+def export_digest(result: ResultSet, fmt: Optional[str] = None) -> Tuple[IO[bytes], str]:
+    """
+    Пишем выгрузку во временный файл; возвращаем (файл, перемотанный в начало, имя для Telegram).
+    Файл закрывает вызывающий.
+    """
+    fmt = (fmt or DIGEST_FORMAT).lower()
+    if fmt == FORMAT_XLSX and not xlsx_available():
+        log.warning("openpyxl не установлен — выгружаю CSV вместо XLSX")
+        fmt = FORMAT_CSV
+    if fmt not in (FORMAT_CSV, FORMAT_XLSX, FORMAT_HTML):
+        fmt = FORMAT_CSV
+
+    stamp = datetime.now().strftime("%Y-%m-%d_%H-%M")
+    filename = f"tenders_{stamp}_{result.run_id}.{fmt}"
+    out = tempfile.SpooledTemporaryFile(max_size=DIGEST_SPOOL_BYTES)
+    try:
+        rows = iter_rows(result)
+        if fmt == FORMAT_XLSX:
+            _write_xlsx(rows, out)
+        elif fmt == FORMAT_HTML:
+            _write_html(rows, out, f"Тендеры на {stamp.replace('_', ' ')}")
+        else:
+            _write_csv(rows, out)
+    except Exception:
+        out.close()
+        raise
+    out.seek(0)
+    return out, filename
@@ -0,0 +1,44 @@
+from __future__ import annotations
+
+import os
+
+# .env читаем один раз на процесс и раньше всех модулей проекта: их настройки —
+# константы, которые берутся из окружения при импорте. Поэтому точки входа
+# (tg_bot, gpt_client, gpt_eval, gpt_batch_api) импортируют этот модуль первым;
+# повторный импорт из другого модуля ничего не делает.
+#
+# Файл ищем, как find_dotenv() из python-dotenv (им раньше пользовались gpt_client
+# и парсер): .env в каталоге кода, затем в родительских каталогах вверх до корня.
+# DOTENV_PATH — явный путь к файлу. Если файла нет (переменные приходят из
+# окружения контейнера), python-dotenv даже не импортируем.
+DOTENV_PATH = os.getenv("DOTENV_PATH", "").strip()
+
+
+def find_env_file(start: str = os.path.dirname(os.path.abspath(__file__))) -> str:
+    """
+    Ближайший .env от start вверх по каталогам; пустая строка — не нашли.
+    """
+    path = start
+    while True:
+        candidate = os.path.join(path, ".env")
+        if os.path.isfile(candidate):
+            return candidate
+        parent = os.path.dirname(path)
+        if parent == path:
+            return ""
+        path = parent
+
+
+def load_env(path: str = DOTENV_PATH) -> bool:
+    """
+    Переменные из .env, не перетирая уже заданные в окружении.
+    """
+    path = path or find_env_file()
+    if not path or not os.path.isfile(path):
+        return False
+    from dotenv import load_dotenv
+
+    return load_dotenv(path)
+
+
+load_env()
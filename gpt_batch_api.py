@@ -0,0 +1,382 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import time
+import uuid
+from datetime import datetime
+from threading import Lock
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+import env_loader  # noqa: F401  (.env — до остальных модулей проекта)
+from config_store import get_gpt_filter_text
+from gpt_cache import get_verdict_cache, text_hash
+from gpt_client import (
+    GPT_MODEL_TIERS,
+    OPENAI_BASE_URL,
+    GPTResult,
+    _build_payload,
+    _build_user_prompt,
+    _headers,
+    _result_from_content,
+    _system_prefix,
+    cascade_id,
+    tender_content_hash,
+)
+from gpt_pricing import cost_usd
+from json_store import data_path, read_json, write_json_atomic
+from usage_ledger import get_ledger, track_run
+
+log = logging.getLogger(__name__)
+
+# Офлайн-оценка пачек тендеров через OpenAI Batch API (ночные догрузки).
+# Дешевле и не упирается в лимиты интерактивного режима, но ответ — до 24 ч.
+#
+# Шаги: JSONL -> /files (purpose=batch) -> /batches -> опрос -> output-файл.
+# После каждого шага состояние задания пишется в data/gpt_batch_jobs.json,
+# поэтому после перезапуска задание продолжается с того места, где остановилось.
+
+BATCH_JOBS_PATH = data_path("gpt_batch_jobs.json")
+BATCH_FILES_DIR = data_path("batches")
+BATCH_ENDPOINT = "/v1/chat/completions"
+BATCH_COMPLETION_WINDOW = "24h"
+# офлайн не торопимся и платим полцены — берём самую сильную модель каскада,
+# а вердикт кладём в кэш под ключом всего каскада
+BATCH_MODEL = GPT_MODEL_TIERS[-1]
+# Batch API тарифицируется вдвое дешевле интерактивных запросов
+BATCH_PRICE_FACTOR = 0.5
+
+# терминальные статусы Batch API
+FINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+_lock = Lock()
+
+
+def _load_jobs() -> Dict[str, dict]:
+    with _lock:
+        return dict(read_json(BATCH_JOBS_PATH, {}).get("jobs") or {})
+
+
+def _save_job(job: dict) -> None:
+    with _lock:
+        raw = read_json(BATCH_JOBS_PATH, {})
+        jobs = raw.get("jobs") or {}
+        jobs[job["id"]] = job
+        write_json_atomic(BATCH_JOBS_PATH, {"jobs": jobs})
+
+
+def list_jobs() -> List[dict]:
+    return sorted(_load_jobs().values(), key=lambda j: j.get("created", ""))
+
+
+def get_job(job_id: str) -> Optional[dict]:
+    return _load_jobs().get(job_id)
+
+
+def _auth_headers() -> dict:
+    # Content-Type для multipart/GET выставит httpx сам
+    headers = _headers()
+    headers.pop("Content-Type", None)
+    return headers
+
+
+# ================== ПОДГОТОВКА ==================
+
+
+def build_batch_lines(items: List[Tuple[Any, Any]]) -> Tuple[List[dict], Dict[str, str]]:
+    """
+    Строки JSONL для Batch API (custom_id = номер тендера)
+    и ключи кэша вердиктов, чтобы потом положить ответы в тот же кэш.
+    """
+    system_prompt = get_gpt_filter_text()
+    prompt_hash = text_hash(_system_prefix(system_prompt))
+    lines: List[dict] = []
+    cache_keys: Dict[str, str] = {}
+    seen = set()
+    for tender, _local in items:
+        code = str(getattr(tender, "number", "unknown"))
+        if code in seen:
+            continue
+        seen.add(code)
+        lines.append(
+            {
+                "custom_id": code,
+                "method": "POST",
+                "url": BATCH_ENDPOINT,
+                "body": _build_payload(system_prompt, _build_user_prompt(tender, model=BATCH_MODEL), model=BATCH_MODEL),
+            }
+        )
+        cache_keys[code] = get_verdict_cache().make_key(
+            code, tender_content_hash(tender), prompt_hash, cascade_id()
+        )
+    return lines, cache_keys
+
+
+def create_job(items: List[Tuple[Any, Any]]) -> dict:
+    """
+    Пишем JSONL на диск и заводим локальное задание (ещё без обращения к API).
+    """
+    lines, cache_keys = build_batch_lines(items)
+    job_id = datetime.now().strftime("%Y%m%d-%H%M%S-") + uuid.uuid4().hex[:6]
+    os.makedirs(BATCH_FILES_DIR, exist_ok=True)
+    jsonl_path = os.path.join(BATCH_FILES_DIR, f"{job_id}.jsonl")
+    with open(jsonl_path, "w", encoding="utf-8") as f:
+        for line in lines:
+            f.write(json.dumps(line, ensure_ascii=False) + "\n")
+
+    job = {
+        "id": job_id,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "jsonl_path": jsonl_path,
+        "count": len(lines),
+        "cache_keys": cache_keys,
+        "input_file_id": None,
+        "batch_id": None,
+        "status": "local",
+        "output_file_id": None,
+        "error_file_id": None,
+        "ingested": False,
+        "results": [],
+        "failed": [],
+    }
+    _save_job(job)
+    log.info("Batch-задание %s: подготовлено %d запросов в %s", job_id, len(lines), jsonl_path)
+    return job
+
+
+# ================== ШАГИ API ==================
+
+
+def _upload(client: httpx.Client, job: dict) -> None:
+    with open(job["jsonl_path"], "rb") as f:
+        resp = client.post(
+            f"{OPENAI_BASE_URL}/files",
+            headers=_auth_headers(),
+            data={"purpose": "batch"},
+            files={"file": (os.path.basename(job["jsonl_path"]), f, "application/jsonl")},
+        )
+    resp.raise_for_status()
+    job["input_file_id"] = resp.json()["id"]
+    job["status"] = "uploaded"
+    _save_job(job)
+    log.info("Batch-задание %s: файл загружен (%s)", job["id"], job["input_file_id"])
+
+
+def _create_batch(client: httpx.Client, job: dict) -> None:
+    resp = client.post(
+        f"{OPENAI_BASE_URL}/batches",
+        headers=_headers(),
+        json={
+            "input_file_id": job["input_file_id"],
+            "endpoint": BATCH_ENDPOINT,
+            "completion_window": BATCH_COMPLETION_WINDOW,
+            "metadata": {"job": job["id"]},
+        },
+    )
+    resp.raise_for_status()
+    data = resp.json()
+    job["batch_id"] = data["id"]
+    job["status"] = data.get("status") or "validating"
+    _save_job(job)
+    log.info("Batch-задание %s: создан batch %s", job["id"], job["batch_id"])
+
+
+def _refresh_status(client: httpx.Client, job: dict) -> None:
+    resp = client.get(f"{OPENAI_BASE_URL}/batches/{job['batch_id']}", headers=_headers())
+    resp.raise_for_status()
+    data = resp.json()
+    job["status"] = data.get("status") or job["status"]
+    job["output_file_id"] = data.get("output_file_id")
+    job["error_file_id"] = data.get("error_file_id")
+    _save_job(job)
+
+
+def _download_lines(client: httpx.Client, file_id: str) -> List[dict]:
+    resp = client.get(f"{OPENAI_BASE_URL}/files/{file_id}/content", headers=_auth_headers())
+    resp.raise_for_status()
+    lines = []
+    for raw in resp.text.splitlines():
+        raw = raw.strip()
+        if not raw:
+            continue
+        try:
+            lines.append(json.loads(raw))
+        except Exception as e:
+            log.warning("Битая строка в результатах batch: %s", e)
+    return lines
+
+
+def _record_usage(job: dict, body: dict) -> None:
+    usage = body.get("usage") or {}
+    model = body.get("model") or BATCH_MODEL
+    prompt_tokens = int(usage.get("prompt_tokens") or 0)
+    completion_tokens = int(usage.get("completion_tokens") or 0)
+    cached_tokens = int((usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0)
+    cost = cost_usd(model, prompt_tokens, completion_tokens, cached_tokens) * BATCH_PRICE_FACTOR
+    get_ledger().record(
+        model, prompt_tokens, completion_tokens, cached_tokens, cost, run_id=job["id"], source="batch"
+    )
+
+
+def _ingest(client: httpx.Client, job: dict) -> None:
+    """
+    Разбираем output-файл в GPTResult и кладём вердикты в общий кэш,
+    чтобы интерактивные запуски бота их уже не оплачивали.
+    """
+    results: List[dict] = []
+    answered = set()
+    cache = get_verdict_cache()
+
+    lines = _download_lines(client, job["output_file_id"]) if job.get("output_file_id") else []
+    # весь разбор — один «запуск» в учёте расходов
+    with track_run():
+        for line in lines:
+            code = str(line.get("custom_id") or "")
+            response = line.get("response") or {}
+            if response.get("status_code") != 200:
+                continue
+            try:
+                choice = response["body"]["choices"][0]
+                content = choice["message"]["content"]
+            except Exception:
+                continue
+            _record_usage(job, response["body"])
+            result = _result_from_content(code, content, choice.get("logprobs"))
+            if result is None:
+                continue
+            answered.add(code)
+            results.append(
+                {
+                    "code": result.code,
+                    "is_match": result.is_match,
+                    "reason": result.reason,
+                    "confidence": result.confidence,
+                }
+            )
+            key = job.get("cache_keys", {}).get(code)
+            if key:
+                cache.put(key, result.is_match, result.reason, result.confidence)
+
+    cache.flush()
+    job["results"] = results
+    job["failed"] = [code for code in job.get("cache_keys", {}) if code not in answered]
+    job["ingested"] = True
+    _save_job(job)
+    log.info(
+        "Batch-задание %s: получено %d вердиктов, без ответа %d",
+        job["id"],
+        len(results),
+        len(job["failed"]),
+    )
+
+
+def advance_job(job: dict, client: Optional[httpx.Client] = None) -> dict:
+    """
+    Делаем все шаги, которые можно сделать прямо сейчас, и возвращаем задание.
+    Идемпотентно: повторный вызов после рестарта продолжит с сохранённого шага.
+    """
+    if job.get("ingested"):
+        return job
+
+    own_client = client is None
+    client = client or httpx.Client(timeout=120)
+    try:
+        if not job.get("input_file_id"):
+            _upload(client, job)
+        if not job.get("batch_id"):
+            _create_batch(client, job)
+        if job.get("status") not in FINAL_STATUSES:
+            _refresh_status(client, job)
+        if job.get("status") in FINAL_STATUSES:
+            _ingest(client, job)
+    finally:
+        if own_client:
+            client.close()
+    return job
+
+
+def submit_batch(items: List[Tuple[Any, Any]]) -> dict:
+    job = create_job(items)
+    return advance_job(job)
+
+
+def wait_for_job(job_id: str, poll_interval: float = 60.0, timeout: Optional[float] = None) -> dict:
+    """
+    Опрашиваем задание, пока оно не завершится и не будет разобрано.
+    """
+    started = time.monotonic()
+    with httpx.Client(timeout=120) as client:
+        while True:
+            job = get_job(job_id)
+            if job is None:
+                raise KeyError(f"Нет batch-задания {job_id}")
+            job = advance_job(job, client=client)
+            if job.get("ingested"):
+                return job
+            if timeout is not None and time.monotonic() - started > timeout:
+                return job
+            log.info("Batch-задание %s: статус %s, жду %.0f с", job_id, job.get("status"), poll_interval)
+            time.sleep(poll_interval)
+
+
+def resume_pending_jobs() -> List[dict]:
+    """
+    Дотягиваем все незавершённые задания (например, после рестарта).
+    """
+    done = []
+    with httpx.Client(timeout=120) as client:
+        for job in list_jobs():
+            if job.get("ingested"):
+                continue
+            try:
+                done.append(advance_job(job, client=client))
+            except Exception as e:
+                log.error("Batch-задание %s: ошибка при продолжении: %s", job["id"], e)
+    return done
+
+
+def job_results(job: dict) -> List[GPTResult]:
+    return [
+        GPTResult(code=r["code"], is_match=r["is_match"], reason=r["reason"], confidence=r.get("confidence"))
+        for r in job.get("results", [])
+    ]
+
+
+if __name__ == "__main__":
+    # python gpt_batch_api.py submit [дни] [страниц] — собрать тендеры и отправить batch
+    # python gpt_batch_api.py resume                 — продвинуть все незавершённые задания
+    # python gpt_batch_api.py wait <job_id>          — дождаться и вывести результат
+    # python gpt_batch_api.py list                   — список заданий
+    import sys
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    cmd = sys.argv[1] if len(sys.argv) > 1 else "list"
+
+    if cmd == "submit":
+        from config_store import get_city, get_exclude_keywords, get_keywords
+        from rostender_filter_parser import fetch_rostender_tenders_filtered
+
+        days = int(sys.argv[2]) if len(sys.argv) > 2 else 7
+        pages = int(sys.argv[3]) if len(sys.argv) > 3 else 10
+        tenders = fetch_rostender_tenders_filtered(
+            days=days,
+            max_pages=pages,
+            include_words=get_keywords(),
+            exclude_words=get_exclude_keywords(),
+            city_filter=get_city(),
+        )
+        job = submit_batch([(t, None) for t in tenders])
+        print(job["id"], job["status"])
+    elif cmd == "resume":
+        for job in resume_pending_jobs():
+            print(job["id"], job["status"], "ingested" if job.get("ingested") else "")
+    elif cmd == "wait":
+        job = wait_for_job(sys.argv[2])
+        for r in job_results(job):
+            print(f"{r.code}\t{'+' if r.is_match else '-'}\t{r.reason}")
+    else:
+        for job in list_jobs():
+            print(job["id"], job["status"], job["count"], "ingested" if job.get("ingested") else "")
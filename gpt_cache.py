@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import time
+from threading import Lock
+from typing import Dict, Optional, Set
+
+from json_store import data_path, read_json, write_json_atomic
+
+log = logging.getLogger(__name__)
+
+GPT_CACHE_PATH = data_path("gpt_verdict_cache.json")
+GPT_CACHE_TTL_DAYS = float(os.getenv("GPT_CACHE_TTL_DAYS", "7") or 7)
+# страховка от разрастания файла: при переполнении выкидываем самые старые
+GPT_CACHE_MAX_ENTRIES = 20000
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256((text or "").encode("utf-8")).hexdigest()[:16]
+
+
+class VerdictCache:
+    """
+    Долговременный кэш вердиктов GPT.
+
+    Ключ: номер тендера + хэш оцениваемого текста + хэш системного промпта + модель.
+    Поменяли фильтр GPT через set_gpt_filter_text — поменялся хэш промпта,
+    и старые записи просто перестают находиться (а потом вытесняются по TTL).
+
+    В файл пишут и бот, и gpt_batch_api (отдельный процесс), поэтому flush()
+    перечитывает файл и вливает в него свои записи, а не перезаписывает целиком.
+    """
+
+    def __init__(self, path: str = GPT_CACHE_PATH, ttl_days: float = GPT_CACHE_TTL_DAYS) -> None:
+        self.path = path
+        self.ttl = ttl_days * 86400
+        self._lock = Lock()
+        self._entries: Dict[str, dict] = {}
+        self._loaded = False
+        self._dirty = False
+        # ключи, записанные после последнего flush()
+        self._new: Set[str] = set()
+
+    @staticmethod
+    def make_key(number: str, content_hash: str, prompt_hash: str, model: str) -> str:
+        return f"{number}|{content_hash}|{prompt_hash}|{model}"
+
+    def _ensure_loaded(self) -> None:
+        if self._loaded:
+            return
+        raw = read_json(self.path, {})
+        now = time.time()
+        self._entries = {
+            k: v for k, v in (raw.get("entries") or {}).items() if now - v.get("ts", 0) < self.ttl
+        }
+        self._dirty = len(self._entries) != len(raw.get("entries") or {})
+        self._loaded = True
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            self._ensure_loaded()
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.time() - entry.get("ts", 0) >= self.ttl:
+                del self._entries[key]
+                self._dirty = True
+                return None
+            return entry
+
+    def put(self, key: str, is_match: bool, reason: str, confidence: Optional[float] = None) -> None:
+        with self._lock:
+            self._ensure_loaded()
+            self._entries[key] = {
+                "is_match": bool(is_match),
+                "reason": reason,
+                "confidence": confidence,
+                "ts": time.time(),
+            }
+            self._new.add(key)
+            self._dirty = True
+
+    def flush(self) -> None:
+        with self._lock:
+            if not self._dirty:
+                return
+            now = time.time()
+            merged = {
+                k: v
+                for k, v in (read_json(self.path, {}).get("entries") or {}).items()
+                if now - v.get("ts", 0) < self.ttl
+            }
+            for key in self._new:
+                ours = self._entries.get(key)
+                if ours is not None and ours.get("ts", 0) >= merged.get(key, {}).get("ts", 0):
+                    merged[key] = ours
+            self._entries = merged
+            if len(self._entries) > GPT_CACHE_MAX_ENTRIES:
+                keep = sorted(self._entries.items(), key=lambda kv: kv[1].get("ts", 0))
+                self._entries = dict(keep[-GPT_CACHE_MAX_ENTRIES:])
+            try:
+                write_json_atomic(self.path, {"entries": self._entries})
+                self._dirty = False
+                self._new.clear()
+            except Exception as e:
+                log.warning("Не удалось сохранить кэш вердиктов GPT: %s", e)
+
+
+_cache: Optional[VerdictCache] = None
+_cache_lock = Lock()
+
+
+def get_verdict_cache() -> VerdictCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = VerdictCache()
+        return _cache
@@ -0,0 +1,237 @@
+from __future__ import annotations
+
+import logging
+import math
+import os
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, List, Optional, Tuple
+
+import run_profile
+from gpt_client import GPT_BATCH_SIZE, GPT_MAX_ANSWER_TOKENS, GPT_MODEL_TIERS
+from gpt_pricing import cost_usd
+from token_budget import GPT_RUN_TOKEN_BUDGET, GPT_TENDER_TOKEN_BUDGET
+from usage_ledger import GPT_DAILY_BUDGET_USD, get_ledger
+
+log = logging.getLogger(__name__)
+
+# Сколько кандидатов отдавать ИИ за запуск — по бюджету, а не константой.
+#
+# Кандидатов ранжируем: приоритет локального фильтра МЦЭ, близость окончания
+# приёма заявок, число профильных ключей. Дальше берём сверху столько, сколько
+# укладывается в бюджет запуска по времени (карточки + ИИ, оценка по последним
+# профилям запусков) и по деньгам (оценка по токенам и ценам модели).
+#
+#   GPT_RUN_TIME_BUDGET      — секунд на карточки и ИИ за запуск;
+#   GPT_RUN_COST_BUDGET_USD  — $ на запуск (дополнительно не больше остатка дневного лимита);
+#   GPT_MIN_CANDIDATES — пол, если упёрлись только в оценку времени (она бывает пессимистична);
+#                        деньги и лимиты расходов пол не перебивает;
+#   GPT_MAX_CANDIDATES — потолок при любых оценках. По умолчанию 12, как прежний
+#                        MAX_GPT_TENDERS: больше вызовов ИИ за запуск — только явно.
+#
+# plan_candidates читает профили запусков и журнал расходов с диска — из async-кода
+# звать через asyncio.to_thread.
+GPT_RUN_TIME_BUDGET = float(os.getenv("GPT_RUN_TIME_BUDGET", "90") or 90)
+GPT_RUN_COST_BUDGET_USD = float(os.getenv("GPT_RUN_COST_BUDGET_USD", "0.02") or 0.02)
+GPT_MIN_CANDIDATES = int(os.getenv("GPT_MIN_CANDIDATES", "5") or 5)
+GPT_MAX_CANDIDATES = int(os.getenv("GPT_MAX_CANDIDATES", "12") or 12)
+
+# пока истории запусков нет — секунд на тендер (карточка последовательно, ИИ параллельно)
+DEFAULT_DETAIL_SECONDS = 1.0
+DEFAULT_GPT_SECONDS = 0.5
+HISTORY_RUNS = 20
+
+# токенов сверх описания: номер и название тендера в запросе; префикс промпта — на запрос
+TENDER_OVERHEAD_TOKENS = 60
+PROMPT_PREFIX_TOKENS = 1200
+
+# срочность: заявки, которые закрываются в ближайшие URGENT_DAYS дней, — выше;
+# дальше и с неизвестным сроком — URGENCY_FLOOR
+URGENT_DAYS = 7
+URGENCY_FLOOR = 0.1
+
+# веса ранжирования; приоритет главный, срочность и ключи разводят равных
+W_PRIORITY = 1.0
+W_URGENCY = 0.6
+W_KEYWORDS = 0.4
+MAX_KEYWORDS_SCORE = 5
+
+# priority_level из mce_filter: 1 — основные направления, 2 — смежные, 0 — без ключей
+_PRIORITY_RANK = {1: 1.0, 2: 0.66, 0: 0.33}
+
+LIMIT_ALL = "all"          # в бюджет влезли все
+LIMIT_TIME = "time"
+LIMIT_COST = "cost"
+LIMIT_MAX = "max"          # упёрлись в GPT_MAX_CANDIDATES
+
+LIMIT_TITLES = {
+    LIMIT_ALL: "все кандидаты",
+    LIMIT_TIME: "по времени",
+    LIMIT_COST: "по деньгам",
+    LIMIT_MAX: "потолок GPT_MAX_CANDIDATES",
+}
+
+Item = Tuple[Any, Any]   # (тендер, результат локального фильтра или None)
+
+
+@dataclass
+class Candidate:
+    tender: Any
+    local: Any
+    score: float
+    closed: bool = False
+
+
+@dataclass
+class CandidatePlan:
+    selected: List[Item] = field(default_factory=list)
+    left_out: List[Candidate] = field(default_factory=list)
+    closed: List[Candidate] = field(default_factory=list)
+    limit: int = 0
+    limited_by: str = LIMIT_ALL
+    est_seconds: float = 0.0
+    est_cost: float = 0.0
+    time_budget: float = 0.0
+    cost_budget: float = 0.0
+
+    def summary(self) -> str:
+        cost = f"~${self.est_cost:.4f}" + (f" из ${self.cost_budget:.4f}" if math.isfinite(self.cost_budget) else "")
+        text = (
+            f"ИИ получил {len(self.selected)} из {len(self.selected) + len(self.left_out) + len(self.closed)} "
+            f"кандидатов (ограничение: {LIMIT_TITLES[self.limited_by]}; "
+            f"оценка ~{self.est_seconds:.0f} с из {self.time_budget:.0f}, {cost})"
+        )
+        if self.closed:
+            text += f", приём заявок уже закончился у {len(self.closed)}"
+        return text
+
+
+def _urgency(end_dt: Optional[datetime], now: datetime) -> Tuple[float, bool]:
+    """
+    0..1: чем ближе окончание приёма заявок, тем выше (монотонно: в окне
+    URGENT_DAYS от 1 до URGENCY_FLOOR, дальше — URGENCY_FLOOR); срок неизвестен —
+    тоже URGENCY_FLOOR, срочным такой тендер не считаем.
+    Второе значение — приём уже закончился.
+    """
+    if end_dt is None:
+        return URGENCY_FLOOR, False
+    try:
+        days_left = (end_dt - now).total_seconds() / 86400
+    except TypeError:
+        # дата с часовым поясом против наивной — сравниваем без пояса
+        days_left = (end_dt.replace(tzinfo=None) - now).total_seconds() / 86400
+    if days_left < 0:
+        return 0.0, True
+    if days_left >= URGENT_DAYS:
+        return URGENCY_FLOOR, False
+    return URGENCY_FLOOR + (1.0 - URGENCY_FLOOR) * (1.0 - days_left / URGENT_DAYS), False
+
+
+def score_candidate(tender: Any, local: Any, now: Optional[datetime] = None) -> Candidate:
+    urgency, closed = _urgency(getattr(tender, "end_datetime", None), now or datetime.now())
+    priority = _PRIORITY_RANK.get(getattr(local, "priority_level", None), 0.0)
+    keywords = min(len(getattr(local, "matched_keywords", None) or []), MAX_KEYWORDS_SCORE) / MAX_KEYWORDS_SCORE
+    score = W_PRIORITY * priority + W_URGENCY * urgency + W_KEYWORDS * keywords
+    return Candidate(tender=tender, local=local, score=score, closed=closed)
+
+
+def rank_candidates(items: List[Item], now: Optional[datetime] = None) -> List[Candidate]:
+    candidates = [score_candidate(t, local, now) for t, local in items]
+    # при равном счёте — свежее опубликованные
+    candidates.sort(
+        key=lambda c: (c.score, getattr(c.tender, "published", None) or datetime.min.date(), str(c.tender.number)),
+        reverse=True,
+    )
+    return candidates
+
+
+def seconds_per_tender() -> float:
+    """
+    Карточка (грузится последовательно) + доля ИИ на тендер — по последним профилям запусков.
+    """
+    profiles = run_profile.recent_profiles(HISTORY_RUNS)
+    detail_s = sum(p.get("stages", {}).get("details", 0.0) for p in profiles)
+    detail_n = sum(p.get("counters", {}).get("detail_requests", 0) for p in profiles)
+    gpt_s = sum(p.get("stages", {}).get("gpt", 0.0) for p in profiles)
+    gpt_n = sum(p.get("counters", {}).get("gpt_tenders", 0) for p in profiles)
+    per_detail = detail_s / detail_n if detail_n else DEFAULT_DETAIL_SECONDS
+    per_gpt = gpt_s / gpt_n if gpt_n else DEFAULT_GPT_SECONDS
+    return per_detail + per_gpt
+
+
+def estimate_cost(n: int, model: Optional[str] = None) -> float:
+    """
+    Оценка сверху: описания режутся по бюджетам token_budget, префикс промпта
+    (кроме первого запроса) — из кэша, ответ — по потолку GPT_MAX_ANSWER_TOKENS.
+    """
+    if n <= 0:
+        return 0.0
+    model = model or GPT_MODEL_TIERS[0]
+    descriptions = n * GPT_TENDER_TOKEN_BUDGET
+    if GPT_RUN_TOKEN_BUDGET:
+        descriptions = min(descriptions, GPT_RUN_TOKEN_BUDGET)
+    requests = math.ceil(n / max(GPT_BATCH_SIZE, 1))
+    prompt = descriptions + n * TENDER_OVERHEAD_TOKENS + requests * PROMPT_PREFIX_TOKENS
+    cached = (requests - 1) * PROMPT_PREFIX_TOKENS
+    return cost_usd(model, prompt, n * GPT_MAX_ANSWER_TOKENS, cached)
+
+
+def _cost_budget() -> float:
+    budget = GPT_RUN_COST_BUDGET_USD
+    if GPT_DAILY_BUDGET_USD > 0:
+        budget = min(budget, max(GPT_DAILY_BUDGET_USD - get_ledger().spent_today(), 0.0))
+    return budget
+
+
+def plan_candidates(
+    items: List[Item],
+    time_budget: float = GPT_RUN_TIME_BUDGET,
+    cost_budget: Optional[float] = None,
+    now: Optional[datetime] = None,
+) -> CandidatePlan:
+    """
+    Кого из кандидатов отдать ИИ в этом запуске; остальные — в plan.left_out
+    (их показываем отдельным разделом), закрытые по сроку — в plan.closed.
+    """
+    cost_budget = _cost_budget() if cost_budget is None else cost_budget
+    ranked = rank_candidates(items, now)
+    open_ = [c for c in ranked if not c.closed]
+    plan = CandidatePlan(
+        closed=[c for c in ranked if c.closed],
+        time_budget=time_budget,
+        cost_budget=cost_budget,
+    )
+    if not open_:
+        return plan
+
+    per_tender = seconds_per_tender()
+    by_time = int(time_budget // per_tender) if per_tender > 0 else len(open_)
+    by_cost = 0
+    while by_cost < len(open_) and estimate_cost(by_cost + 1) <= cost_budget:
+        by_cost += 1
+
+    limit, plan.limited_by = len(open_), LIMIT_ALL
+    for value, reason in ((GPT_MAX_CANDIDATES, LIMIT_MAX), (by_time, LIMIT_TIME), (by_cost, LIMIT_COST)):
+        if value < limit:
+            limit, plan.limited_by = value, reason
+    # оценка времени бывает пессимистична: из-за неё одной без ИИ запуск не оставляем;
+    # бюджет денег и потолок GPT_MAX_CANDIDATES пол не перебивает
+    if plan.limited_by == LIMIT_TIME:
+        limit = min(max(limit, GPT_MIN_CANDIDATES), by_cost, GPT_MAX_CANDIDATES)
+    limit = min(limit, len(open_))
+
+    plan.limit = limit
+    plan.selected = [(c.tender, c.local) for c in open_[:limit]]
+    plan.left_out = open_[limit:]
+    plan.est_seconds = per_tender * limit
+    plan.est_cost = estimate_cost(limit)
+    log.info(
+        "Бюджет ИИ: %d из %d кандидатов (ограничение %s; ~%.1f с/тендер, ~$%.4f), закрыто по сроку %d",
+        limit,
+        len(ranked),
+        plan.limited_by,
+        per_tender,
+        plan.est_cost,
+        len(plan.closed),
+    )
+    return plan
@@ -1,17 +1,31 @@
 from __future__ import annotations
 
+import asyncio
+import hashlib
 import json
 import logging
+import math
 import os
-from dataclasses import dataclass
-from typing import Any, List, Tuple
+import time
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, List, Tuple
 
 import httpx
-from dotenv import load_dotenv   # <<< добавили
 
-from config_store import get_gpt_filter_text
-
-load_dotenv()   # <<< добавили
+import env_loader  # noqa: F401  (.env — до остальных модулей проекта)
+from config_store import get_gpt_filter_text, get_gpt_rubric_text
+from gpt_cache import get_verdict_cache, text_hash
+from gpt_pricing import cache_savings_usd, cost_usd
+from metrics import CACHE_LOOKUPS, GPT_LATENCY, GPT_REQUESTS, GPT_TOKENS
+from gpt_ratelimit import (
+    RETRY_STATUSES,
+    THROTTLE_STATUSES,
+    AdaptiveLimiter,
+    backoff_delay,
+    retry_after_seconds,
+)
+from token_budget import GPT_TENDER_TOKEN_BUDGET, count_tokens, plan_budgets, select_passages
+from usage_ledger import get_ledger
 
 log = logging.getLogger(__name__)
 
@@ -19,15 +33,187 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "").strip()
 if not OPENAI_API_KEY:
     log.warning("OPENAI_API_KEY не задан — GPT-функции работать не будут.")
 
-OPENAI_URL = "https://api.openai.com/v1/chat/completions"
+# базовый адрес можно подменить (прокси или локальная заглушка mock_openai.py)
+OPENAI_BASE_URL = (os.getenv("OPENAI_BASE_URL", "").strip() or "https://api.openai.com/v1").rstrip("/")
+OPENAI_URL = f"{OPENAI_BASE_URL}/chat/completions"
 OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini").strip()  # можно поменять
 
+# Каскад моделей: дешёвая смотрит всех, сомнительные ответы уходят следующей.
+#   GPT_MODEL_TIERS="gpt-4o-mini,gpt-4o"   (по умолчанию — один OPENAI_MODEL, без каскада)
+#   GPT_TIER_CONCURRENCY="8,3"              стартовое окно параллельности по уровням
+GPT_MODEL_TIERS = [
+    m.strip() for m in os.getenv("GPT_MODEL_TIERS", "").split(",") if m.strip()
+] or [OPENAI_MODEL]
+GPT_TIER_CONCURRENCY = [
+    int(v) for v in os.getenv("GPT_TIER_CONCURRENCY", "").split(",") if v.strip().isdigit()
+]
+# эскалируем, если уверенность вердикта ниже порога (или logprobs нет вовсе)
+GPT_ESCALATE_CONFIDENCE = float(os.getenv("GPT_ESCALATE_CONFIDENCE", "0.85") or 0.85)
+# 1 — любое «подходит» дешёвой модели перепроверяет следующая
+GPT_ESCALATE_MATCHES = os.getenv("GPT_ESCALATE_MATCHES", "0").strip() in ("1", "true", "yes")
+
+# сколько запросов к GPT держим в полёте: стартовое окно и потолок для AIMD
+GPT_CONCURRENCY = int(os.getenv("GPT_CONCURRENCY", "6") or 6)
+GPT_MAX_CONCURRENCY = int(os.getenv("GPT_MAX_CONCURRENCY", "16") or 16)
+GPT_TIMEOUT = 40
+# повторы временных ошибок и общий дедлайн GPT-этапа одного запуска, сек
+GPT_MAX_RETRIES = int(os.getenv("GPT_MAX_RETRIES", "4") or 4)
+GPT_RUN_DEADLINE = float(os.getenv("GPT_RUN_DEADLINE", "180") or 180)
+# сколько тендеров пакуем в один запрос (1 — по одному, как раньше)
+GPT_BATCH_SIZE = int(os.getenv("GPT_BATCH_SIZE", "5") or 5)
+# токенов описаний на один пакет: длинные тендеры уходят пакетами поменьше
+GPT_BATCH_MAX_TOKENS = int(os.getenv("GPT_BATCH_MAX_TOKENS", "6000") or 6000)
+# structured outputs (json_schema) + logprobs; 0 — для моделей/прокси без их поддержки
+GPT_STRUCTURED = os.getenv("GPT_STRUCTURED", "1").strip() not in ("0", "false", "no")
+# потолок длины ответа на один тендер: вердикт + короткая причина
+GPT_MAX_ANSWER_TOKENS = int(os.getenv("GPT_MAX_ANSWER_TOKENS", "120") or 120)
+GPT_REASON_MAX_WORDS = 20
+
+# схема ответа по одному тендеру; is_match первым — его logprob и есть уверенность
+_VERDICT_PROPERTIES = {
+    "is_match": {"type": "boolean"},
+    "reason": {"type": "string", "description": f"кратко, не длиннее {GPT_REASON_MAX_WORDS} слов"},
+}
+VERDICT_SCHEMA = {
+    "type": "object",
+    "properties": _VERDICT_PROPERTIES,
+    "required": ["is_match", "reason"],
+    "additionalProperties": False,
+}
+# у structured outputs корень — всегда объект, поэтому массив заворачиваем в results
+BATCH_VERDICT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "results": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"code": {"type": "string"}, **_VERDICT_PROPERTIES},
+                "required": ["code", "is_match", "reason"],
+                "additionalProperties": False,
+            },
+        }
+    },
+    "required": ["results"],
+    "additionalProperties": False,
+}
+
 
 @dataclass
 class GPTResult:
     code: str
     is_match: bool
     reason: str
+    # вероятность именно этого вердикта по logprobs (None — модель их не вернула)
+    confidence: float | None = None
+    # какая модель каскада вынесла вердикт (None — из кэша/batch)
+    model: str | None = None
+
+
+@dataclass
+class TierStats:
+    """
+    Счётчики одного уровня каскада моделей.
+    """
+    model: str
+    tenders: int = 0
+    requests: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_tokens: int = 0        # из них взято из кэша префикса у провайдера
+    latency: float = 0.0          # сумма времени ответов, сек
+    escalated: int = 0            # отдано следующему уровню
+    cost: float = 0.0             # $
+    cache_savings: float = 0.0    # $ сэкономлено кэшем префикса
+
+    @property
+    def avg_latency(self) -> float:
+        return self.latency / self.requests if self.requests else 0.0
+
+
+@dataclass
+class GPTRunStats:
+    """
+    Счётчики одного прогона через GPT (для статистики запуска и сравнения режимов).
+    """
+    mode: str = "single"
+    tenders: int = 0
+    requests: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    batch_retries: int = 0
+    retries: int = 0              # повторы после временных ошибок
+    throttled: int = 0            # ответов 429/503
+    cache_hits: int = 0
+    cache_misses: int = 0
+    description_tokens: int = 0   # токенов в полных описаниях
+    tokens_saved: int = 0         # сколько из них не отправили благодаря бюджету
+    cached_tokens: int = 0        # prompt-токенов из кэша префикса у провайдера
+    # время ответов с попаданием в кэш префикса и без (для оценки выигрыша)
+    prefix_hit_requests: int = 0
+    prefix_hit_latency: float = 0.0
+    prefix_miss_requests: int = 0
+    prefix_miss_latency: float = 0.0
+    elapsed: float = 0.0
+    dropped: List[str] = field(default_factory=list)   # не получили вердикт из-за ошибок
+    tiers: Dict[str, TierStats] = field(default_factory=dict)
+
+    def tier(self, model: str) -> TierStats:
+        if model not in self.tiers:
+            self.tiers[model] = TierStats(model=model)
+        return self.tiers[model]
+
+    @property
+    def cost(self) -> float:
+        return sum(t.cost for t in self.tiers.values())
+
+    @property
+    def cache_savings(self) -> float:
+        return sum(t.cache_savings for t in self.tiers.values())
+
+    @property
+    def prefix_hit_rate(self) -> float:
+        """
+        Доля prompt-токенов, которые провайдер взял из кэша префикса.
+        """
+        return self.cached_tokens / self.prompt_tokens if self.prompt_tokens else 0.0
+
+    @property
+    def prefix_latency_gain(self) -> float | None:
+        """
+        Насколько в среднем быстрее ответы с попаданием в кэш префикса, сек.
+        """
+        if not self.prefix_hit_requests or not self.prefix_miss_requests:
+            return None
+        return (
+            self.prefix_miss_latency / self.prefix_miss_requests
+            - self.prefix_hit_latency / self.prefix_hit_requests
+        )
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    @property
+    def cache_hit_rate(self) -> float:
+        total = self.cache_hits + self.cache_misses
+        return self.cache_hits / total if total else 0.0
+
+
+def cascade_id(models: List[str] | None = None) -> str:
+    """
+    Чем оцениваем: одна модель или цепочка «дешёвая>сильная» (для ключей кэша).
+    """
+    return ">".join(models or GPT_MODEL_TIERS)
+
+
+def verdict_fingerprint() -> str:
+    """
+    Отпечаток «условий оценки»: системный промпт + модель (каскад моделей).
+    Если его поменяли — старые вердикты больше не считаем действительными.
+    """
+    raw = f"{cascade_id()}\n{_system_prefix(get_gpt_filter_text())}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
 
 
 def _parse_gpt_json(raw: str, tender_code: str) -> dict | None:
@@ -59,75 +245,775 @@ def _parse_gpt_json(raw: str, tender_code: str) -> dict | None:
         return None
 
 
-def ask_gpt_about_tenders(
-    items: List[Tuple[Any, Any]],
-) -> List[GPTResult]:
+def _tender_detail(tender: Any) -> str:
+    return getattr(tender, "detail_text", "") or getattr(tender, "raw_block", "") or ""
+
+
+def tender_content_hash(tender: Any) -> str:
     """
-    items: список (Tender, local_analysis), но мы не тащим типы из mce_filter/rostender_parser для простоты.
-    Для каждого тендера спрашиваем GPT: наш / не наш + причина.
+    Хэш того, что оцениваем: название + полное описание (до выборки фрагментов).
     """
+    return text_hash(f"{getattr(tender, 'title', '')}\n{_tender_detail(tender)}")
 
-    if not OPENAI_API_KEY:
-        log.error("OPENAI_API_KEY не задан, возвращаю пустой список из GPT.")
-        return []
 
-    system_prompt = get_gpt_filter_text()
-    results: List[GPTResult] = []
+def _tender_block(tender: Any, excerpt: str | None = None, model: str = OPENAI_MODEL) -> str:
+    code = getattr(tender, "number", "unknown")
+    title = getattr(tender, "title", "")
+
+    # вместо слепой обрезки — самые информативные фрагменты в пределах бюджета токенов
+    if excerpt is None:
+        excerpt = select_passages(_tender_detail(tender), GPT_TENDER_TOKEN_BUDGET, model).text
+
+    return (
+        f"Номер: {code}\n"
+        f"Название: {title}\n"
+        f"Описание:\n{excerpt}\n"
+    )
+
+
+# ================== ПРОМПТЫ ==================
+#
+# Провайдер кэширует общий префикс запросов (от 1024 токенов, шагами по 128),
+# поэтому всё неизменное — фильтр и профиль с примерами из config.json, правила
+# и формат ответа — лежит в system одним и тем же текстом для одиночных и пакетных
+# запросов, а тендеры идут последним сообщением. Что подходит компании, решает
+# только config.json (правится из бота); в коде — правила без привязки к профилю. Всё, что зависит от запроса
+# (номера, число тендеров), — только в конце user.
 
-    headers = {
-        "Authorization": f"Bearer {OPENAI_API_KEY}",
-        "Content-Type": "application/json",
+GPT_RULES = (
+    "ПРАВИЛА ОЦЕНКИ\n"
+    "1. Главное — текст фильтра в начале. Профиль и примеры ниже его уточняют; "
+    "если они расходятся с фильтром, следуй фильтру.\n"
+    "2. Смотри на предмет закупки (название и спецификацию), а не на случайные слова "
+    "из шаблона документации.\n"
+    "3. Если описание урезано (строки с «…»), суди по тому, что есть; "
+    "не выдумывай характеристики.\n"
+    "4. Сомневаешься — is_match=false и причина с тем, чего не хватает.\n"
+    "5. Причина — по-русски, по делу, не длиннее "
+    f"{GPT_REASON_MAX_WORDS} слов, без повторения названия тендера.\n"
+    "\n"
+    "ФОРМАТ ОТВЕТА\n"
+    "Только JSON, без комментариев и обёрток ```json.\n"
+    "Один тендер в сообщении — объект:\n"
+    '{"is_match": true/false, "reason": "краткое объяснение"}\n'
+    "Несколько тендеров — JSON-массив, по объекту на каждый тендер, с его номером:\n"
+    '[{"code": "номер", "is_match": true/false, "reason": "краткое объяснение"}]\n'
+)
+
+
+def _system_prefix(system_prompt: str, rubric: str | None = None) -> str:
+    """
+    Неизменная часть каждого запроса: фильтр и профиль с примерами из config.json + правила.
+    """
+    rubric = (get_gpt_rubric_text() if rubric is None else rubric).strip()
+    parts = [system_prompt.strip(), rubric, GPT_RULES]
+    return "\n\n".join(p for p in parts if p)
+
+
+def _build_user_prompt(tender: Any, excerpt: str | None = None, model: str = OPENAI_MODEL) -> str:
+    return (
+        f"{_tender_block(tender, excerpt, model)}\n"
+        "Оцени этот тендер и ответь JSON-объектом.\n"
+    )
+
+
+def _build_batch_prompt(
+    tenders: List[Any],
+    excerpts: Dict[str, str] | None = None,
+    model: str = OPENAI_MODEL,
+) -> str:
+    excerpts = excerpts or {}
+    codes = ", ".join(str(getattr(t, "number", "unknown")) for t in tenders)
+    blocks = "\n".join(
+        f"### Тендер {getattr(t, 'number', 'unknown')}\n"
+        f"{_tender_block(t, excerpts.get(str(getattr(t, 'number', 'unknown'))), model)}"
+        for t in tenders
+    )
+    return (
+        f"{blocks}\n"
+        f"Оцени КАЖДЫЙ из {len(tenders)} тендеров и ответь JSON-массивом "
+        f"по одному объекту на тендер (номера: {codes}).\n"
+    )
+
+
+def _plan_excerpts(
+    tenders: List[Any],
+    stats: GPTRunStats | None = None,
+    model: str = OPENAI_MODEL,
+) -> Dict[str, str]:
+    """
+    Делим бюджет токенов запуска между тендерами и выбираем фрагменты описаний.
+    """
+    details = {str(getattr(t, "number", "unknown")): _tender_detail(t) for t in tenders}
+    sizes = {code: count_tokens(text, model) for code, text in details.items()}
+    budgets = plan_budgets(sizes)
+
+    excerpts: Dict[str, str] = {}
+    for code, text in details.items():
+        excerpt = select_passages(text, budgets[code], model)
+        excerpts[code] = excerpt.text
+        if stats is not None:
+            stats.description_tokens += excerpt.original_tokens
+            stats.tokens_saved += excerpt.saved_tokens
+    return excerpts
+
+
+def _build_payload(
+    system_prompt: str,
+    user_prompt: str,
+    batch_size: int | None = None,
+    model: str | None = None,
+) -> dict:
+    """
+    batch_size=None — промпт по одному тендеру, иначе пакет из batch_size тендеров
+    (от этого зависят схема ответа и потолок max_tokens).
+    """
+    payload = {
+        "model": model or OPENAI_MODEL,
+        "messages": [
+            {"role": "system", "content": _system_prefix(system_prompt)},
+            {"role": "user", "content": user_prompt},
+        ],
+        "temperature": 0.1,
     }
+    if not GPT_STRUCTURED:
+        return payload
+
+    schema = VERDICT_SCHEMA if batch_size is None else BATCH_VERDICT_SCHEMA
+    payload["response_format"] = {
+        "type": "json_schema",
+        "json_schema": {
+            "name": "tender_verdict" if batch_size is None else "tender_verdicts",
+            "strict": True,
+            "schema": schema,
+        },
+    }
+    # в пакете на каждый тендер ещё уходит номер и обвязка массива
+    payload["max_tokens"] = GPT_MAX_ANSWER_TOKENS * (batch_size or 1) + (16 if batch_size else 0)
+    # уверенность берём из logprob токена true/false
+    payload["logprobs"] = True
+    payload["top_logprobs"] = 3
+    # подсказка маршрутизации: запросы с одним префиксом — на один кэш
+    payload["prompt_cache_key"] = f"tenderbot-{text_hash(payload['messages'][0]['content'])}"
+    return payload
+
+
+def _headers() -> dict:
+    headers = {"Content-Type": "application/json"}
+    # без ключа (локальная заглушка) пустой «Bearer » httpx отправить не даст
+    if OPENAI_API_KEY:
+        headers["Authorization"] = f"Bearer {OPENAI_API_KEY}"
+    return headers
+
+
+def verdict_confidences(logprobs: dict | None) -> List[float]:
+    """
+    Уверенность по каждому значению is_match в ответе, в порядке появления.
+
+    Со structured outputs булево поле — отдельный токен true/false; его
+    вероятность нормируем на P(true) + P(false) из top_logprobs.
+    Для пакета получаем по числу на тендер (is_match в схеме идёт после code,
+    но других булевых полей нет, так что порядок совпадает с results).
+    """
+    confidences: List[float] = []
+    for entry in (logprobs or {}).get("content") or []:
+        token = str(entry.get("token") or "").strip()
+        if token not in ("true", "false"):
+            continue
+        probs = {token: math.exp(float(entry.get("logprob") or 0.0))}
+        for alt in entry.get("top_logprobs") or []:
+            alt_token = str(alt.get("token") or "").strip()
+            if alt_token in ("true", "false") and alt_token not in probs:
+                probs[alt_token] = math.exp(float(alt.get("logprob") or 0.0))
+        total = sum(probs.values())
+        confidences.append(round(probs[token] / total, 3) if total else 0.0)
+    return confidences
+
+
+def _result_from_content(code: str, content: str, logprobs: dict | None = None) -> GPTResult | None:
+    parsed = _parse_gpt_json(content, code)
+    if not parsed or "is_match" not in parsed:
+        # если что-то не так — просто пропускаем
+        return None
+
+    is_match = bool(parsed.get("is_match"))
+    reason = str(parsed.get("reason") or "").strip() or "Причина не указана GPT."
+    confidences = verdict_confidences(logprobs)
+    confidence = confidences[0] if confidences else None
+    return GPTResult(code=code, is_match=is_match, reason=reason, confidence=confidence)
+
+
+# ================== ASYNC-КЛИЕНТ ==================
+
+_async_client: httpx.AsyncClient | None = None
+_async_client_loop: asyncio.AbstractEventLoop | None = None
+
+
+def _new_async_client(concurrency: int) -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        timeout=GPT_TIMEOUT,
+        limits=httpx.Limits(
+            max_connections=concurrency,
+            max_keepalive_connections=concurrency,
+            keepalive_expiry=60,
+        ),
+    )
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """
+    Долгоживущий AsyncClient с keep-alive: TLS-рукопожатие к OpenAI
+    делаем один раз, а не на каждый запуск проверки.
+    Клиент привязан к event loop, поэтому в чужом loop создаём новый.
+    """
+    global _async_client, _async_client_loop
+    loop = asyncio.get_running_loop()
+    if _async_client is None or _async_client.is_closed or _async_client_loop is not loop:
+        _async_client = _new_async_client(max(GPT_MAX_CONCURRENCY, 1))
+        _async_client_loop = loop
+    return _async_client
+
+
+_rate_limiters: Dict[str, AdaptiveLimiter] = {}
+_rate_limiter_loop: asyncio.AbstractEventLoop | None = None
+
+
+def _tier_concurrency(model: str) -> int:
+    try:
+        level = GPT_MODEL_TIERS.index(model)
+    except ValueError:
+        return GPT_CONCURRENCY
+    if level < len(GPT_TIER_CONCURRENCY):
+        return GPT_TIER_CONCURRENCY[level]
+    return GPT_CONCURRENCY
 
-    with httpx.Client(timeout=40) as client:
-        for tender, local in items:
-            code = getattr(tender, "number", "unknown")
-            title = getattr(tender, "title", "")
-            detail = getattr(tender, "detail_text", "") or getattr(tender, "raw_block", "")
 
-            # режем описание, чтобы не жрать токены
-            if len(detail) > 2000:
-                detail_cut = detail[:2000] + "... (обрезано)"
+def get_rate_limiter(model: str | None = None) -> AdaptiveLimiter:
+    """
+    Один регулятор на модель в процессе (в пределах event loop): лимиты OpenAI
+    общие для всех чатов и считаются по моделям, поэтому и окна — по моделям.
+    """
+    global _rate_limiter_loop
+    model = model or OPENAI_MODEL
+    loop = asyncio.get_running_loop()
+    if _rate_limiter_loop is not loop:
+        _rate_limiters.clear()
+        _rate_limiter_loop = loop
+    if model not in _rate_limiters:
+        _rate_limiters[model] = AdaptiveLimiter(_tier_concurrency(model), GPT_MAX_CONCURRENCY)
+    return _rate_limiters[model]
+
+
+async def close_async_client() -> None:
+    global _async_client, _async_client_loop
+    if _async_client is not None and not _async_client.is_closed:
+        await _async_client.aclose()
+    _async_client = None
+    _async_client_loop = None
+
+
+def _batches(
+    tenders: List[Any],
+    batch_size: int,
+    max_tokens: int,
+    excerpts: Dict[str, str] | None = None,
+    model: str = OPENAI_MODEL,
+) -> List[List[Any]]:
+    """
+    Пакуем тендеры подряд, пока не упрёмся в batch_size или в бюджет токенов
+    на пакет — длинный тендер уедет в пакет поменьше или вообще один.
+    """
+    batches: List[List[Any]] = []
+    current: List[Any] = []
+    current_tokens = 0
+    for tender in tenders:
+        excerpt = (excerpts or {}).get(str(getattr(tender, "number", "unknown")))
+        tokens = count_tokens(_tender_block(tender, excerpt, model), model)
+        if current and (len(current) >= batch_size or current_tokens + tokens > max_tokens):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(tender)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+@dataclass
+class _Run:
+    """
+    Всё, что нужно запросам одного уровня каскада: клиент, модель, регулятор,
+    дедлайн (общий на весь прогон), счётчики.
+    """
+    client: httpx.AsyncClient
+    system_prompt: str
+    limiter: AdaptiveLimiter
+    deadline: float
+    model: str = OPENAI_MODEL
+    url: str = OPENAI_URL
+    stats: GPTRunStats | None = None
+    excerpts: Dict[str, str] = field(default_factory=dict)
+    dropped: List[str] = field(default_factory=list)
+
+
+async def _post_chat(run: _Run, payload: dict) -> Tuple[str, dict | None]:
+    """
+    POST в chat/completions с повторами временных ошибок (429, 5xx, таймауты)
+    по экспоненте с джиттером — но не дольше дедлайна прогона.
+    Постоянные ошибки (400, 401, ...) не повторяем.
+    Исчерпан лимит расходов — BudgetExceeded, запрос не отправляем.
+    Возвращает (текст ответа, logprobs или None).
+    """
+    stats = run.stats
+    # в учёт расходов пишем только настоящий API, не прогоны против заглушки
+    ledger = get_ledger() if run.url == OPENAI_URL else None
+    attempt = 0
+    while True:
+        retry_after: float | None = None
+        if ledger is not None:
+            # файл учёта мог переписать другой процесс — тогда check_budget его перечитает
+            await asyncio.to_thread(ledger.check_budget)
+        async with run.limiter.slot():
+            started = time.monotonic()
+            try:
+                resp = await run.client.post(run.url, headers=_headers(), json=payload)
+            except (httpx.TimeoutException, httpx.TransportError) as e:
+                GPT_REQUESTS.inc(run.model, "error")
+                error: Exception = e
             else:
-                detail_cut = detail
-
-            user_prompt = (
-                "Оцени, подходит ли этот тендер под профиль компании МЦЭ Инжиниринг.\n\n"
-                f"Номер: {code}\n"
-                f"Название: {title}\n"
-                f"Описание:\n{detail_cut}\n\n"
-                "Ответь строго в формате JSON БЕЗ каких-либо комментариев и обёрток, "
-                "строго так:\n"
-                '{\n  "is_match": true/false,\n  "reason": "краткое объяснение на русском"\n}\n'
+                latency = time.monotonic() - started
+                GPT_LATENCY.observe(run.model, value=latency)
+                if resp.status_code in THROTTLE_STATUSES:
+                    GPT_REQUESTS.inc(run.model, "throttled")
+                else:
+                    GPT_REQUESTS.inc(run.model, "ok" if resp.is_success else "error")
+                if stats is not None:
+                    stats.requests += 1
+                    tier = stats.tier(run.model)
+                    tier.requests += 1
+                    tier.latency += latency
+                if resp.status_code in RETRY_STATUSES:
+                    retry_after = retry_after_seconds(resp.headers)
+                    if resp.status_code in THROTTLE_STATUSES:
+                        run.limiter.on_throttle(retry_after)
+                        if stats is not None:
+                            stats.throttled += 1
+                    error = httpx.HTTPStatusError(
+                        f"HTTP {resp.status_code}", request=resp.request, response=resp
+                    )
+                else:
+                    resp.raise_for_status()
+                    run.limiter.on_success(resp.headers)
+                    data = resp.json()
+                    usage = data.get("usage") or {}
+                    prompt_tokens = int(usage.get("prompt_tokens") or 0)
+                    completion_tokens = int(usage.get("completion_tokens") or 0)
+                    details = usage.get("prompt_tokens_details") or {}
+                    cached_tokens = int(details.get("cached_tokens") or 0)
+                    cost = cost_usd(run.model, prompt_tokens, completion_tokens, cached_tokens)
+                    GPT_TOKENS.inc(run.model, "prompt", value=prompt_tokens)
+                    GPT_TOKENS.inc(run.model, "completion", value=completion_tokens)
+                    GPT_TOKENS.inc(run.model, "cached", value=cached_tokens)
+                    if ledger is not None:
+                        ledger.record(run.model, prompt_tokens, completion_tokens, cached_tokens, cost)
+                    if stats is not None:
+                        stats.prompt_tokens += prompt_tokens
+                        stats.completion_tokens += completion_tokens
+                        stats.cached_tokens += cached_tokens
+                        if cached_tokens:
+                            stats.prefix_hit_requests += 1
+                            stats.prefix_hit_latency += latency
+                        else:
+                            stats.prefix_miss_requests += 1
+                            stats.prefix_miss_latency += latency
+                        tier.prompt_tokens += prompt_tokens
+                        tier.completion_tokens += completion_tokens
+                        tier.cached_tokens += cached_tokens
+                        tier.cost += cost
+                        tier.cache_savings += cache_savings_usd(run.model, cached_tokens)
+                    choice = data["choices"][0]
+                    message = choice["message"]
+                    if message.get("refusal"):
+                        log.warning("GPT отказался отвечать: %s", message["refusal"])
+                    if choice.get("finish_reason") == "length":
+                        log.warning("Ответ GPT упёрся в max_tokens=%s", payload.get("max_tokens"))
+                    return message.get("content") or "", choice.get("logprobs")
+
+        delay = backoff_delay(attempt, retry_after)
+        attempt += 1
+        if attempt > GPT_MAX_RETRIES or time.monotonic() + delay > run.deadline:
+            raise error
+        if stats is not None:
+            stats.retries += 1
+        log.info("GPT: временная ошибка (%s), повтор #%d через %.1f с", error, attempt, delay)
+        await asyncio.sleep(delay)
+
+
+async def _ask_one(run: _Run, tender: Any) -> GPTResult | None:
+    code = getattr(tender, "number", "unknown")
+    excerpt = run.excerpts.get(str(code))
+    payload = _build_payload(run.system_prompt, _build_user_prompt(tender, excerpt, run.model), model=run.model)
+    content, logprobs = await _post_chat(run, payload)
+    result = _result_from_content(code, content, logprobs)
+    if result is not None:
+        result.model = run.model
+    return result
+
+
+async def _ask_batch(run: _Run, tenders: List[Any]) -> Tuple[List[GPTResult], List[Any]]:
+    """
+    Один запрос на пакет. Возвращает (разобранные вердикты, тендеры без ответа):
+    пропавшие и битые записи потом переспрашиваем по одной.
+    """
+    by_code = {str(getattr(t, "number", "unknown")): t for t in tenders}
+    payload = _build_payload(
+        run.system_prompt,
+        _build_batch_prompt(tenders, run.excerpts, run.model),
+        batch_size=len(tenders),
+        model=run.model,
+    )
+    content, logprobs = await _post_chat(run, payload)
+    parsed = _parse_gpt_json(content, ",".join(by_code))
+    if isinstance(parsed, dict):
+        # {"results": [...]} — так отвечает structured output (и иногда модель без него)
+        parsed = next((v for v in parsed.values() if isinstance(v, list)), None)
+    if not isinstance(parsed, list):
+        return [], tenders
+
+    confidences = verdict_confidences(logprobs)
+    if len(confidences) != len(parsed):
+        # не можем сопоставить токены с записями — лучше без уверенности, чем с чужой
+        confidences = []
+
+    results: List[GPTResult] = []
+    for idx, entry in enumerate(parsed):
+        if not isinstance(entry, dict) or "is_match" not in entry:
+            continue
+        code = str(entry.get("code") or "").strip().lstrip("№").strip()
+        if code not in by_code or any(r.code == code for r in results):
+            continue
+        reason = str(entry.get("reason") or "").strip() or "Причина не указана GPT."
+        results.append(
+            GPTResult(
+                code=code,
+                is_match=bool(entry.get("is_match")),
+                reason=reason,
+                confidence=confidences[idx] if confidences else None,
+                model=run.model,
             )
+        )
 
-            payload = {
-                "model": OPENAI_MODEL,
-                "messages": [
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt},
-                ],
-                "temperature": 0.1,
-            }
+    answered = {r.code for r in results}
+    missing = [t for code, t in by_code.items() if code not in answered]
+    if missing:
+        log.warning(
+            "GPT пропустил в пакете %d из %d тендеров, переспрашиваю по одному",
+            len(missing),
+            len(tenders),
+        )
+    return results, missing
+
+
+def _needs_escalation(result: GPTResult) -> bool:
+    """
+    Сомнительный вердикт дешёвой модели: низкая (или неизвестная) уверенность,
+    а при GPT_ESCALATE_MATCHES — ещё и любое «подходит».
+    """
+    if result.confidence is None or result.confidence < GPT_ESCALATE_CONFIDENCE:
+        return True
+    return GPT_ESCALATE_MATCHES and result.is_match
+
+
+async def _iter_tier(run: _Run, tenders: List[Any], batch_size: int) -> AsyncIterator[GPTResult]:
+    """
+    Один уровень каскада: все тендеры через run.model, результаты по мере готовности.
+    Тендеры без вердикта складываются в run.dropped.
+    """
+
+    def drop(code: str, error: Exception | None) -> None:
+        log.error("GPT (%s) не дал вердикт по тендеру %s: %s", run.model, code, error or "ответ не разобран")
+        run.dropped.append(code)
+
+    async def single_worker(tender: Any) -> Tuple[List[GPTResult], List[Any]]:
+        code = str(getattr(tender, "number", "unknown"))
+        try:
+            result = await _ask_one(run, tender)
+        except Exception as e:
+            drop(code, e)
+            return [], []
+        if result is None:
+            drop(code, None)
+            return [], []
+        return [result], []
+
+    async def batch_worker(tenders: List[Any]) -> Tuple[List[GPTResult], List[Any]]:
+        try:
+            return await _ask_batch(run, tenders)
+        except Exception as e:
+            log.error("Ошибка при пакетном обращении к GPT (%d тендеров): %s", len(tenders), e)
+            return [], tenders
+
+    if batch_size > 1:
+        pending = {
+            asyncio.ensure_future(batch_worker(batch))
+            for batch in _batches(tenders, batch_size, GPT_BATCH_MAX_TOKENS, run.excerpts, run.model)
+        }
+    else:
+        pending = {asyncio.ensure_future(single_worker(t)) for t in tenders}
+
+    stats = run.stats
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                results, retry = task.result()
+                for result in results:
+                    yield result
+                if retry and stats is not None:
+                    stats.batch_retries += len(retry)
+                for tender in retry:
+                    pending.add(asyncio.ensure_future(single_worker(tender)))
+    finally:
+        # если потребитель бросил итерацию — не оставляем висящих запросов
+        for task in pending:
+            task.cancel()
+
+
+async def iter_gpt_verdicts(
+    items: List[Tuple[Any, Any]],
+    concurrency: int | None = None,
+    client: httpx.AsyncClient | None = None,
+    batch_size: int | None = None,
+    stats: GPTRunStats | None = None,
+    use_cache: bool = True,
+    models: List[str] | None = None,
+    system_prompt: str | None = None,
+    base_url: str | None = None,
+) -> AsyncIterator[GPTResult]:
+    """
+    Асинхронно оцениваем тендеры; сколько запросов держать в полёте, решает
+    AIMD-регулятор по заголовкам лимитов (или фиксированно, если задан `concurrency`).
+    При batch_size > 1 тендеры пакуются по несколько штук в один запрос.
+    Сначала смотрим в кэш вердиктов — найденное отдаём сразу, без сети.
+    Если задан каскад GPT_MODEL_TIERS, дешёвая модель смотрит всех, а сомнительные
+    вердикты переспрашиваются у следующей; уверенные отдаются сразу.
+    Результаты отдаём по мере готовности (а не в исходном порядке).
+    Ошибка по одному тендеру не роняет остальные: временные ошибки повторяются,
+    а если вердикт так и не получен — номер попадает в stats.dropped.
+
+    models / system_prompt / base_url подменяют GPT_MODEL_TIERS, фильтр из
+    config.json и адрес API — для прогонов gpt_eval.py против заглушки.
+    """
+    if not items:
+        return
+
+    models = models or GPT_MODEL_TIERS
+    system_prompt = system_prompt if system_prompt is not None else get_gpt_filter_text()
+    url = f"{base_url.rstrip('/')}/chat/completions" if base_url else OPENAI_URL
+    cache = get_verdict_cache() if use_cache else None
+    prompt_hash = text_hash(_system_prefix(system_prompt))
+    cache_keys: Dict[str, str] = {}
+
+    todo: List[Tuple[Any, Any]] = []
+    for tender, local in items:
+        code = str(getattr(tender, "number", "unknown"))
+        if cache is None:
+            todo.append((tender, local))
+            continue
+        key = cache.make_key(code, tender_content_hash(tender), prompt_hash, cascade_id(models))
+        cache_keys[code] = key
+        hit = cache.get(key)
+        if hit is None:
+            todo.append((tender, local))
+            continue
+        if stats is not None:
+            stats.cache_hits += 1
+        CACHE_LOOKUPS.inc("verdict", "hit")
+        yield GPTResult(
+            code=code, is_match=hit["is_match"], reason=hit["reason"], confidence=hit.get("confidence")
+        )
+
+    if cache is not None:
+        if todo:
+            CACHE_LOOKUPS.inc("verdict", "miss", value=len(todo))
+        if stats is not None:
+            stats.cache_misses += len(todo)
+    items = todo
+    if not items:
+        return
+
+    if not OPENAI_API_KEY and not base_url:
+        log.error("OPENAI_API_KEY не задан, возвращаю пустой список из GPT.")
+        if stats is not None:
+            stats.dropped.extend(str(getattr(t, "number", "unknown")) for t, _local in items)
+        return
+
+    batch_size = max(batch_size if batch_size is not None else GPT_BATCH_SIZE, 1)
+    if stats is not None:
+        stats.mode = "batch" if batch_size > 1 else "single"
+        stats.tenders += len(items)
+
+    tenders = [tender for tender, _local in items]
+    by_code = {str(getattr(t, "number", "unknown")): t for t in tenders}
+    client = client or get_async_client()
+    deadline = time.monotonic() + GPT_RUN_DEADLINE
+    # вердикт предыдущего уровня — запасной, если следующий не ответил
+    fallback: Dict[str, GPTResult] = {}
+    dropped: List[str] = []
+
+    def finish(result: GPTResult) -> GPTResult:
+        fallback.pop(result.code, None)
+        if cache is not None and result.code in cache_keys:
+            cache.put(cache_keys[result.code], result.is_match, result.reason, result.confidence)
+        return result
+
+    try:
+        for level, model in enumerate(models):
+            last = level == len(models) - 1
+            # токены считаем словарём модели уровня; фрагменты описаний — в статистику один раз
+            excerpts = _plan_excerpts(tenders, stats if level == 0 else None, model)
+            run = _Run(
+                client=client,
+                system_prompt=system_prompt,
+                # явная concurrency (бенчмарки) — своё окно, иначе общий регулятор модели
+                limiter=AdaptiveLimiter(concurrency, concurrency) if concurrency else get_rate_limiter(model),
+                deadline=deadline,
+                model=model,
+                url=url,
+                stats=stats,
+                excerpts=excerpts,
+            )
+            if stats is not None:
+                stats.tier(model).tenders += len(tenders)
+
+            escalate: List[Any] = []
+            async for result in _iter_tier(run, tenders, batch_size):
+                if not last and _needs_escalation(result):
+                    fallback[result.code] = result
+                    escalate.append(by_code[result.code])
+                    continue
+                yield finish(result)
+
+            for code in run.dropped:
+                if code in fallback:
+                    # сильная модель не ответила — остаёмся при мнении дешёвой
+                    yield finish(fallback[code])
+                else:
+                    dropped.append(code)
+            if escalate:
+                if stats is not None:
+                    stats.tier(model).escalated += len(escalate)
+                log.info("Каскад GPT: %s -> следующий уровень, %d тендеров", model, len(escalate))
+            tenders = escalate
+            if not tenders:
+                break
+    finally:
+        if stats is not None:
+            stats.dropped.extend(dropped)
+        if cache is not None:
+            await asyncio.to_thread(cache.flush)
 
-            try:
-                resp = client.post(OPENAI_URL, headers=headers, json=payload)
-                resp.raise_for_status()
-                data = resp.json()
-                content = data["choices"][0]["message"]["content"]
-            except Exception as e:
-                log.error("Ошибка при обращении к GPT для тендера %s: %s", code, e)
-                continue
 
-            parsed = _parse_gpt_json(content, code)
-            if not parsed or "is_match" not in parsed:
-                # если что-то не так — просто пропускаем
-                continue
+async def ask_gpt_about_tenders_async(
+    items: List[Tuple[Any, Any]],
+    concurrency: int | None = None,
+    batch_size: int | None = None,
+    stats: GPTRunStats | None = None,
+) -> List[GPTResult]:
+    return [
+        r
+        async for r in iter_gpt_verdicts(
+            items, concurrency=concurrency, batch_size=batch_size, stats=stats
+        )
+    ]
+
+
+def ask_gpt_about_tenders(
+    items: List[Tuple[Any, Any]],
+    batch_size: int | None = None,
+    stats: GPTRunStats | None = None,
+    use_cache: bool = True,
+    concurrency: int | None = None,
+    models: List[str] | None = None,
+    system_prompt: str | None = None,
+    base_url: str | None = None,
+) -> List[GPTResult]:
+    """
+    items: список (Tender, local_analysis), но мы не тащим типы из mce_filter/rostender_parser для простоты.
+    Для каждого тендера спрашиваем GPT: наш / не наш + причина.
+
+    Синхронная обёртка для скриптов и потоков: внутри свой event loop
+    и свой клиент (долгоживущий клиент бота живёт в loop бота).
+    """
+
+    async def run() -> List[GPTResult]:
+        async with _new_async_client(GPT_MAX_CONCURRENCY) as client:
+            return [
+                r
+                async for r in iter_gpt_verdicts(
+                    items,
+                    concurrency=concurrency,
+                    client=client,
+                    batch_size=batch_size,
+                    stats=stats,
+                    use_cache=use_cache,
+                    models=models,
+                    system_prompt=system_prompt,
+                    base_url=base_url,
+                )
+            ]
+
+    return asyncio.run(run())
+
+
+def compare_modes(
+    items: List[Tuple[Any, Any]],
+    batch_size: int | None = None,
+) -> Dict[str, GPTRunStats]:
+    """
+    Прогоняет одни и те же тендеры в одиночном и пакетном режиме
+    и возвращает статистику обоих: запросы, токены, время, расхождения вердиктов.
+    """
+    batch_size = batch_size or max(GPT_BATCH_SIZE, 2)
+    report: Dict[str, GPTRunStats] = {}
+    verdicts: Dict[str, Dict[str, bool]] = {}
+    for mode, size in (("single", 1), ("batch", batch_size)):
+        stats = GPTRunStats()
+        started = time.monotonic()
+        results = ask_gpt_about_tenders(items, batch_size=size, stats=stats, use_cache=False)
+        stats.elapsed = time.monotonic() - started
+        report[mode] = stats
+        verdicts[mode] = {r.code: r.is_match for r in results}
+
+    disagree = sum(
+        1
+        for code, is_match in verdicts["single"].items()
+        if code in verdicts["batch"] and verdicts["batch"][code] != is_match
+    )
+    for mode, stats in report.items():
+        log.info(
+            "GPT %s: запросов %d, токенов %d (prompt %d + completion %d), $%.4f, %.1f с",
+            mode,
+            stats.requests,
+            stats.total_tokens,
+            stats.prompt_tokens,
+            stats.completion_tokens,
+            stats.cost,
+            stats.elapsed,
+        )
+    log.info("Расхождений вердиктов между режимами: %d", disagree)
+    return report
 
-            is_match = bool(parsed.get("is_match"))
-            reason = str(parsed.get("reason") or "").strip() or "Причина не указана GPT."
 
-            results.append(GPTResult(code=code, is_match=is_match, reason=reason))
+if __name__ == "__main__":
+    # python gpt_client.py [дни] [размер пакета] — сравнить одиночный и пакетный режимы
+    # на свежих тендерах из сохранённого поиска
+    import sys
 
-    return results
+    from rostender_filter_parser import fetch_rostender_tenders_filtered
 
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else 1
+    size = int(sys.argv[2]) if len(sys.argv) > 2 else None
+    tenders = fetch_rostender_tenders_filtered(days=days, max_pages=1)[:12]
+    compare_modes([(t, None) for t in tenders], batch_size=size)
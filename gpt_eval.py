@@ -0,0 +1,413 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import random
+import time
+from dataclasses import asdict, dataclass, field
+from datetime import date, datetime
+from threading import Lock
+from typing import Dict, List, Optional
+
+import httpx
+
+import env_loader  # noqa: F401  (.env — до остальных модулей проекта)
+from gpt_client import OPENAI_BASE_URL, GPTRunStats, _headers, ask_gpt_about_tenders
+from json_store import data_path, read_json, write_json_atomic
+from mock_openai import MockOpenAIServer, Responder, keyword_responder, scripted_responder
+from rostender_parser import Tender
+
+log = logging.getLogger(__name__)
+
+# Офлайн-оценка промпта/модели/режимов GPT на размеченных тендерах.
+# Всё крутится против локальной заглушки mock_openai (без сети), ответы:
+#   keyword  — эвристика по ключам МЦЭ;
+#   scripted — эталонная разметка (можно испортить долю ответов --flip);
+#   recorded — ответы настоящей модели, записанные раньше командой record.
+#
+#   python gpt_eval.py collect 3 2           — набрать тендеры для разметки
+#   python gpt_eval.py run --batch 1,5 --concurrency 4,16 --latency 0.8
+#   python gpt_eval.py record                — записать ответы OpenAI (нужны сеть и ключ)
+#
+# Свой набор копится в data/eval/labeled.json; пока его нет, run берёт небольшой
+# размеченный набор из репозитория (eval/labeled.json).
+
+EVAL_SET_PATH = data_path("eval/labeled.json")
+EVAL_FIXTURE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "eval", "labeled.json")
+RECORDED_PATH = data_path("eval/recorded.json")
+
+
+def default_set_path() -> str:
+    return EVAL_SET_PATH if os.path.exists(EVAL_SET_PATH) else EVAL_FIXTURE_PATH
+
+
+# ================== РАЗМЕЧЕННЫЙ НАБОР ==================
+
+
+@dataclass
+class LabeledTender:
+    tender: Tender
+    expected: Optional[bool]   # None — ещё не размечен
+    note: str = ""
+
+
+def tender_to_dict(t: Tender) -> dict:
+    data = asdict(t)
+    data["published"] = t.published.isoformat() if t.published else None
+    data["end_datetime"] = t.end_datetime.isoformat() if t.end_datetime else None
+    return data
+
+
+def tender_from_dict(data: dict) -> Tender:
+    data = dict(data)
+    if data.get("published"):
+        data["published"] = date.fromisoformat(data["published"])
+    if data.get("end_datetime"):
+        data["end_datetime"] = datetime.fromisoformat(data["end_datetime"])
+    return Tender(**data)
+
+
+def load_labeled(path: str = EVAL_SET_PATH, only_labeled: bool = True) -> List[LabeledTender]:
+    items = []
+    for raw in read_json(path, {}).get("items") or []:
+        item = LabeledTender(
+            tender=tender_from_dict(raw["tender"]),
+            expected=raw.get("expected"),
+            note=raw.get("note", ""),
+        )
+        if only_labeled and item.expected is None:
+            continue
+        items.append(item)
+    return items
+
+
+def save_labeled(items: List[LabeledTender], path: str = EVAL_SET_PATH) -> None:
+    write_json_atomic(
+        path,
+        {
+            "items": [
+                {"tender": tender_to_dict(i.tender), "expected": i.expected, "note": i.note}
+                for i in items
+            ]
+        },
+    )
+
+
+def collect_unlabeled(days: int, pages: int, path: str = EVAL_SET_PATH) -> int:
+    """
+    Дописываем в набор свежие тендеры (с деталями) без разметки:
+    expected проставляется руками в JSON.
+    """
+    from rostender_filter_parser import fetch_rostender_tenders_filtered
+
+    items = load_labeled(path, only_labeled=False)
+    known = {i.tender.number for i in items}
+    added = 0
+    for t in fetch_rostender_tenders_filtered(days=days, max_pages=pages, with_details=True):
+        if t.number in known:
+            continue
+        items.append(LabeledTender(tender=t, expected=None))
+        known.add(t.number)
+        added += 1
+    save_labeled(items, path)
+    return added
+
+
+# ================== ОТВЕТЫ ЗАГЛУШКИ ==================
+
+
+def _payload_key(payload: dict) -> str:
+    raw = json.dumps(
+        {"model": payload.get("model"), "messages": payload.get("messages")},
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:24]
+
+
+class RecordedResponses:
+    """
+    Записанные ответы модели: ключ — хэш (модель + сообщения) запроса.
+    Поменяли промпт или выборку описания — ключ другой, нужна перезапись.
+    """
+
+    def __init__(self, path: str = RECORDED_PATH) -> None:
+        self.path = path
+        self.responses: Dict[str, str] = dict(read_json(path, {}).get("responses") or {})
+        self.misses = 0
+        self._lock = Lock()
+
+    def save(self) -> None:
+        with self._lock:
+            write_json_atomic(self.path, {"responses": self.responses})
+
+    def replay(self, fallback: Responder = keyword_responder) -> Responder:
+        def respond(payload: dict) -> str:
+            content = self.responses.get(_payload_key(payload))
+            if content is None:
+                with self._lock:
+                    self.misses += 1
+                return fallback(payload)
+            return content
+
+        return respond
+
+    def recorder(self, base_url: str = OPENAI_BASE_URL) -> Responder:
+        """
+        Проксируем запрос в настоящий OpenAI и запоминаем ответ.
+        """
+        client = httpx.Client(timeout=120)
+
+        def respond(payload: dict) -> str:
+            resp = client.post(f"{base_url}/chat/completions", headers=_headers(), json=payload)
+            resp.raise_for_status()
+            content = resp.json()["choices"][0]["message"]["content"] or ""
+            with self._lock:
+                self.responses[_payload_key(payload)] = content
+            return content
+
+        return respond
+
+
+def labels_responder(items: List[LabeledTender], flip: float = 0.0, seed: int = 1) -> Responder:
+    """
+    Отвечаем эталонной разметкой; flip — доля намеренно ошибочных ответов
+    (детерминированно по seed), чтобы было что сравнивать по точности.
+    """
+    rnd = random.Random(seed)
+    verdicts = {}
+    for item in items:
+        is_match = bool(item.expected)
+        if flip and rnd.random() < flip:
+            is_match = not is_match
+        verdicts[item.tender.number] = (is_match, item.note or "по разметке")
+    return scripted_responder(verdicts)
+
+
+# ================== ПРОГОН ==================
+
+
+@dataclass
+class EvalConfig:
+    name: str
+    batch_size: int = 1
+    concurrency: Optional[int] = None
+    models: Optional[List[str]] = None
+    system_prompt: Optional[str] = None
+
+
+@dataclass
+class EvalReport:
+    config: str
+    total: int = 0
+    answered: int = 0
+    correct: int = 0
+    tp: int = 0
+    fp: int = 0
+    fn: int = 0
+    requests: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_tokens: int = 0
+    cost: float = 0.0
+    elapsed: float = 0.0
+    dropped: List[str] = field(default_factory=list)
+
+    @property
+    def accuracy(self) -> float:
+        return self.correct / self.total if self.total else 0.0
+
+    @property
+    def precision(self) -> float:
+        return self.tp / (self.tp + self.fp) if self.tp + self.fp else 0.0
+
+    @property
+    def recall(self) -> float:
+        return self.tp / (self.tp + self.fn) if self.tp + self.fn else 0.0
+
+
+def run_config(items: List[LabeledTender], config: EvalConfig, base_url: str) -> EvalReport:
+    stats = GPTRunStats()
+    started = time.monotonic()
+    results = ask_gpt_about_tenders(
+        [(i.tender, None) for i in items],
+        batch_size=config.batch_size,
+        stats=stats,
+        use_cache=False,
+        concurrency=config.concurrency,
+        models=config.models,
+        system_prompt=config.system_prompt,
+        base_url=base_url,
+    )
+    elapsed = time.monotonic() - started
+
+    verdicts = {r.code: r.is_match for r in results}
+    report = EvalReport(
+        config=config.name,
+        total=len(items),
+        answered=len(verdicts),
+        requests=stats.requests,
+        prompt_tokens=stats.prompt_tokens,
+        completion_tokens=stats.completion_tokens,
+        cached_tokens=stats.cached_tokens,
+        cost=stats.cost,
+        elapsed=elapsed,
+        dropped=list(stats.dropped),
+    )
+    for item in items:
+        got = verdicts.get(item.tender.number)
+        if got is None:
+            # нет ответа — считаем ошибкой, а для «нашего» тендера ещё и пропуском
+            if item.expected:
+                report.fn += 1
+            continue
+        if got == item.expected:
+            report.correct += 1
+        if got and item.expected:
+            report.tp += 1
+        elif got and not item.expected:
+            report.fp += 1
+        elif not got and item.expected:
+            report.fn += 1
+    return report
+
+
+def evaluate(
+    items: List[LabeledTender],
+    configs: List[EvalConfig],
+    responder: Optional[Responder] = None,
+    latency: float = 0.0,
+    latency_jitter: float = 0.0,
+    certainty: float = 0.9,
+) -> List[EvalReport]:
+    """
+    Гоняем один и тот же набор через каждую конфигурацию против локальной заглушки.
+    """
+    reports = []
+    with MockOpenAIServer(
+        responder=responder,
+        latency=latency,
+        latency_jitter=latency_jitter,
+        certainty=certainty,
+    ) as server:
+        for config in configs:
+            report = run_config(items, config, server.base_url)
+            log.info("Оценка %s: точность %.0f%%, %.1f с", config.name, report.accuracy * 100, report.elapsed)
+            reports.append(report)
+    return reports
+
+
+def format_reports(reports: List[EvalReport]) -> str:
+    header = (
+        f"{'конфигурация':<24} {'точн.':>6} {'prec':>6} {'rec':>6} {'ответов':>8} "
+        f"{'запр.':>6} {'токенов':>9} {'кэш':>5} {'$':>8} {'сек':>7}"
+    )
+    lines = [header, "-" * len(header)]
+    for r in reports:
+        lines.append(
+            f"{r.config:<24} {r.accuracy:>6.0%} {r.precision:>6.0%} {r.recall:>6.0%} "
+            f"{r.answered:>4}/{r.total:<3} {r.requests:>6} "
+            f"{r.prompt_tokens + r.completion_tokens:>9} "
+            f"{(r.cached_tokens / r.prompt_tokens if r.prompt_tokens else 0):>5.0%} "
+            f"{r.cost:>8.4f} {r.elapsed:>7.2f}"
+        )
+    return "\n".join(lines)
+
+
+def build_configs(
+    batch_sizes: List[int],
+    concurrencies: List[Optional[int]],
+    models: Optional[List[str]] = None,
+    system_prompt: Optional[str] = None,
+) -> List[EvalConfig]:
+    configs = []
+    for size in batch_sizes:
+        for conc in concurrencies:
+            name = f"batch={size} conc={conc or 'auto'}"
+            configs.append(
+                EvalConfig(
+                    name=name,
+                    batch_size=size,
+                    concurrency=conc,
+                    models=models,
+                    system_prompt=system_prompt,
+                )
+            )
+    return configs
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    parser = argparse.ArgumentParser(description="Офлайн-оценка GPT-фильтра тендеров")
+    parser.add_argument("cmd", choices=["run", "collect", "record"], nargs="?", default="run")
+    parser.add_argument("args", nargs="*", help="collect: дни страницы")
+    parser.add_argument("--set", dest="set_path", default="", help="по умолчанию data/eval, иначе eval/ репозитория")
+    parser.add_argument("--responses", choices=["keyword", "scripted", "recorded"], default="recorded")
+    parser.add_argument("--flip", type=float, default=0.0, help="scripted: доля ошибочных ответов")
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--certainty", type=float, default=0.9)
+    parser.add_argument("--batch", default="1,5")
+    parser.add_argument("--concurrency", default="auto")
+    parser.add_argument("--models", default="", help="каскад через запятую")
+    parser.add_argument("--prompt-file", default="", help="системный промпт вместо config.json")
+    parser.add_argument("--json", dest="json_out", default="", help="сохранить отчёт в JSON")
+    opts = parser.parse_args()
+
+    if opts.cmd == "collect":
+        opts.set_path = opts.set_path or EVAL_SET_PATH
+        days = int(opts.args[0]) if opts.args else 3
+        pages = int(opts.args[1]) if len(opts.args) > 1 else 2
+        print(f"добавлено {collect_unlabeled(days, pages, opts.set_path)} тендеров в {opts.set_path}")
+        raise SystemExit(0)
+
+    opts.set_path = opts.set_path or default_set_path()
+    items = load_labeled(opts.set_path)
+    if not items:
+        raise SystemExit(f"В {opts.set_path} нет размеченных тендеров (поле expected).")
+
+    prompt = None
+    if opts.prompt_file:
+        with open(opts.prompt_file, "r", encoding="utf-8") as f:
+            prompt = f.read()
+    models = [m.strip() for m in opts.models.split(",") if m.strip()] or None
+    configs = build_configs(
+        [int(v) for v in opts.batch.split(",")],
+        [None if v.strip() == "auto" else int(v) for v in opts.concurrency.split(",")],
+        models=models,
+        system_prompt=prompt,
+    )
+
+    recorded = RecordedResponses()
+    if opts.cmd == "record":
+        # один проход, чтобы записать ответы под каждый вид промпта (одиночный/пакетный)
+        evaluate(items, configs, responder=recorded.recorder())
+        recorded.save()
+        print(f"записано ответов: {len(recorded.responses)} -> {recorded.path}")
+        raise SystemExit(0)
+
+    if opts.responses == "scripted":
+        responder = labels_responder(items, flip=opts.flip)
+    elif opts.responses == "recorded":
+        responder = recorded.replay()
+    else:
+        responder = keyword_responder
+
+    reports = evaluate(
+        items,
+        configs,
+        responder=responder,
+        latency=opts.latency,
+        latency_jitter=opts.jitter,
+        certainty=opts.certainty,
+    )
+    print(format_reports(reports))
+    if opts.responses == "recorded" and recorded.misses:
+        print(f"(нет записи для {recorded.misses} запросов — ответила эвристика по ключам)")
+    if opts.json_out:
+        write_json_atomic(opts.json_out, [dict(asdict(r), accuracy=r.accuracy) for r in reports])
@@ -0,0 +1,85 @@
+from __future__ import annotations
+
+import logging
+import os
+from typing import Dict, Tuple
+
+log = logging.getLogger(__name__)
+
+# Цены OpenAI, $ за 1M токенов: (вход, вход из кэша префикса, выход).
+# Переопределение без правки кода:
+#   GPT_PRICES="gpt-4o-mini=0.15/0.075/0.6,my-proxy-model=1/0.5/4"
+DEFAULT_PRICES: Dict[str, Tuple[float, float, float]] = {
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+    "gpt-4o": (2.50, 1.25, 10.00),
+    "gpt-4.1-nano": (0.10, 0.025, 0.40),
+    "gpt-4.1-mini": (0.40, 0.10, 1.60),
+    "gpt-4.1": (2.00, 0.50, 8.00),
+    "o4-mini": (1.10, 0.275, 4.40),
+}
+
+
+def _parse_prices(raw: str) -> Dict[str, Tuple[float, float, float]]:
+    prices: Dict[str, Tuple[float, float, float]] = {}
+    for item in raw.split(","):
+        if "=" not in item:
+            continue
+        model, _, values = item.partition("=")
+        try:
+            parts = [float(v) for v in values.split("/")]
+        except ValueError:
+            log.warning("GPT_PRICES: не разобрал цену %r", item)
+            continue
+        if len(parts) == 2:
+            # без отдельной цены кэша считаем её равной обычному входу
+            parts = [parts[0], parts[0], parts[1]]
+        if len(parts) != 3:
+            log.warning("GPT_PRICES: ожидаю вход/кэш/выход в %r", item)
+            continue
+        prices[model.strip()] = (parts[0], parts[1], parts[2])
+    return prices
+
+
+MODEL_PRICES: Dict[str, Tuple[float, float, float]] = {
+    **DEFAULT_PRICES,
+    **_parse_prices(os.getenv("GPT_PRICES", "")),
+}
+
+# модели без цены, о которых уже предупредили
+_unknown: set = set()
+
+
+def model_price(model: str) -> Tuple[float, float, float] | None:
+    """
+    Цена модели; снапшоты вида gpt-4o-mini-2024-07-18 ищем по самому длинному префиксу.
+    """
+    if model in MODEL_PRICES:
+        return MODEL_PRICES[model]
+    best = max((name for name in MODEL_PRICES if model.startswith(name + "-")), key=len, default=None)
+    return MODEL_PRICES[best] if best else None
+
+
+def cost_usd(model: str, prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0) -> float:
+    """
+    Стоимость запроса в долларах; неизвестная модель — 0 (и предупреждение один раз).
+    cached_tokens входят в prompt_tokens, но тарифицируются по цене кэша.
+    """
+    price = model_price(model)
+    if price is None:
+        if model not in _unknown:
+            _unknown.add(model)
+            log.warning("Нет цены для модели %s — стоимость считаю нулевой (см. GPT_PRICES)", model)
+        return 0.0
+    inp, cached, out = price
+    cached_tokens = min(cached_tokens, prompt_tokens)
+    return ((prompt_tokens - cached_tokens) * inp + cached_tokens * cached + completion_tokens * out) / 1_000_000
+
+
+def cache_savings_usd(model: str, cached_tokens: int) -> float:
+    """
+    Сколько сэкономил кэш префикса: разница обычной и кэшированной цены входа.
+    """
+    price = model_price(model)
+    if price is None:
+        return 0.0
+    return cached_tokens * (price[0] - price[1]) / 1_000_000
@@ -0,0 +1,134 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import random
+import re
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Mapping, Optional
+
+log = logging.getLogger(__name__)
+
+# статусы, которые имеет смысл повторить
+RETRY_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+# статусы, после которых сбрасываем параллельность (сервер просит притормозить)
+THROTTLE_STATUSES = {429, 503}
+
+BACKOFF_BASE = 1.0
+BACKOFF_CAP = 20.0
+# если осталось меньше этой доли лимита — перестаём разгоняться и чуть сбавляем
+LOW_HEADROOM = 0.1
+
+_DURATION_RE = re.compile(r"(?P<value>\d+(?:\.\d+)?)(?P<unit>ms|s|m|h)")
+_UNIT_SECONDS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    """
+    '20', '1.5s', '6m0s', '250ms' -> секунды.
+    """
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    total = 0.0
+    found = False
+    for m in _DURATION_RE.finditer(value):
+        total += float(m.group("value")) * _UNIT_SECONDS[m.group("unit")]
+        found = True
+    return total if found else None
+
+
+def retry_after_seconds(headers: Mapping[str, str]) -> Optional[float]:
+    ms = headers.get("retry-after-ms")
+    if ms:
+        try:
+            return float(ms) / 1000
+        except ValueError:
+            pass
+    return parse_duration(headers.get("retry-after"))
+
+
+def backoff_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+    """
+    Экспоненциальная пауза с «полным джиттером»; retry-after от сервера — нижняя граница.
+    """
+    delay = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
+
+
+def _headroom(headers: Mapping[str, str], kind: str) -> Optional[float]:
+    remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+    limit = headers.get(f"x-ratelimit-limit-{kind}")
+    try:
+        return float(remaining) / float(limit) if remaining is not None and limit else None
+    except ValueError:
+        return None
+
+
+class AdaptiveLimiter:
+    """
+    AIMD-регулятор числа запросов в полёте:
+    - успех с запасом по лимитам — окно растёт примерно на 1 за «круг» запросов;
+    - 429/503 — окно делится пополам, а при retry-after все ждут паузу;
+    - мало запаса в x-ratelimit-remaining-* — окно аккуратно уменьшаем на 1.
+    """
+
+    def __init__(self, initial: int, max_limit: int, min_limit: int = 1) -> None:
+        self.min_limit = max(min_limit, 1)
+        self.max_limit = max(max_limit, self.min_limit)
+        self.limit = float(min(max(initial, self.min_limit), self.max_limit))
+        self.in_flight = 0
+        self.pause_until = 0.0
+        self._cond = asyncio.Condition()
+
+    @property
+    def window(self) -> int:
+        return int(self.limit)
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        async with self._cond:
+            while True:
+                pause = self.pause_until - time.monotonic()
+                if pause > 0:
+                    try:
+                        await asyncio.wait_for(self._cond.wait(), timeout=pause)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                if self.in_flight < self.window:
+                    break
+                await self._cond.wait()
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            async with self._cond:
+                self.in_flight -= 1
+                self._cond.notify_all()
+
+    def on_success(self, headers: Mapping[str, str]) -> None:
+        low = [h for h in (_headroom(headers, "requests"), _headroom(headers, "tokens")) if h is not None]
+        if low and min(low) < LOW_HEADROOM:
+            self.limit = max(self.min_limit, self.limit - 1)
+            return
+        self.limit = min(self.max_limit, self.limit + 1 / max(self.limit, 1))
+
+    def on_throttle(self, retry_after: Optional[float] = None) -> None:
+        old = self.window
+        self.limit = max(self.min_limit, self.limit / 2)
+        if retry_after:
+            self.pause_until = max(self.pause_until, time.monotonic() + retry_after)
+        log.warning(
+            "GPT просит притормозить: параллельность %d -> %d, пауза %.1f с",
+            old,
+            self.window,
+            retry_after or 0,
+        )
@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from threading import Event
+from typing import Dict, List, Optional
+
+log = logging.getLogger(__name__)
+
+
+@dataclass
+class Job:
+    """
+    Тяжёлая задача чата (проверка тендеров).
+
+    Отмена кооперативная: cancel_event видят потоки обхода Ростендера
+    (проверяют между запросами), а asyncio-задача отменяется обычным cancel().
+    """
+    chat_id: int
+    kind: str
+    started_at: datetime = field(default_factory=datetime.now)
+    started: float = field(default_factory=time.monotonic)
+    stage: str = ""
+    task: Optional[asyncio.Task] = None
+    cancel_event: Event = field(default_factory=Event)
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel_event.is_set()
+
+    def cancel(self) -> None:
+        if self.cancel_event.is_set():
+            return
+        self.cancel_event.set()
+        if self.task is not None and not self.task.done():
+            self.task.cancel()
+
+
+class JobRegistry:
+    """
+    Не больше одной тяжёлой задачи на чат: повторное нажатие «Проверить»
+    не запускает второй обход параллельно первому.
+    """
+
+    def __init__(self) -> None:
+        self._jobs: Dict[int, Job] = {}
+
+    def start(self, chat_id: int, kind: str) -> Optional[Job]:
+        """
+        Новая задача или None, если в чате уже что-то выполняется.
+        """
+        current = self._jobs.get(chat_id)
+        if current is not None and not (current.task is not None and current.task.done()):
+            return None
+        job = Job(chat_id=chat_id, kind=kind)
+        self._jobs[chat_id] = job
+        return job
+
+    def finish(self, job: Job) -> None:
+        if self._jobs.get(job.chat_id) is job:
+            del self._jobs[job.chat_id]
+
+    def get(self, chat_id: int) -> Optional[Job]:
+        return self._jobs.get(chat_id)
+
+    def cancel(self, chat_id: int) -> bool:
+        job = self._jobs.get(chat_id)
+        if job is None:
+            return False
+        log.info("Отмена задачи %s в чате %s", job.kind, chat_id)
+        job.cancel()
+        return True
+
+    def all(self) -> List[Job]:
+        return list(self._jobs.values())
+
+    async def cancel_all(self) -> None:
+        tasks = []
+        for job in self.all():
+            job.cancel()
+            if job.task is not None:
+                tasks.append(job.task)
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+_registry: Optional[JobRegistry] = None
+
+
+def get_job_registry() -> JobRegistry:
+    global _registry
+    if _registry is None:
+        _registry = JobRegistry()
+    return _registry
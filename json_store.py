@@ -0,0 +1,45 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+from typing import Any
+
+log = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(__file__)
+# служебные файлы бота (индексы, кэши, журналы) — отдельно от config.json;
+# BOT_DATA_DIR — другой каталог (тесты, несколько копий бота на одной машине)
+DATA_DIR = os.getenv("BOT_DATA_DIR", "").strip() or os.path.join(BASE_DIR, "data")
+
+
+def data_path(name: str) -> str:
+    """
+    Полный путь к служебному файлу в каталоге data/.
+    """
+    return os.path.join(DATA_DIR, name)
+
+
+def read_json(path: str, default: Any) -> Any:
+    """
+    Читаем JSON-файл. Если файла нет или он битый — отдаём default.
+    """
+    if not os.path.exists(path):
+        return default
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        log.warning("Не удалось прочитать %s: %s — начинаю с пустого состояния.", path, e)
+        return default
+
+
+def write_json_atomic(path: str, data: Any) -> None:
+    """
+    Пишем JSON через временный файл и os.replace, как в config_store.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp_path, path)
@@ -5,7 +5,7 @@ from dataclasses import dataclass, field
 from typing import List, Set
 
 
-def _norm(text: str) -> str:
+def normalize_text(text: str) -> str:
     """
     Нормализация текста:
     - в нижний регистр
@@ -184,7 +184,7 @@ class LocalAnalysis:
     negative_reasons: List[str] = field(default_factory=list)
 
 
-def _find_keywords(text: str, keywords: Set[str]) -> Set[str]:
+def find_keywords(text: str, keywords: Set[str]) -> Set[str]:
     """
     Ищем ключевые слова/фразы в нормализованном тексте.
     """
@@ -215,14 +215,14 @@ def analyze_tender(
         1 — если есть TOP_DIRECTIONS,
         2 — если есть OTHER_DIRECTIONS,
         0 — если просто «что-то вокруг» без наших ключей.
-    Остальное режем по MAX_GPT_TENDERS в tg_bot.py.
+    Сколько кандидатов дойдёт до GPT, решает бюджет запуска (gpt_candidates.py).
     """
 
-    text = _norm(f"{title} {description}")
+    text = normalize_text(f"{title} {description}")
 
-    top_hits = _find_keywords(text, TOP_DIRECTIONS)
-    other_hits = _find_keywords(text, OTHER_DIRECTIONS)
-    bad_hits = _find_keywords(text, BAD_TOPICS)
+    top_hits = find_keywords(text, TOP_DIRECTIONS)
+    other_hits = find_keywords(text, OTHER_DIRECTIONS)
+    bad_hits = find_keywords(text, BAD_TOPICS)
 
     # если есть негативные темы — сразу мимо
     if bad_hits:
@@ -244,7 +244,7 @@ def analyze_tender(
     elif other_hits:
         priority = 2
     else:
-        priority = 0  # нейтральный, но всё равно пойдёт в GPT, если попадёт в топ-12
+        priority = 0  # нейтральный, но всё равно пойдёт в GPT, если хватит бюджета
 
     return LocalAnalysis(
         code=code,
@@ -0,0 +1,283 @@
+from __future__ import annotations
+
+import logging
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+log = logging.getLogger(__name__)
+
+# Метрики процесса в текстовом формате Prometheus.
+#
+# METRICS_PORT=9108 — поднять отдельный HTTP-эндпоинт /metrics (0 — выключен);
+# METRICS_HOST — адрес (по умолчанию только localhost).
+#
+# Горячие пути (каждая страница, каждый запрос к ИИ) пишут только в шард
+# своего потока — без блокировок; шарды складываются при выдаче /metrics.
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0") or 0)
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1").strip() or "127.0.0.1"
+METRICS_PATH = "/metrics"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels_text(names: Sequence[str], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _fmt(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._shards: List[dict] = []
+        self._shards_lock = threading.Lock()
+
+    def _shard(self) -> dict:
+        shard = getattr(self._local, "values", None)
+        if shard is None:
+            # регистрация шарда — один раз на поток
+            shard = self._local.values = {}
+            with self._shards_lock:
+                self._shards.append(shard)
+        return shard
+
+    def _snapshots(self) -> List[dict]:
+        with self._shards_lock:
+            shards = list(self._shards)
+        # dict.copy() атомарен под GIL, пишущий поток нам не мешает
+        return [shard.copy() for shard in shards]
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels: str, value: float = 1.0) -> None:
+        shard = self._shard()
+        shard[labels] = shard.get(labels, 0.0) + value
+
+    def collect(self) -> Dict[LabelValues, float]:
+        total: Dict[LabelValues, float] = {}
+        for shard in self._snapshots():
+            for labels, value in shard.items():
+                total[labels] = total.get(labels, 0.0) + value
+        return total
+
+    def render(self) -> List[str]:
+        return [
+            f"{self.name}{_labels_text(self.labelnames, labels)} {_fmt(value)}"
+            for labels, value in sorted(self.collect().items())
+        ]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, *labels: str, value: float) -> None:
+        shard = self._shard()
+        cell = shard.get(labels)
+        if cell is None:
+            # [по корзинам..., сумма, количество]
+            cell = shard[labels] = [0] * len(self.buckets) + [0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                cell[i] += 1
+                break
+        cell[-2] += value
+        cell[-1] += 1
+
+    def collect(self) -> Dict[LabelValues, List[float]]:
+        total: Dict[LabelValues, List[float]] = {}
+        for shard in self._snapshots():
+            for labels, cell in shard.items():
+                acc = total.setdefault(labels, [0] * (len(self.buckets) + 2))
+                for i, value in enumerate(list(cell)):
+                    acc[i] += value
+        return total
+
+    def render(self) -> List[str]:
+        lines: List[str] = []
+        for labels, cell in sorted(self.collect().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, cell):
+                cumulative += count
+                le = 'le="' + _fmt(bound) + '"'
+                lines.append(f"{self.name}_bucket{_labels_text(self.labelnames, labels, le)} {cumulative}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_labels_text(self.labelnames, labels, le)} {cell[-1]}")
+            lines.append(f"{self.name}_sum{_labels_text(self.labelnames, labels)} {_fmt(cell[-2])}")
+            lines.append(f"{self.name}_count{_labels_text(self.labelnames, labels)} {cell[-1]}")
+        return lines
+
+
+class Gauge(_Metric):
+    """
+    Значение снимаем в момент выдачи (длина очереди, число задач) — в горячих путях не пишем.
+    """
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str) -> None:
+        super().__init__(name, help_text)
+        self._func: Optional[Callable[[], float]] = None
+
+    def set_function(self, func: Callable[[], float]) -> None:
+        self._func = func
+
+    def render(self) -> List[str]:
+        if self._func is None:
+            return []
+        try:
+            return [f"{self.name} {_fmt(self._func())}"]
+        except Exception as e:
+            log.debug("Метрика %s не снялась: %s", self.name, e)
+            return []
+
+
+_registry: List[_Metric] = []
+
+
+def _register(metric: _Metric) -> _Metric:
+    _registry.append(metric)
+    return metric
+
+
+def render() -> str:
+    lines: List[str] = []
+    for metric in _registry:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# ================== МЕТРИКИ БОТА ==================
+
+STAGE_SECONDS = _register(Histogram(
+    "tenderbot_stage_seconds",
+    "Длительность этапов проверки (total — весь запуск)",
+    ["stage"],
+))
+ROSTENDER_REQUESTS = _register(Counter(
+    "tenderbot_rostender_requests_total",
+    "Запросы к Ростендеру: страницы каталога и карточки",
+    ["kind", "outcome"],
+))
+ROSTENDER_BYTES = _register(Counter(
+    "tenderbot_rostender_bytes_total",
+    "Скачано байт с Ростендера",
+    ["kind"],
+))
+CACHE_LOOKUPS = _register(Counter(
+    "tenderbot_cache_lookups_total",
+    "Обращения к кэшам вердиктов (verdict — кэш GPT, dedup — кластеры прошлых запусков)",
+    ["cache", "result"],
+))
+GPT_REQUESTS = _register(Counter(
+    "tenderbot_gpt_requests_total",
+    "Запросы к ИИ по исходу (ok, throttled, error)",
+    ["model", "outcome"],
+))
+GPT_TOKENS = _register(Counter(
+    "tenderbot_gpt_tokens_total",
+    "Токены ИИ (prompt, completion, cached)",
+    ["model", "kind"],
+))
+GPT_LATENCY = _register(Histogram(
+    "tenderbot_gpt_request_seconds",
+    "Время ответа ИИ на один запрос",
+    ["model"],
+))
+TELEGRAM_MESSAGES = _register(Counter(
+    "tenderbot_telegram_messages_total",
+    "Сообщения в Telegram (sent, error)",
+    ["outcome"],
+))
+TELEGRAM_RETRY_AFTER = _register(Counter(
+    "tenderbot_telegram_retry_after_total",
+    "Сколько раз Telegram ответил RetryAfter",
+))
+TELEGRAM_QUEUE = _register(Gauge(
+    "tenderbot_telegram_queue_length",
+    "Сообщений в очереди на отправку",
+))
+JOBS_RUNNING = _register(Gauge(
+    "tenderbot_jobs_running",
+    "Проверок, выполняющихся сейчас",
+))
+
+
+# ================== HTTP-ЭНДПОИНТ ==================
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        if self.path.split("?", 1)[0] != METRICS_PATH:
+            self.send_error(404)
+            return
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:
+        # каждый scrape в лог не пишем
+        pass
+
+
+_server: Optional[ThreadingHTTPServer] = None
+
+
+def start_metrics_server(host: str = METRICS_HOST, port: int = METRICS_PORT) -> Optional[ThreadingHTTPServer]:
+    """
+    Отдельный HTTP-сервер /metrics в фоновом потоке; port=0 — выключено.
+    """
+    global _server
+    if port <= 0 or _server is not None:
+        return _server
+    _server = ThreadingHTTPServer((host, port), _Handler)
+    threading.Thread(target=_server.serve_forever, name="metrics", daemon=True).start()
+    log.info("Метрики Prometheus: http://%s:%d%s", host, port, METRICS_PATH)
+    return _server
+
+
+def stop_metrics_server() -> None:
+    global _server
+    if _server is not None:
+        _server.shutdown()
+        _server.server_close()
+        _server = None
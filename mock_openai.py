@@ -0,0 +1,338 @@
+from __future__ import annotations
+
+import json
+import logging
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Optional, Tuple
+
+from mce_filter import analyze_tender
+
+log = logging.getLogger(__name__)
+
+# Локальная заглушка OpenAI API для проверок без сети:
+#   POST /v1/chat/completions
+#   POST /v1/files, GET /v1/files/{id}/content
+#   POST /v1/batches, GET /v1/batches/{id}
+#
+# Запуск отдельно: python mock_openai.py [порт], затем OPENAI_BASE_URL=http://127.0.0.1:порт/v1
+
+# responder(payload) -> текст ответа модели
+Responder = Callable[[dict], str]
+# judge(номер, текст блока тендера) -> (подходит, причина)
+Judge = Callable[[str, str], Tuple[bool, str]]
+
+
+def _user_text(payload: dict) -> str:
+    return "\n".join(
+        str(m.get("content") or "") for m in payload.get("messages", []) if m.get("role") == "user"
+    )
+
+
+def verdict_responder(judge: Judge) -> Responder:
+    """
+    Responder, который разбирает одиночные и пакетные промпты gpt_client
+    и по каждому тендеру спрашивает judge.
+    """
+
+    def respond(payload: dict) -> str:
+        text = _user_text(payload)
+        verdicts = []
+        for block in re.split(r"(?=Номер: )", text):
+            m = re.match(r"Номер: (\S+)", block)
+            if not m:
+                continue
+            is_match, reason = judge(m.group(1), block)
+            verdicts.append({"code": m.group(1), "is_match": bool(is_match), "reason": reason})
+
+        if len(verdicts) == 1 and "JSON-массивом" not in text:
+            return json.dumps(
+                {"is_match": verdicts[0]["is_match"], "reason": verdicts[0]["reason"]}, ensure_ascii=False
+            )
+        return json.dumps(verdicts, ensure_ascii=False)
+
+    return respond
+
+
+def _keyword_judge(code: str, block: str) -> Tuple[bool, str]:
+    local = analyze_tender(code=code, title="", url="", customer="", description=block)
+    is_match = local.is_local_match and local.priority_level == 1
+    return is_match, ", ".join(local.matched_keywords) or "нет профильных ключей"
+
+
+# Ответ «по-простому»: наш тендер, если локальный фильтр МЦЭ дал приоритет 1.
+keyword_responder = verdict_responder(_keyword_judge)
+
+
+def scripted_responder(verdicts: Dict[str, Tuple[bool, str]], default: Optional[Judge] = None) -> Responder:
+    """
+    Заранее заданные вердикты по номерам; остальным — default (по ключам МЦЭ).
+    """
+    default = default or _keyword_judge
+
+    def judge(code: str, block: str) -> Tuple[bool, str]:
+        return verdicts[code] if code in verdicts else default(code, block)
+
+    return verdict_responder(judge)
+
+
+_TOKEN_RE = re.compile(r"\w+|\s+|[^\w\s]", re.U)
+
+
+def _structured(payload: dict, content: str) -> str:
+    """
+    Если запросили json_schema с корнем-объектом results, а responder ответил
+    голым массивом — заворачиваем, как это сделал бы настоящий structured output.
+    """
+    schema = ((payload.get("response_format") or {}).get("json_schema") or {}).get("schema") or {}
+    if "results" not in (schema.get("properties") or {}):
+        return content
+    try:
+        data = json.loads(content)
+    except ValueError:
+        return content
+    if isinstance(data, list):
+        return json.dumps({"results": data}, ensure_ascii=False)
+    return content
+
+
+def fake_logprobs(content: str, certainty: float = 0.9) -> dict:
+    """
+    Грубая имитация logprobs: «токены» по словам, у true/false — certainty
+    и альтернатива с противоположным значением.
+    """
+    tokens = []
+    for token in _TOKEN_RE.findall(content):
+        if token in ("true", "false"):
+            other = "false" if token == "true" else "true"
+            tokens.append(
+                {
+                    "token": token,
+                    "logprob": math.log(certainty),
+                    "top_logprobs": [
+                        {"token": token, "logprob": math.log(certainty)},
+                        {"token": other, "logprob": math.log(1 - certainty)},
+                    ],
+                }
+            )
+        else:
+            tokens.append({"token": token, "logprob": 0.0, "top_logprobs": []})
+    return {"content": tokens}
+
+
+class MockOpenAIServer:
+    """
+    latency — задержка на каждый chat completion (сек), latency_jitter — разброс ± к ней;
+    certainty — вероятность вердикта в фальшивых logprobs;
+    batch_delay — через сколько секунд batch переходит в completed.
+    """
+
+    def __init__(
+        self,
+        responder: Optional[Responder] = None,
+        latency: float = 0.0,
+        batch_delay: float = 0.0,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency_jitter: float = 0.0,
+        certainty: float = 0.9,
+    ) -> None:
+        self.responder = responder or keyword_responder
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.certainty = certainty
+        self.batch_delay = batch_delay
+        self.files: Dict[str, bytes] = {}
+        # префиксы (модель + system), которые «провайдер» уже видел
+        self.prefixes: set = set()
+        self.batches: Dict[str, dict] = {}
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "MockOpenAIServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "MockOpenAIServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    # ---------- эмуляция ----------
+
+    def chat_completion(self, payload: dict) -> dict:
+        with self._lock:
+            self.requests += 1
+        delay = self.latency + random.uniform(-self.latency_jitter, self.latency_jitter)
+        if delay > 0:
+            time.sleep(delay)
+        content = _structured(payload, self.responder(payload))
+        prompt_chars = sum(len(str(m.get("content") or "")) for m in payload.get("messages", []))
+        cached_tokens = self._cached_tokens(payload)
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+            "object": "chat.completion",
+            "model": payload.get("model"),
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "logprobs": fake_logprobs(content, self.certainty) if payload.get("logprobs") else None,
+                    "finish_reason": "stop",
+                }
+            ],
+            "usage": {
+                "prompt_tokens": prompt_chars // 3 + 1,
+                "completion_tokens": len(content) // 3 + 1,
+                "total_tokens": prompt_chars // 3 + len(content) // 3 + 2,
+                "prompt_tokens_details": {"cached_tokens": cached_tokens},
+            },
+        }
+
+    def _cached_tokens(self, payload: dict) -> int:
+        """
+        Как у OpenAI: кэшируется повторённый префикс от 1024 токенов, блоками по 128.
+        Префиксом считаем system-сообщение.
+        """
+        messages = payload.get("messages") or []
+        system = str(messages[0].get("content") or "") if messages else ""
+        tokens = len(system) // 3
+        key = (payload.get("model"), system)
+        with self._lock:
+            seen = key in self.prefixes
+            self.prefixes.add(key)
+        if not seen or tokens < 1024:
+            return 0
+        return tokens // 128 * 128
+
+    def _batch_view(self, batch: dict) -> dict:
+        if batch["status"] != "completed" and time.time() - batch["created_at"] >= self.batch_delay:
+            self._run_batch(batch)
+        return batch
+
+    def _run_batch(self, batch: dict) -> None:
+        out_lines = []
+        for raw in self.files[batch["input_file_id"]].decode("utf-8").splitlines():
+            if not raw.strip():
+                continue
+            line = json.loads(raw)
+            body = self.chat_completion(line["body"])
+            out_lines.append(
+                json.dumps(
+                    {
+                        "id": f"batch_req_{uuid.uuid4().hex[:8]}",
+                        "custom_id": line["custom_id"],
+                        "response": {"status_code": 200, "body": body},
+                        "error": None,
+                    },
+                    ensure_ascii=False,
+                )
+            )
+        file_id = f"file-{uuid.uuid4().hex[:12]}"
+        self.files[file_id] = ("\n".join(out_lines) + "\n").encode("utf-8")
+        batch["output_file_id"] = file_id
+        batch["status"] = "completed"
+
+    def _handler_class(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, fmt, *args):
+                log.debug("mock_openai: " + fmt, *args)
+
+            def _send_json(self, data: dict, status: int = 200) -> None:
+                body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _body(self) -> bytes:
+                length = int(self.headers.get("Content-Length") or 0)
+                return self.rfile.read(length) if length else b""
+
+            def do_POST(self):
+                path = self.path.split("?")[0]
+                body = self._body()
+                if path.endswith("/chat/completions"):
+                    self._send_json(mock.chat_completion(json.loads(body)))
+                elif path.endswith("/files"):
+                    msg = BytesParser(policy=HTTP).parsebytes(
+                        f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode() + body
+                    )
+                    content = b""
+                    for part in msg.iter_parts():
+                        if part.get_param("name", header="content-disposition") == "file":
+                            content = part.get_payload(decode=True) or b""
+                    file_id = f"file-{uuid.uuid4().hex[:12]}"
+                    mock.files[file_id] = content
+                    self._send_json({"id": file_id, "object": "file", "purpose": "batch", "bytes": len(content)})
+                elif path.endswith("/batches"):
+                    req = json.loads(body)
+                    if req.get("input_file_id") not in mock.files:
+                        self._send_json({"error": {"message": "no such file"}}, status=404)
+                        return
+                    batch_id = f"batch_{uuid.uuid4().hex[:12]}"
+                    mock.batches[batch_id] = {
+                        "id": batch_id,
+                        "object": "batch",
+                        "input_file_id": req["input_file_id"],
+                        "endpoint": req.get("endpoint"),
+                        "status": "validating",
+                        "created_at": time.time(),
+                        "output_file_id": None,
+                        "error_file_id": None,
+                    }
+                    self._send_json(mock.batches[batch_id])
+                else:
+                    self._send_json({"error": {"message": "not found"}}, status=404)
+
+            def do_GET(self):
+                path = self.path.split("?")[0]
+                m = re.search(r"/batches/([^/]+)$", path)
+                if m and m.group(1) in mock.batches:
+                    self._send_json(mock._batch_view(mock.batches[m.group(1)]))
+                    return
+                m = re.search(r"/files/([^/]+)/content$", path)
+                if m and m.group(1) in mock.files:
+                    data = mock.files[m.group(1)]
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/octet-stream")
+                    self.send_header("Content-Length", str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+                    return
+                self._send_json({"error": {"message": "not found"}}, status=404)
+
+        return Handler
+
+
+if __name__ == "__main__":
+    import sys
+
+    logging.basicConfig(level=logging.INFO)
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8765
+    server = MockOpenAIServer(port=port)
+    print(f"mock OpenAI на {server.base_url}")
+    server._server.serve_forever()
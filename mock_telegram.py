@@ -0,0 +1,242 @@
+from __future__ import annotations
+
+import json
+import logging
+import threading
+import time
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl
+
+import httpx
+
+log = logging.getLogger(__name__)
+
+# Локальная заглушка Telegram Bot API для проверок без сети:
+#   POST /bot<token>/<method> — getMe, setWebhook, sendMessage, editMessageText, ...
+# Все вызовы складываются в .calls; deliver_update() шлёт апдейт на вебхук бота
+# так же, как это делает Telegram (с секретом в заголовке).
+#
+# Запуск отдельно: python mock_telegram.py [порт], затем TELEGRAM_API_BASE_URL=http://127.0.0.1:порт
+
+BOT_USER = {"id": 100500, "is_bot": True, "first_name": "Mock", "username": "mock_tender_bot"}
+USER = {"id": 1, "is_bot": False, "first_name": "Tester"}
+
+
+def _parse_params(content_type: str, body: bytes) -> Dict[str, Any]:
+    """
+    PTB шлёт параметры формой (сложные значения — JSON-строкой), файлы — multipart.
+    """
+    if content_type.startswith("multipart/form-data"):
+        msg = BytesParser(policy=HTTP).parsebytes(f"Content-Type: {content_type}\r\n\r\n".encode() + body)
+        params: Dict[str, Any] = {}
+        for part in msg.iter_parts():
+            name = part.get_param("name", header="content-disposition")
+            payload = part.get_payload(decode=True) or b""
+            if part.get_filename():
+                params[name] = {"filename": part.get_filename(), "size": len(payload)}
+            else:
+                params[name] = payload.decode("utf-8")
+        return params
+    if content_type.startswith("application/json"):
+        return json.loads(body or b"{}")
+    return dict(parse_qsl(body.decode("utf-8"), keep_blank_values=True))
+
+
+class MockTelegramServer:
+    """
+    retry_after_every — каждый N-й sendMessage отвечает 429 с retry_after
+    (проверка флуд-контроля планировщика отправки).
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        retry_after_every: int = 0,
+        retry_after: int = 1,
+    ) -> None:
+        self.retry_after_every = retry_after_every
+        self.retry_after = retry_after
+        self.calls: List[Tuple[str, Dict[str, Any]]] = []
+        self.webhook_url = ""
+        self.webhook_secret = ""
+        self._message_id = 0
+        self._update_id = 0
+        self._sends = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "MockTelegramServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "MockTelegramServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def calls_of(self, method: str) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [params for name, params in self.calls if name == method]
+
+    # ---------- эмуляция ----------
+
+    def _message(self, params: Dict[str, Any], message_id: Optional[int] = None) -> dict:
+        with self._lock:
+            if message_id is None:
+                self._message_id += 1
+                message_id = self._message_id
+        chat_id = int(params.get("chat_id") or USER["id"])
+        message = {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "group"},
+            "from": BOT_USER,
+        }
+        if "text" in params:
+            message["text"] = params["text"]
+        if "document" in params:
+            document = params["document"]
+            message["document"] = {
+                "file_id": f"doc{message_id}",
+                "file_unique_id": f"doc{message_id}",
+                "file_name": document.get("filename") if isinstance(document, dict) else None,
+                "file_size": document.get("size") if isinstance(document, dict) else None,
+            }
+        return message
+
+    def call(self, method: str, params: Dict[str, Any]) -> Tuple[int, dict]:
+        with self._lock:
+            self.calls.append((method, params))
+        if method == "getMe":
+            return 200, {"ok": True, "result": BOT_USER}
+        if method == "setWebhook":
+            self.webhook_url = params.get("url", "")
+            self.webhook_secret = params.get("secret_token", "")
+            return 200, {"ok": True, "result": True, "description": "Webhook was set"}
+        if method == "deleteWebhook":
+            self.webhook_url = ""
+            return 200, {"ok": True, "result": True}
+        if method in ("sendMessage", "sendDocument"):
+            with self._lock:
+                self._sends += 1
+                flood = self.retry_after_every and self._sends % self.retry_after_every == 0
+            if flood:
+                return 429, {
+                    "ok": False,
+                    "error_code": 429,
+                    "description": f"Too Many Requests: retry after {self.retry_after}",
+                    "parameters": {"retry_after": self.retry_after},
+                }
+            return 200, {"ok": True, "result": self._message(params)}
+        if method in ("editMessageText", "editMessageReplyMarkup"):
+            return 200, {"ok": True, "result": self._message(params, int(params.get("message_id") or 0))}
+        # answerCallbackQuery, setMyCommands и прочее
+        return 200, {"ok": True, "result": True}
+
+    def next_update_id(self) -> int:
+        with self._lock:
+            self._update_id += 1
+            return self._update_id
+
+    def text_update(self, text: str, chat_id: int = USER["id"]) -> dict:
+        update_id = self.next_update_id()
+        message = {
+            "message_id": 10_000 + update_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": USER,
+            "text": text,
+        }
+        if text.startswith("/"):
+            command = text.split()[0]
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(command)}]
+        return {"update_id": update_id, "message": message}
+
+    def callback_update(self, data: str, message_id: int, chat_id: int = USER["id"]) -> dict:
+        update_id = self.next_update_id()
+        return {
+            "update_id": update_id,
+            "callback_query": {
+                "id": str(update_id),
+                "from": USER,
+                "chat_instance": "mock",
+                "data": data,
+                "message": {
+                    "message_id": message_id,
+                    "date": int(time.time()),
+                    "chat": {"id": chat_id, "type": "private"},
+                    "from": BOT_USER,
+                    "text": "…",
+                },
+            },
+        }
+
+    def deliver_update(self, update: dict, secret: Optional[str] = None, url: Optional[str] = None) -> int:
+        """
+        Шлём апдейт на вебхук бота, как Telegram; возвращаем HTTP-статус ответа.
+        """
+        resp = httpx.post(
+            url or self.webhook_url,
+            json=update,
+            headers={"X-Telegram-Bot-Api-Secret-Token": self.webhook_secret if secret is None else secret},
+            timeout=10,
+        )
+        return resp.status_code
+
+    def _handler_class(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, fmt, *args):
+                log.debug("mock_telegram: " + fmt, *args)
+
+            def _send_json(self, data: dict, status: int = 200) -> None:
+                body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                path = self.path.split("?")[0]
+                # /bot<token>/<method>
+                parts = path.strip("/").split("/")
+                if len(parts) != 2 or not parts[0].startswith("bot"):
+                    self._send_json({"ok": False, "error_code": 404, "description": "Not Found"}, status=404)
+                    return
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                params = _parse_params(self.headers.get("Content-Type") or "", body)
+                status, data = mock.call(parts[1], params)
+                self._send_json(data, status=status)
+
+            do_GET = do_POST
+
+        return Handler
+
+
+if __name__ == "__main__":
+    import sys
+
+    logging.basicConfig(level=logging.INFO)
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8081
+    server = MockTelegramServer(port=port)
+    print(f"mock Telegram на {server.base_url}")
+    server._server.serve_forever()
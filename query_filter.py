@@ -0,0 +1,456 @@
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Маленький язык запросов для ключевых слов / исключений / города.
+#
+#   узел учета                 — фраза (как раньше: подстрока в тексте)
+#   "узел учета" AND газ       — И (внутри выражения можно и через пробел: сикг (газ OR нефть))
+#   сикг OR сикн               — ИЛИ
+#   газ NOT ремонт, газ -ремонт — НЕ
+#   (сикг OR сикн) AND газ     — скобки
+#   title:ремонт               — только в названии (поля: title, text, city)
+#   датчик NEAR/3 давления     — слова не дальше 3 слов друг от друга
+#   "шкаф автоматики"~2        — слова фразы в окне с допуском 2 слова
+#
+# Список через запятую (как его вводят в text_router) — это ИЛИ элементов
+# для ключевых слов и «хотя бы один» для исключений, т.е. старые настройки
+# работают без изменений.
+#
+# Выражением элемент считается, только если в нём есть оператор: AND, OR, NOT,
+# NEAR/n, &, |, -слово, поле: или фраза с допуском "…"~n. Иначе — как до языка
+# запросов: подстрока целиком, а кавычки и скобки — обычные символы
+# (ООО "Газпром", КИПиА (монтаж)). Так же разбирается и фильтр по городу.
+
+Matcher = Callable[["_Doc"], bool]
+
+FIELD_ALIASES = {
+    "title": "title",
+    "название": "title",
+    "text": "text",
+    "текст": "text",
+    "city": "geo",
+    "город": "geo",
+}
+
+# OR из стольких простых слов склеиваем в одну регулярку
+_REGEX_OR_MIN = 3
+
+_TOKEN_RE = re.compile(
+    r"""
+    (?P<ws>\s+)
+  | (?P<lparen>\()
+  | (?P<rparen>\))
+  | (?P<phrase>"(?P<phrase_text>[^"]*)"(?:~(?P<slop>\d+))?)
+  | (?P<near>NEAR/(?P<near_n>\d+)(?=[\s("]|$))
+  | (?P<op>(?:AND|OR|NOT)(?=[\s("]|$)|&|\|)
+  | (?P<field>(?P<field_name>\w+):)
+  | (?P<word>[^\s()"]+)
+    """,
+    re.X,
+)
+
+
+class QuerySyntaxError(ValueError):
+    pass
+
+
+# ================== РАЗБОР ==================
+
+
+def _tokenize(query: str) -> List[Tuple[str, object]]:
+    tokens: List[Tuple[str, object]] = []
+    pos = 0
+    while pos < len(query):
+        m = _TOKEN_RE.match(query, pos)
+        if not m:
+            raise QuerySyntaxError(f"непонятный символ в позиции {pos + 1}: {query[pos]!r}")
+        pos = m.end()
+        kind = m.lastgroup
+        if kind == "ws":
+            continue
+        if kind in ("lparen", "rparen"):
+            tokens.append((kind, None))
+        elif kind == "phrase":
+            text = m.group("phrase_text").strip().lower()
+            if not text:
+                raise QuerySyntaxError("пустая фраза в кавычках")
+            slop = m.group("slop")
+            tokens.append(("phrase", (text, int(slop) if slop is not None else None)))
+        elif kind == "near":
+            tokens.append(("near", int(m.group("near_n"))))
+        elif kind == "op":
+            op = {"&": "AND", "|": "OR"}.get(m.group("op"), m.group("op"))
+            tokens.append((op, None))
+        elif kind == "field":
+            name = m.group("field_name").lower()
+            if name in FIELD_ALIASES:
+                tokens.append(("field", FIELD_ALIASES[name]))
+            else:
+                # "ооо:" и прочее — просто слово с двоеточием
+                tokens.append(("word", m.group("field").lower()))
+        else:
+            word = m.group("word").lower()
+            if word.startswith("-") and len(word) > 1:
+                tokens.append(("NOT", None))
+                word = word[1:]
+            tokens.append(("word", word))
+    return tokens
+
+
+class _Parser:
+    """
+    Рекурсивный спуск, приоритет: OR < AND (в т.ч. неявный) < NOT < NEAR < атом.
+    Подряд идущие «голые» слова склеиваются во фразу — так старые
+    ключевые фразы вида «узел учета» не превращаются в И по словам.
+    """
+
+    def __init__(self, tokens: List[Tuple[str, object]]) -> None:
+        self.tokens = tokens
+        self.pos = 0
+
+    def _peek(self) -> Optional[str]:
+        return self.tokens[self.pos][0] if self.pos < len(self.tokens) else None
+
+    def _next(self) -> Tuple[str, object]:
+        tok = self.tokens[self.pos]
+        self.pos += 1
+        return tok
+
+    def parse(self) -> tuple:
+        if not self.tokens:
+            raise QuerySyntaxError("пустое выражение")
+        node = self._or()
+        if self.pos != len(self.tokens):
+            raise QuerySyntaxError("лишняя закрывающая скобка или оператор")
+        return node
+
+    def _or(self) -> tuple:
+        items = [self._and()]
+        while self._peek() == "OR":
+            self._next()
+            items.append(self._and())
+        return items[0] if len(items) == 1 else ("or", items)
+
+    def _and(self) -> tuple:
+        items = [self._not()]
+        while True:
+            kind = self._peek()
+            if kind == "AND":
+                self._next()
+                items.append(self._not())
+            elif kind in ("word", "phrase", "lparen", "NOT", "field"):
+                items.append(self._not())
+            else:
+                break
+        return items[0] if len(items) == 1 else ("and", items)
+
+    def _not(self) -> tuple:
+        if self._peek() == "NOT":
+            self._next()
+            return ("not", self._not())
+        return self._near()
+
+    def _near(self) -> tuple:
+        node = self._atom()
+        while self._peek() == "near":
+            _, distance = self._next()
+            right = self._atom()
+            for side in (node, right):
+                if side[0] not in ("term", "near") or side[0] == "near" and side[2] != distance:
+                    raise QuerySyntaxError("NEAR работает только между словами и фразами")
+            left_seqs = node[1] if node[0] == "near" else [node[1]]
+            node = ("near", left_seqs + [right[1]], distance)
+        return node
+
+    def _atom(self) -> tuple:
+        kind = self._peek()
+        if kind is None:
+            raise QuerySyntaxError("выражение оборвалось")
+        if kind == "lparen":
+            self._next()
+            node = self._or()
+            if self._peek() != "rparen":
+                raise QuerySyntaxError("не закрыта скобка")
+            self._next()
+            return node
+        if kind == "field":
+            _, name = self._next()
+            return ("field", name, self._atom())
+        if kind == "phrase":
+            _, (text, slop) = self._next()
+            if slop is not None:
+                return ("near", [(w,) for w in text.split()], slop)
+            return ("term", tuple(text.split()))
+        if kind == "word":
+            words = []
+            while self._peek() == "word":
+                words.append(self._next()[1])
+            return ("term", tuple(words))
+        raise QuerySyntaxError(f"ожидалось слово, а встретился {kind}")
+
+
+def parse_query(query: str) -> tuple:
+    return _Parser(_tokenize(query)).parse()
+
+
+def is_query(item: str) -> bool:
+    """
+    Есть ли в элементе операторы языка запросов (см. шапку модуля);
+    без них элемент ищется подстрокой, как раньше.
+    """
+    try:
+        tokens = _tokenize(item)
+    except QuerySyntaxError:
+        # одиночная кавычка и т.п. — ищем как есть, но если оператор был, разбор скажет, что не так
+        tokens = [(kind, None) for kind in ("AND", "OR", "NOT") if re.search(rf"\b{kind}\b", item)]
+    for kind, value in tokens:
+        if kind in ("AND", "OR", "NOT", "near", "field"):
+            return True
+        if kind == "phrase" and value[1] is not None:
+            return True
+    return False
+
+
+def split_query_list(text: str) -> List[str]:
+    """
+    Режем ввод пользователя по запятым верхнего уровня
+    (запятые внутри кавычек и скобок не трогаем).
+    """
+    items: List[str] = []
+    buf: List[str] = []
+    depth = 0
+    in_quotes = False
+    for ch in text or "":
+        if ch == '"':
+            in_quotes = not in_quotes
+        elif not in_quotes and ch == "(":
+            depth += 1
+        elif not in_quotes and ch == ")":
+            depth = max(depth - 1, 0)
+        if ch == "," and not in_quotes and depth == 0:
+            items.append("".join(buf))
+            buf = []
+        else:
+            buf.append(ch)
+    items.append("".join(buf))
+    return [i.strip() for i in items if i.strip()]
+
+
+def validate_query_list(items: Sequence[str]) -> Optional[str]:
+    """
+    Возвращает текст ошибки для первого битого выражения или None.
+    Элементы без операторов — подстроки, в них ошибаться нечему.
+    """
+    for item in items:
+        if not is_query(item):
+            continue
+        try:
+            parse_query(item)
+        except QuerySyntaxError as e:
+            return f"«{item}»: {e}"
+    return None
+
+
+# ================== КОМПИЛЯЦИЯ ==================
+
+
+class _Doc:
+    """
+    Один блок тендера. Нижний регистр и разбиение на слова считаем лениво
+    и только один раз — сколько бы выражений ни проверяли.
+    """
+
+    __slots__ = ("title", "body", "city", "region", "_fields", "_words")
+
+    def __init__(self, title: str, body: str, city: Optional[str], region: Optional[str]) -> None:
+        self.title = title or ""
+        self.body = body or ""
+        self.city = city or ""
+        self.region = region or ""
+        self._fields: Dict[str, str] = {}
+        self._words: Dict[str, List[str]] = {}
+
+    def field(self, name: str) -> str:
+        value = self._fields.get(name)
+        if value is None:
+            if name == "title":
+                value = self.title.lower()
+            elif name == "text":
+                value = f"{self.title}\n{self.body}".lower()
+            else:
+                value = " ".join([self.city.lower(), self.region.lower(), self.field("text")])
+            self._fields[name] = value
+        return value
+
+    def words(self, name: str) -> List[str]:
+        value = self._words.get(name)
+        if value is None:
+            value = re.findall(r"\w+", self.field(name))
+            self._words[name] = value
+        return value
+
+
+def _starts(words: List[str], seq: Tuple[str, ...]) -> List[int]:
+    n = len(seq)
+    return [
+        i
+        for i in range(len(words) - n + 1)
+        if all(words[i + k].startswith(seq[k]) for k in range(n))
+    ]
+
+
+def _within(words: List[str], seqs: List[Tuple[str, ...]], slop: int) -> bool:
+    """
+    Есть ли окно, где встречаются все seqs, а «лишних» слов между ними <= slop.
+    Классический минимальный покрывающий отрезок по отсортированным позициям.
+    """
+    hits: List[Tuple[int, int]] = []
+    for idx, seq in enumerate(seqs):
+        starts = _starts(words, seq)
+        if not starts:
+            return False
+        hits.extend((pos, idx) for pos in starts)
+    hits.sort()
+
+    need = len(seqs)
+    counts: Dict[int, int] = {}
+    have = 0
+    left = 0
+    payload = sum(len(s) for s in seqs)
+    for pos, idx in hits:
+        counts[idx] = counts.get(idx, 0) + 1
+        if counts[idx] == 1:
+            have += 1
+        while have == need:
+            start, first_idx = hits[left]
+            span = pos + len(seqs[idx]) - start
+            if span - payload <= slop:
+                return True
+            counts[first_idx] -= 1
+            if counts[first_idx] == 0:
+                have -= 1
+            left += 1
+    return False
+
+
+def _term_text(node: tuple) -> str:
+    return " ".join(node[1])
+
+
+def _compile(node: tuple, field: str) -> Matcher:
+    kind = node[0]
+
+    if kind == "field":
+        return _compile(node[2], node[1])
+
+    if kind == "term":
+        needle = _term_text(node)
+        return lambda d: needle in d.field(field)
+
+    if kind == "near":
+        seqs = list(node[1])
+        slop = node[2]
+        return lambda d: _within(d.words(field), seqs, slop)
+
+    if kind == "not":
+        inner = _compile(node[1], field)
+        return lambda d: not inner(d)
+
+    if kind == "and":
+        parts = [_compile(n, field) for n in node[1]]
+        return lambda d: all(p(d) for p in parts)
+
+    if kind == "or":
+        plain = [n for n in node[1] if n[0] == "term"]
+        rest = [n for n in node[1] if n[0] != "term"]
+        parts: List[Matcher] = []
+        if len(plain) >= _REGEX_OR_MIN:
+            # длинные варианты раньше, чтобы alternation не упиралась в префиксы
+            needles = sorted({_term_text(n) for n in plain}, key=len, reverse=True)
+            rx = re.compile("|".join(re.escape(s) for s in needles))
+            parts.append(lambda d: rx.search(d.field(field)) is not None)
+        else:
+            rest = plain + rest
+        parts.extend(_compile(n, field) for n in rest)
+        if len(parts) == 1:
+            return parts[0]
+        return lambda d: any(p(d) for p in parts)
+
+    raise QuerySyntaxError(f"неизвестный узел {kind}")
+
+
+def _parse_or_literal(item: str) -> tuple:
+    """
+    Элемент без операторов — подстрока целиком, как до языка запросов.
+    Сохранённое раньше битое выражение тоже ищем как есть, подстрокой.
+    """
+    literal = ("term", (item.strip().lower(),))
+    if not is_query(item):
+        return literal
+    try:
+        return parse_query(item)
+    except QuerySyntaxError:
+        return literal
+
+
+@dataclass(frozen=True)
+class CompiledFilters:
+    include: Optional[Matcher]
+    exclude: Optional[Matcher]
+    city: Optional[Matcher]
+
+    def matches(
+        self,
+        title: str,
+        body: str,
+        city: Optional[str] = None,
+        region: Optional[str] = None,
+    ) -> bool:
+        doc = _Doc(title, body, city, region)
+        if self.include is not None and not self.include(doc):
+            return False
+        if self.exclude is not None and self.exclude(doc):
+            return False
+        if self.city is not None and not self.city(doc):
+            return False
+        return True
+
+
+@lru_cache(maxsize=16)
+def _compile_filters_cached(
+    include: Tuple[str, ...],
+    exclude: Tuple[str, ...],
+    city: str,
+) -> CompiledFilters:
+    def compile_list(items: Tuple[str, ...], field: str) -> Optional[Matcher]:
+        nodes = [_parse_or_literal(i) for i in items if i.strip()]
+        if not nodes:
+            return None
+        node = nodes[0] if len(nodes) == 1 else ("or", nodes)
+        return _compile(node, field)
+
+    return CompiledFilters(
+        include=compile_list(include, "text"),
+        exclude=compile_list(exclude, "text"),
+        city=compile_list((city,) if city else (), "geo"),
+    )
+
+
+def compile_filters(
+    include: Optional[Sequence[str]],
+    exclude: Optional[Sequence[str]],
+    city: Optional[str],
+) -> CompiledFilters:
+    """
+    Компилируем настройки фильтра в один матчер. Результат кэшируется
+    по значениям настроек: пока конфиг не поменяли, компиляция не повторяется.
+    """
+    return _compile_filters_cached(
+        tuple(str(w) for w in (include or []) if str(w).strip()),
+        tuple(str(w) for w in (exclude or []) if str(w).strip()),
+        (city or "").strip(),
+    )
@@ -0,0 +1,179 @@
+from __future__ import annotations
+
+import logging
+import math
+import os
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from threading import Lock
+from typing import Any, Dict, List, Optional
+
+log = logging.getLogger(__name__)
+
+# Результаты запусков держим в памяти: листать их можно мгновенно,
+# без повторного парсинга Ростендера и вызовов ИИ.
+RESULTS_TTL = float(os.getenv("RESULTS_TTL_SECONDS", str(6 * 3600)) or 6 * 3600)
+RESULTS_PER_CHAT = int(os.getenv("RESULTS_PER_CHAT", "3") or 3)
+RESULTS_MAX_CHATS = int(os.getenv("RESULTS_MAX_CHATS", "200") or 200)
+# карточки короткие, но 5 штук с длинными причинами ещё влезают в 4096 символов
+RESULTS_PAGE_SIZE = int(os.getenv("RESULTS_PAGE_SIZE", "5") or 5)
+
+# разделы результата
+KIND_MATCHED = "m"     # подходящие (ИИ или локальный фильтр без ИИ)
+KIND_REJECTED = "r"    # отклонённые ИИ, с причиной
+KIND_LOCAL = "l"       # кандидаты локального фильтра, до ИИ не дошедшие
+KIND_SEEN = "d"        # уже присланные в этот чат раньше — в запуске пропущены
+
+KIND_TITLES = {
+    KIND_MATCHED: "✅ Подходящие",
+    KIND_REJECTED: "❌ Отклонённые ИИ",
+    KIND_LOCAL: "🟡 Кандидаты без проверки ИИ",
+    KIND_SEEN: "👁 Уже присылал",
+}
+# порядок разделов в кнопках и выгрузке
+KIND_ORDER = (KIND_MATCHED, KIND_REJECTED, KIND_LOCAL, KIND_SEEN)
+
+
+@dataclass
+class ResultItem:
+    """
+    Снимок тендера для выдачи: поля названы как у Tender, чтобы
+    форматтеры карточек работали с ним так же.
+    """
+    number: str
+    title: str
+    url: str = ""
+    price_raw: Any = None
+    end_datetime: Optional[datetime] = None
+    city: str = ""
+    region: str = ""
+    published: Optional[date] = None
+    reason: str = ""
+    confidence: Optional[float] = None
+    local_only: bool = False
+    # из локального фильтра МЦЭ, если тендер через него проходил
+    priority: Optional[int] = None
+    keywords: List[str] = field(default_factory=list)
+
+    @classmethod
+    def from_tender(
+        cls,
+        t: Any,
+        reason: str = "",
+        confidence: Optional[float] = None,
+        local_only: bool = False,
+        local: Any = None,
+    ) -> "ResultItem":
+        return cls(
+            number=getattr(t, "number", "") or "",
+            title=getattr(t, "title", "") or "",
+            url=getattr(t, "url", "") or "",
+            price_raw=getattr(t, "price_raw", None) or getattr(t, "price", None),
+            end_datetime=getattr(t, "end_datetime", None),
+            city=getattr(t, "city", "") or "",
+            region=getattr(t, "region", "") or "",
+            published=getattr(t, "published", None),
+            reason=reason or "",
+            confidence=confidence,
+            local_only=local_only,
+            priority=getattr(local, "priority_level", None),
+            keywords=sorted(getattr(local, "matched_keywords", []) or []),
+        )
+
+
+@dataclass
+class ResultSet:
+    run_id: str
+    chat_id: int
+    created: float = field(default_factory=time.monotonic)
+    summary: str = ""
+    # фоновая проверка по расписанию и с какими настройками фильтра — для выдачи по кнопке без обхода
+    scheduled: bool = False
+    filters_key: str = ""
+    sections: Dict[str, List[ResultItem]] = field(
+        default_factory=lambda: {kind: [] for kind in KIND_ORDER}
+    )
+
+    def add(self, kind: str, item: ResultItem) -> None:
+        self.sections[kind].append(item)
+
+    def count(self, kind: str) -> int:
+        return len(self.sections.get(kind) or ())
+
+    def pages(self, kind: str, page_size: int = RESULTS_PAGE_SIZE) -> int:
+        return max(1, math.ceil(self.count(kind) / page_size))
+
+    def page(self, kind: str, page: int, page_size: int = RESULTS_PAGE_SIZE) -> List[ResultItem]:
+        items = self.sections.get(kind) or []
+        start = page * page_size
+        return items[start:start + page_size]
+
+
+class ResultsCache:
+    """
+    LRU по чатам и по запускам внутри чата + TTL.
+    Обращения идут из event loop, но лочимся на случай вызова из потоков.
+    """
+
+    def __init__(
+        self,
+        ttl: float = RESULTS_TTL,
+        per_chat: int = RESULTS_PER_CHAT,
+        max_chats: int = RESULTS_MAX_CHATS,
+    ) -> None:
+        self.ttl = ttl
+        self.per_chat = max(per_chat, 1)
+        self.max_chats = max(max_chats, 1)
+        self._lock = Lock()
+        self._chats: "OrderedDict[int, OrderedDict[str, ResultSet]]" = OrderedDict()
+
+    def new(self, chat_id: int) -> ResultSet:
+        return ResultSet(run_id=uuid.uuid4().hex[:8], chat_id=chat_id)
+
+    def put(self, result: ResultSet) -> None:
+        with self._lock:
+            runs = self._chats.pop(result.chat_id, None) or OrderedDict()
+            runs[result.run_id] = result
+            while len(runs) > self.per_chat:
+                runs.popitem(last=False)
+            self._chats[result.chat_id] = runs
+            while len(self._chats) > self.max_chats:
+                self._chats.popitem(last=False)
+
+    def get(self, chat_id: int, run_id: str) -> Optional[ResultSet]:
+        with self._lock:
+            runs = self._chats.get(chat_id)
+            if not runs:
+                return None
+            result = runs.get(run_id)
+            if result is None:
+                return None
+            if time.monotonic() - result.created > self.ttl:
+                del runs[run_id]
+                if not runs:
+                    del self._chats[chat_id]
+                return None
+            runs.move_to_end(run_id)
+            self._chats.move_to_end(chat_id)
+            return result
+
+    def latest(self, chat_id: int) -> Optional[ResultSet]:
+        with self._lock:
+            runs = self._chats.get(chat_id)
+            run_id = next(reversed(runs), None) if runs else None
+        return self.get(chat_id, run_id) if run_id else None
+
+
+_cache: Optional[ResultsCache] = None
+_cache_lock = Lock()
+
+
+def get_results_cache() -> ResultsCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResultsCache()
+        return _cache
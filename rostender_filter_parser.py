@@ -4,18 +4,18 @@ import logging
 import os
 import re
 from datetime import datetime, date, timedelta
-from typing import List, Optional, Dict
-
-import requests
-from bs4 import BeautifulSoup
-from dotenv import load_dotenv
+from threading import Event
+from typing import TYPE_CHECKING, List, Optional, Dict
 
+import run_profile
+from metrics import ROSTENDER_BYTES, ROSTENDER_REQUESTS
+from query_filter import CompiledFilters, compile_filters
 from rostender_parser import Tender
 
-log = logging.getLogger(__name__)
+if TYPE_CHECKING:
+    import requests
 
-# Загружаем .env, чтобы подхватить ROSTENDER_FILTER_URL
-load_dotenv()
+log = logging.getLogger(__name__)
 
 # Если в .env есть готовый URL расширенного поиска (с query),
 # используем его. Иначе — базовый advanced без фильтров.
@@ -41,6 +41,9 @@ def _get_search_html(
     page=1 — base_url как есть.
     page>1 — аккуратно добавляем/обновляем параметр page=N.
     """
+    # requests и bs4 (~100 мс импорта) грузим при первом обходе, а не при старте бота
+    import requests
+
     sess = session or requests.Session()
 
     if page <= 1:
@@ -52,7 +55,16 @@ def _get_search_html(
         url = f"{url}{sep}page={page}"
 
     log.info("Запрашиваю страницу Ростендера: %s", url)
-    resp = sess.get(url, headers=HEADERS, timeout=30)
+    with run_profile.stage("catalog_fetch"):
+        try:
+            resp = sess.get(url, headers=HEADERS, timeout=30)
+        except requests.RequestException:
+            ROSTENDER_REQUESTS.inc("catalog", "error")
+            raise
+    ROSTENDER_REQUESTS.inc("catalog", "ok" if resp.ok else "error")
+    ROSTENDER_BYTES.inc("catalog", value=len(resp.content))
+    run_profile.add("catalog_requests")
+    run_profile.add("catalog_bytes", len(resp.content))
     resp.raise_for_status()
     return resp.text
 
@@ -122,66 +134,71 @@ def _matches_basic_filters(
     body: str,
     city: Optional[str],
     region: Optional[str],
-    include_words: list[str],
-    exclude_words: list[str],
-    city_filter: Optional[str],
+    filters: CompiledFilters,
 ) -> bool:
     """
-    Локальная фильтрация:
-    - include_words (если заданы) — хотя бы одно вхождение;
-    - exclude_words — ни одного вхождения;
-    - city_filter (если задан) должен встречаться в городе/регионе/тексте.
+    Локальная фильтрация скомпилированным выражением (см. query_filter):
+    - ключевые слова (если заданы) — хотя бы одно выражение истинно;
+    - исключения — ни одно выражение не истинно;
+    - город (если задан) должен встречаться в городе/регионе/тексте.
 
     ВАЖНО: Этап 'приём заявок' здесь больше НЕ проверяем — считаем,
     что он уже настроен в самом URL расширенного поиска Ростендера.
     """
-    text = f"{title}\n{body}".lower()
-
-    # Положительные слова (если заданы) — хотя бы одно
-    if include_words and not any(w in text for w in include_words):
-        return False
-
-    # Исключения — ни одно не должно встречаться
-    if exclude_words and any(w in text for w in exclude_words):
-        return False
-
-    # Фильтр по городу
-    if city_filter:
-        geo_text = " ".join(
-            [
-                (city or "").lower(),
-                (region or "").lower(),
-                text,
-            ]
-        )
-        if city_filter not in geo_text:
-            return False
-
-    return True
+    return filters.matches(title, body, city, region)
 
 
 def _fill_details(
     tenders: List[Tender],
     session: Optional[requests.Session] = None,
+    cancel: Optional[Event] = None,
 ) -> None:
     """
     Для каждого тендера заходим по ссылке и выдёргиваем detail_text.
+    Если выставлен cancel — прекращаем между запросами.
     """
+    import requests
+    from bs4 import BeautifulSoup
+
     sess = session or requests.Session()
     for t in tenders:
+        if cancel is not None and cancel.is_set():
+            log.info("Загрузка деталей отменена")
+            return
         if not t.url:
             continue
         try:
             log.info("Загружаю детали тендера %s: %s", t.number, t.url)
-            resp = sess.get(t.url, headers=HEADERS, timeout=30)
-            resp.raise_for_status()
-            soup = BeautifulSoup(resp.text, "html.parser")
-            detail_text = soup.get_text("\n", strip=True)
+            with run_profile.stage("details"):
+                resp = sess.get(t.url, headers=HEADERS, timeout=30)
+                run_profile.add("detail_requests")
+                run_profile.add("detail_bytes", len(resp.content))
+                ROSTENDER_BYTES.inc("detail", value=len(resp.content))
+                resp.raise_for_status()
+                soup = BeautifulSoup(resp.text, "html.parser")
+                detail_text = soup.get_text("\n", strip=True)
             setattr(t, "detail_text", detail_text)
+            ROSTENDER_REQUESTS.inc("detail", "ok")
         except Exception as e:
+            ROSTENDER_REQUESTS.inc("detail", "error")
             log.warning("Не удалось загрузить детали тендера %s: %s", t.number, e)
 
 
+def fill_details(tenders: List[Tender], cancel: Optional[Event] = None) -> None:
+    """
+    Догружает detail_text только для переданных тендеров.
+    Нужен, когда список забрали с with_details=False и детали
+    тянем уже после дедупликации и локального отбора.
+    """
+    todo = [t for t in tenders if not t.detail_text]
+    if not todo:
+        return
+    log.info("Загружаю детали для %d тендеров…", len(todo))
+    import requests
+
+    _fill_details(todo, session=requests.Session(), cancel=cancel)
+
+
 def fetch_rostender_tenders_filtered(
     days: int = 3,
     max_pages: int = 2,
@@ -189,21 +206,27 @@ def fetch_rostender_tenders_filtered(
     include_words: Optional[List[str]] = None,
     exclude_words: Optional[List[str]] = None,
     city_filter: Optional[str] = None,
+    cancel: Optional[Event] = None,
 ) -> List[Tender]:
     """
     Парсит тендеры по сохранённому расширенному поиску Ростендера
     (ROSTENDER_FILTER_URL из .env) и дополнительно фильтрует:
-      - include_words / exclude_words,
+      - include_words / exclude_words (выражения query_filter, список = ИЛИ),
       - city_filter,
       - дата публикации за последние `days` дней.
+    cancel — событие отмены: проверяется между страницами и запросами деталей,
+    при отмене возвращаем то, что успели собрать.
     """
 
-    include_words = [w.strip().lower() for w in (include_words or []) if w.strip()]
-    exclude_words = [w.strip().lower() for w in (exclude_words or []) if w.strip()]
-    city_filter_norm = city_filter.strip().lower() if city_filter else None
+    # компилируется один раз на версию настроек и переиспользуется
+    # для всех блоков всех страниц
+    filters = compile_filters(include_words, exclude_words, city_filter)
 
     base_url = ROSTENDER_FILTER_URL
 
+    import requests
+    from bs4 import BeautifulSoup
+
     today = date.today()
     min_date = today - timedelta(days=days)
 
@@ -211,9 +234,13 @@ def fetch_rostender_tenders_filtered(
     tenders_by_number: Dict[str, Tender] = {}
 
     for page in range(1, max_pages + 1):
+        if cancel is not None and cancel.is_set():
+            log.info("Обход Ростендера отменён на странице %s", page)
+            break
         html = _get_search_html(base_url, page=page, session=sess)
-        soup = BeautifulSoup(html, "html.parser")
-        text = soup.get_text("\n", strip=True)
+        with run_profile.stage("catalog_parse"):
+            soup = BeautifulSoup(html, "html.parser")
+            text = soup.get_text("\n", strip=True)
 
         raw_blocks = 0
         added_this_page = 0
@@ -250,9 +277,7 @@ def fetch_rostender_tenders_filtered(
                 body=body,
                 city=city,
                 region=region,
-                include_words=include_words,
-                exclude_words=exclude_words,
-                city_filter=city_filter_norm,
+                filters=filters,
             ):
                 continue
 
@@ -274,6 +299,7 @@ def fetch_rostender_tenders_filtered(
             tenders_by_number[number] = tender
             added_this_page += 1
 
+        run_profile.add("blocks", raw_blocks)
         log.info(
             "Страница %s: сырых блоков: %d, прошло фильтр: %d, всего уникальных: %d",
             page,
@@ -293,7 +319,7 @@ def fetch_rostender_tenders_filtered(
 
     if with_details and results:
         log.info("Загружаю детали для %d тендеров…", len(results))
-        _fill_details(results, session=sess)
+        _fill_details(results, session=sess, cancel=cancel)
 
     results.sort(key=lambda t: (t.published, t.number), reverse=True)
     log.info(
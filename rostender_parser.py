@@ -4,10 +4,10 @@ import re
 import logging
 from dataclasses import dataclass
 from datetime import datetime, date, timedelta
-from typing import List, Optional, Dict
+from typing import TYPE_CHECKING, List, Optional, Dict
 
-import requests
-from bs4 import BeautifulSoup
+if TYPE_CHECKING:
+    import requests
 
 log = logging.getLogger(__name__)
 
@@ -46,6 +46,9 @@ def _get_html(
     Загружает страницу каталога Ростендера.
     page=1 — первая страница, page=2 — вторая и т.д.
     """
+    # requests и bs4 тянем при первом обходе, а не при импорте: Tender нужен и без сети
+    import requests
+
     sess = session or requests.Session()
 
     params = {}
@@ -134,6 +137,9 @@ def _fill_details(
     """
     Для каждого тендера заходим по ссылке t.url и вытаскиваем более детальный текст.
     """
+    import requests
+    from bs4 import BeautifulSoup
+
     sess = session or requests.Session()
     for t in tenders:
         if not t.url:
@@ -168,6 +174,9 @@ def fetch_rostender_tenders(
     Если with_details=True — дополнительно заходим в каждый тендер по t.url и тянем detail_text.
     """
 
+    import requests
+    from bs4 import BeautifulSoup
+
     today = date.today()
     min_date = today - timedelta(days=days)
 
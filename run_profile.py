@@ -0,0 +1,260 @@
+from __future__ import annotations
+
+import cProfile
+import logging
+import math
+import os
+import pstats
+import sys
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from threading import Lock
+from typing import Any, Callable, Dict, Iterator, List, Optional, TypeVar
+
+from json_store import data_path, read_json, write_json_atomic
+from metrics import STAGE_SECONDS
+
+log = logging.getLogger(__name__)
+
+# Профиль запуска: время по этапам и счётчики (запросы, байты, блоки, токены).
+#
+# data/run_profiles.json — последние KEEP_PROFILES запусков (для /profile);
+# data/profiles/<run_id>.prof / .tracemalloc — снимки cProfile и памяти,
+# если захват включён (RUN_PROFILE_CAPTURE=1 или «/profile capture» на один запуск).
+#
+# Текущий профиль лежит в ContextVar: asyncio-задачи и asyncio.to_thread копируют
+# контекст, поэтому парсер в рабочем потоке пишет в профиль своего запуска.
+RUN_PROFILE_CAPTURE = os.getenv("RUN_PROFILE_CAPTURE", "0").strip().lower() in ("1", "true", "yes", "on")
+PROFILES_PATH = data_path("run_profiles.json")
+CAPTURE_DIR = data_path("profiles")
+KEEP_PROFILES = 100
+TRACEMALLOC_FRAMES = 10
+
+STAGE_LABELS = {
+    "total": "Весь запуск",
+    "catalog_fetch": "Страницы Ростендера (сеть)",
+    "catalog_parse": "Разбор страниц (BeautifulSoup)",
+    "dedup": "Склейка дублей",
+    "local_filter": "Локальный фильтр МЦЭ",
+    "details": "Карточки тендеров",
+    "gpt": "ИИ",
+    "telegram": "Отправка в Telegram",
+}
+
+COUNTER_LABELS = {
+    "catalog_requests": "запросов страниц",
+    "catalog_bytes": "байт страниц",
+    "blocks": "блоков тендеров",
+    "detail_requests": "запросов карточек",
+    "detail_bytes": "байт карточек",
+    "gpt_tenders": "тендеров в ИИ",
+    "gpt_requests": "запросов к ИИ",
+    "gpt_tokens": "токенов ИИ",
+    "tg_messages": "сообщений",
+}
+
+T = TypeVar("T")
+
+
+@dataclass
+class RunProfile:
+    run_id: str
+    chat_id: Optional[int]
+    started: str
+    stages: Dict[str, float] = field(default_factory=dict)
+    calls: Dict[str, int] = field(default_factory=dict)
+    counters: Dict[str, int] = field(default_factory=dict)
+    capture: Optional[str] = None
+
+    def __post_init__(self) -> None:
+        self._lock = Lock()
+        self._cprofile: Optional[cProfile.Profile] = None
+        self._thread_stats: List[cProfile.Profile] = []
+
+    def add_time(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+            self.calls[name] = self.calls.get(name, 0) + 1
+
+    def add(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def to_dict(self) -> dict:
+        data = asdict(self)
+        data["stages"] = {k: round(v, 4) for k, v in self.stages.items()}
+        return data
+
+
+_current: ContextVar[Optional[RunProfile]] = ContextVar("run_profile", default=None)
+# чаты, попросившие захват cProfile/tracemalloc для следующего запуска
+_capture_next: set = set()
+_store_lock = Lock()
+
+
+def current() -> Optional[RunProfile]:
+    return _current.get()
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """
+    Замер этапа: всегда — в гистограмму метрик, внутри запуска — ещё и в его профиль.
+    Один этап может встречаться много раз (каждая страница, каждая карточка) — время суммируется.
+    """
+    profile = _current.get()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(name, value=elapsed)
+        if profile is not None:
+            profile.add_time(name, elapsed)
+
+
+def add(name: str, value: int = 1) -> None:
+    profile = _current.get()
+    if profile is not None:
+        profile.add(name, value)
+
+
+def request_capture(chat_id: int) -> None:
+    _capture_next.add(chat_id)
+
+
+def call_profiled(func: Callable[..., T], *args: Any) -> T:
+    """
+    Обёртка для asyncio.to_thread: при захвате cProfile работает и в рабочем
+    потоке (профилировщик Python — на поток), статистика потом сливается с основной.
+    С Python 3.12 cProfile работает через sys.monitoring — один на процесс: профиль
+    основного потока уже видит рабочие потоки, а второй включить нельзя.
+    """
+    profile = _current.get()
+    if profile is None or profile.capture is None or sys.version_info >= (3, 12):
+        return func(*args)
+    prof = cProfile.Profile()
+    try:
+        prof.enable()
+    except ValueError as e:
+        # профилировщик уже активен — считаем без профиля, проверку не роняем
+        log.debug("cProfile в рабочем потоке не включён: %s", e)
+        return func(*args)
+    try:
+        return func(*args)
+    finally:
+        prof.disable()
+        with profile._lock:
+            profile._thread_stats.append(prof)
+
+
+def _start_capture(profile: RunProfile) -> bool:
+    os.makedirs(CAPTURE_DIR, exist_ok=True)
+    profile.capture = os.path.join(CAPTURE_DIR, profile.run_id)
+    started_tracemalloc = not tracemalloc.is_tracing()
+    if started_tracemalloc:
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+    prof = cProfile.Profile()
+    try:
+        prof.enable()
+        profile._cprofile = prof
+    except ValueError as e:
+        # в потоке уже работает другой профилировщик (параллельный захват в другом чате)
+        log.warning("cProfile для запуска %s не включён: %s", profile.run_id, e)
+    return started_tracemalloc
+
+
+def _finish_capture(profile: RunProfile, stop_tracemalloc: bool) -> None:
+    if profile._cprofile is not None:
+        profile._cprofile.disable()
+    try:
+        sources = ([profile._cprofile] if profile._cprofile is not None else []) + profile._thread_stats
+        if sources:
+            stats = pstats.Stats(sources[0])
+            for prof in sources[1:]:
+                stats.add(prof)
+            stats.dump_stats(profile.capture + ".prof")
+        tracemalloc.take_snapshot().dump(profile.capture + ".tracemalloc")
+        log.info("Снимки профиля запуска сохранены: %s.prof / .tracemalloc", profile.capture)
+    except Exception as e:
+        log.warning("Не удалось сохранить снимки профиля %s: %s", profile.run_id, e)
+    finally:
+        if stop_tracemalloc:
+            tracemalloc.stop()
+
+
+def _save(profile: RunProfile) -> None:
+    with _store_lock:
+        profiles = read_json(PROFILES_PATH, [])
+        profiles.append(profile.to_dict())
+        try:
+            write_json_atomic(PROFILES_PATH, profiles[-KEEP_PROFILES:])
+        except Exception as e:
+            log.warning("Не удалось сохранить профиль запуска: %s", e)
+
+
+@contextmanager
+def profile_run(chat_id: Optional[int] = None) -> Iterator[RunProfile]:
+    """
+    Профилируем запуск целиком; этапы внутри отмечаются через stage()/add().
+    """
+    profile = RunProfile(
+        run_id=uuid.uuid4().hex[:12],
+        chat_id=chat_id,
+        started=datetime.now().isoformat(timespec="seconds"),
+    )
+    capture = RUN_PROFILE_CAPTURE or chat_id in _capture_next
+    _capture_next.discard(chat_id)
+    stop_tracemalloc = _start_capture(profile) if capture else False
+    token = _current.set(profile)
+    start = time.perf_counter()
+    try:
+        yield profile
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe("total", value=elapsed)
+        profile.add_time("total", elapsed)
+        _current.reset(token)
+        if capture:
+            _finish_capture(profile, stop_tracemalloc)
+        _save(profile)
+
+
+def recent_profiles(limit: int = 20, chat_id: Optional[int] = None) -> List[dict]:
+    with _store_lock:
+        profiles = read_json(PROFILES_PATH, [])
+    if chat_id is not None:
+        profiles = [p for p in profiles if p.get("chat_id") == chat_id]
+    return profiles[-limit:]
+
+
+def percentile(values: List[float], q: float) -> float:
+    """
+    Перцентиль по ближайшему рангу (на десятке запусков интерполяция ни к чему).
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, min(len(ordered), math.ceil(q / 100 * len(ordered))))
+    return ordered[rank - 1]
+
+
+def summarize(profiles: List[dict]) -> Dict[str, Dict[str, Dict[str, float]]]:
+    """
+    p50/p95 по этапам (секунды) и по счётчикам; этапы, которых в запуске не было, считаем нулём.
+    """
+    stage_names = [s for s in STAGE_LABELS if any(s in p.get("stages", {}) for p in profiles)]
+    counter_names = [c for c in COUNTER_LABELS if any(c in p.get("counters", {}) for p in profiles)]
+    result: Dict[str, Dict[str, Dict[str, float]]] = {"stages": {}, "counters": {}}
+    for name in stage_names:
+        values = [p.get("stages", {}).get(name, 0.0) for p in profiles]
+        result["stages"][name] = {"p50": percentile(values, 50), "p95": percentile(values, 95)}
+    for name in counter_names:
+        values = [p.get("counters", {}).get(name, 0) for p in profiles]
+        result["counters"][name] = {"p50": percentile(values, 50), "p95": percentile(values, 95)}
+    return result
@@ -0,0 +1,164 @@
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List, Tuple
+
+from json_store import data_path, read_json, write_json_atomic
+
+log = logging.getLogger(__name__)
+
+# Бенчмарк холодного старта: сколько стоит `import tg_bot` (python -X importtime)
+# и не протёк ли в импорт тяжёлый модуль, который должен грузиться лениво.
+#
+#   python startup_bench.py                    — отчёт: медиана по прогонам и самые дорогие импорты
+#   python startup_bench.py --save             — запомнить результат как базовую линию
+#   python startup_bench.py --check            — код 1, если медиана выше --max-ms (STARTUP_MAX_MS),
+#                                                хуже сохранённой базовой линии больше чем на
+#                                                --tolerance, либо при старте импортирован модуль
+#                                                из LAZY_MODULES
+#
+# Каждый прогон — отдельный интерпретатор; первый (прогрев .pyc) не считаем.
+# Базовая линия зависит от машины и лежит в data/ (не в репозитории), поэтому на
+# чистой копии и в CI --check держится на абсолютном пороге: STARTUP_MAX_MS по
+# умолчанию — примерно вдвое выше того, что import tg_bot занимает после
+# ленивых импортов (~260–350 мс на машине разработчика).
+BASELINE_PATH = data_path("startup_baseline.json")
+STARTUP_MAX_MS = float(os.getenv("STARTUP_MAX_MS", "700") or 0)
+TARGET_MODULE = "tg_bot"
+# до первого запуска проверки не нужны: парсинг, выгрузка, вебхук, подсчёт токенов
+LAZY_MODULES = ("bs4", "requests", "openpyxl", "uvicorn", "tiktoken")
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+Sample = Tuple[float, float, Dict[str, float], List[str]]
+
+
+def _parse_importtime(stderr: str, target: str) -> Tuple[float, Dict[str, float]]:
+    """
+    Из вывода -X importtime: кумулятивное время target (мс) и его прямых потомков.
+    Потомки печатаются раньше родителя и с отступом на два пробела глубже.
+    """
+    entries: List[Tuple[int, str, float]] = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|", 2)
+        if not cumulative.strip().isdigit():
+            continue  # заголовок таблицы
+        depth = (len(name) - len(name.lstrip(" ")) - 1) // 2
+        entries.append((depth, name.strip(), int(cumulative) / 1000))
+
+    total = 0.0
+    children: Dict[str, float] = {}
+    for i, (depth, name, ms) in enumerate(entries):
+        if name != target:
+            continue
+        total = ms
+        for child_depth, child, child_ms in reversed(entries[:i]):
+            if child_depth <= depth:
+                break
+            if child_depth == depth + 1:
+                children[child] = child_ms
+        break
+    return total, children
+
+
+def run_once(target: str = TARGET_MODULE) -> Sample:
+    code = (
+        f"import {target}, sys; "
+        f"print(','.join(m for m in {LAZY_MODULES!r} if m in sys.modules))"
+    )
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    wall = (time.perf_counter() - start) * 1000
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {target} упал:\n{proc.stderr[-2000:]}")
+    total, children = _parse_importtime(proc.stderr, target)
+    leaked = [m for m in proc.stdout.strip().split(",") if m]
+    return total, wall, children, leaked
+
+
+def measure(runs: int = 7, target: str = TARGET_MODULE) -> dict:
+    run_once(target)  # прогрев: компиляция .pyc, кэш ФС
+    samples = [run_once(target) for _ in range(runs)]
+    names = {name for _, _, children, _ in samples for name in children}
+    children = {
+        name: statistics.median(s[2].get(name, 0.0) for s in samples)
+        for name in names
+    }
+    return {
+        "target": target,
+        "runs": runs,
+        "import_ms": round(statistics.median(s[0] for s in samples), 1),
+        "wall_ms": round(statistics.median(s[1] for s in samples), 1),
+        "top": sorted(((n, round(ms, 1)) for n, ms in children.items()), key=lambda x: -x[1])[:12],
+        "leaked": sorted({m for s in samples for m in s[3]}),
+        "python": sys.version.split()[0],
+        "measured": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def check(result: dict, baseline: dict, tolerance: float, max_ms: float) -> List[str]:
+    problems = []
+    if result["leaked"]:
+        problems.append("при старте импортированы ленивые модули: " + ", ".join(result["leaked"]))
+    if max_ms and result["import_ms"] > max_ms:
+        problems.append(f"import {result['target']}: {result['import_ms']} мс > порога {max_ms:g} мс")
+    base = baseline.get("import_ms")
+    if base and result["import_ms"] > base * (1 + tolerance):
+        problems.append(
+            f"import {result['target']}: {result['import_ms']} мс — хуже базовых {base} мс "
+            f"больше чем на {tolerance:.0%}"
+        )
+    return problems
+
+
+def _print_report(result: dict, baseline: dict) -> None:
+    base = baseline.get("import_ms")
+    print(f"import {result['target']}: {result['import_ms']} мс (медиана {result['runs']} прогонов)"
+          + (f", базовая линия {base} мс" if base else ""))
+    print(f"процесс целиком (с запуском интерпретатора): {result['wall_ms']} мс")
+    print("самые дорогие прямые импорты:")
+    for name, ms in result["top"]:
+        print(f"  {ms:8.1f} мс  {name}")
+    if result["leaked"]:
+        print("ленивые модули, попавшие в старт: " + ", ".join(result["leaked"]))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    parser = argparse.ArgumentParser(description="Время холодного импорта бота")
+    parser.add_argument("--runs", type=int, default=7)
+    parser.add_argument("--target", default=TARGET_MODULE)
+    parser.add_argument("--save", action="store_true", help="сохранить результат как базовую линию")
+    parser.add_argument("--check", action="store_true", help="код 1 при регрессии")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="допустимое ухудшение к базовой линии")
+    parser.add_argument("--max-ms", type=float, default=STARTUP_MAX_MS, help="абсолютный порог, мс (0 — нет)")
+    args = parser.parse_args()
+
+    result = measure(args.runs, args.target)
+    baseline = read_json(BASELINE_PATH, {})
+    if baseline.get("target") != result["target"]:
+        baseline = {}
+    _print_report(result, baseline)
+
+    if args.save:
+        write_json_atomic(BASELINE_PATH, result)
+        log.info("Базовая линия сохранена: %s", BASELINE_PATH)
+    if args.check:
+        problems = check(result, baseline, args.tolerance, args.max_ms)
+        for problem in problems:
+            print("РЕГРЕССИЯ: " + problem)
+        sys.exit(1 if problems else 0)
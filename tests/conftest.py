@@ -0,0 +1,16 @@
+from __future__ import annotations
+
+import os
+import sys
+import tempfile
+
+# модули бота лежат в корне репозитория, пакета нет
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+# служебные файлы тестов — во временный каталог, а не в data/ рабочего бота;
+# задаём до импорта модулей: пути к хранилищам — константы модулей
+os.environ.setdefault("BOT_DATA_DIR", tempfile.mkdtemp(prefix="bot-data-"))
+os.environ.setdefault("DOTENV_PATH", os.path.join(ROOT, ".env.tests-none"))
+os.environ.pop("OPENAI_API_KEY", None)
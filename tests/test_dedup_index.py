@@ -0,0 +1,51 @@
+from __future__ import annotations
+
+from datetime import datetime
+from types import SimpleNamespace
+
+from dedup_index import DedupIndex
+
+
+def _tender(number: str, title: str, price: int = 1_500_000, end: datetime = datetime(2026, 11, 20, 10)):
+    return SimpleNamespace(number=number, title=title, price=price, end_datetime=end, customer=None)
+
+
+def _verdict_after_republish(tmp_path, republished):
+    path = str(tmp_path / "dedup.json")
+    index = DedupIndex.load(path)
+    [cluster] = index.group([_tender("100", "Поставка газоанализаторов стационарных")], fingerprint="fp")
+    index.set_verdict(cluster.cluster_id, False, "не наш профиль", fingerprint="fp")
+    index.save()
+
+    index = DedupIndex.load(path)
+    [cluster] = index.group([republished], fingerprint="fp")
+    index.save()
+    return cluster, DedupIndex.load(path)
+
+
+def test_same_content_keeps_verdict(tmp_path):
+    cluster, _ = _verdict_after_republish(tmp_path, _tender("100", "Поставка газоанализаторов стационарных"))
+    assert cluster.verdict is not None and cluster.verdict["reason"] == "не наш профиль"
+
+
+def test_changed_content_under_same_number_drops_verdict(tmp_path):
+    changed = _tender("100", "Поставка узла учёта газа СИКГ", price=9_800_000, end=datetime(2026, 12, 15, 10))
+    cluster, reloaded = _verdict_after_republish(tmp_path, changed)
+    assert cluster.verdict is None
+    assert reloaded.clusters[cluster.cluster_id]["verdict"] is None
+
+
+def test_concurrent_saves_merge(tmp_path):
+    path = str(tmp_path / "dedup.json")
+    first, second = DedupIndex.load(path), DedupIndex.load(path)
+    [a] = first.group([_tender("1", "Поставка хроматографа поточного")])
+    [b] = second.group([_tender("2", "Уборка снега на территории")])
+    first.set_verdict(a.cluster_id, True, "a")
+    second.set_verdict(b.cluster_id, False, "b")
+    first.save()
+    second.save()
+
+    merged = DedupIndex.load(path)
+    assert set(merged.entries) == {"1", "2"}
+    assert merged.clusters[a.cluster_id]["verdict"]["reason"] == "a"
+    assert merged.clusters[b.cluster_id]["verdict"]["reason"] == "b"
@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+import gpt_batch_api
+import gpt_cache
+import usage_ledger
+from mock_openai import MockOpenAIServer, scripted_responder
+
+VERDICTS = {"101": (True, "поставка СИКГ"), "102": (False, "мебель")}
+
+
+def _items():
+    return [
+        (SimpleNamespace(number="101", title="Поставка СИКГ", detail_text="узел учета газа"), None),
+        (SimpleNamespace(number="102", title="Поставка мебели", detail_text="стулья"), None),
+    ]
+
+
+@pytest.fixture
+def stores(tmp_path, monkeypatch):
+    """Задания, кэш вердиктов и учёт расходов — в свои файлы на каждый тест."""
+    monkeypatch.setattr(gpt_batch_api, "BATCH_JOBS_PATH", str(tmp_path / "gpt_batch_jobs.json"))
+    monkeypatch.setattr(gpt_batch_api, "BATCH_FILES_DIR", str(tmp_path / "batches"))
+    cache = gpt_cache.VerdictCache(path=str(tmp_path / "gpt_verdict_cache.json"))
+    ledger = usage_ledger.UsageLedger(path=str(tmp_path / "usage_ledger.json"), log_dir=str(tmp_path / "usage"))
+    monkeypatch.setattr(gpt_cache, "_cache", cache)
+    monkeypatch.setattr(usage_ledger, "_ledger", ledger)
+    return SimpleNamespace(cache=cache, ledger=ledger, path=tmp_path)
+
+
+def _server(monkeypatch, batch_delay: float = 0.0) -> MockOpenAIServer:
+    server = MockOpenAIServer(responder=scripted_responder(VERDICTS), batch_delay=batch_delay)
+    monkeypatch.setattr(gpt_batch_api, "OPENAI_BASE_URL", server.base_url)
+    return server
+
+
+def _check_ingested(job: dict, stores) -> None:
+    assert job["status"] == "completed"
+    assert job["ingested"] and not job["failed"]
+    assert {r.code: r.is_match for r in gpt_batch_api.job_results(job)} == {"101": True, "102": False}
+
+    # вердикты — в общем кэше под ключами интерактивного режима, и на диске
+    fresh = gpt_cache.VerdictCache(path=stores.cache.path)
+    for code, (is_match, _reason) in VERDICTS.items():
+        assert fresh.get(job["cache_keys"][code])["is_match"] is is_match
+
+    # расход записан одним запуском, по ответу на тендер
+    day = usage_ledger.UsageLedger(path=stores.ledger.path, log_dir=stores.ledger.log_dir).day()
+    assert day["total"]["requests"] == 2
+    assert day["total"]["prompt_tokens"] > 0
+    [run] = stores.ledger.recent_runs()
+    assert run["totals"]["requests"] == 2
+
+
+def test_submit_poll_ingest(stores, monkeypatch):
+    with _server(monkeypatch, batch_delay=0.3) as server:
+        job = gpt_batch_api.submit_batch(_items())
+        assert job["batch_id"] in server.batches
+        assert job["status"] not in gpt_batch_api.FINAL_STATUSES
+        assert not job["ingested"]
+
+        job = gpt_batch_api.wait_for_job(job["id"], poll_interval=0.05, timeout=10)
+
+    _check_ingested(job, stores)
+    assert gpt_batch_api.get_job(job["id"])["ingested"]
+
+
+def test_resume_after_interrupt(stores, monkeypatch):
+    with _server(monkeypatch) as server:
+        job = gpt_batch_api.create_job(_items())
+        with httpx.Client() as client:
+            gpt_batch_api._upload(client, job)
+        # «рестарт»: задание с загруженным файлом, но без batch — только на диске
+        assert gpt_batch_api.get_job(job["id"])["status"] == "uploaded"
+        assert not server.batches
+
+        [job] = gpt_batch_api.resume_pending_jobs()
+        assert len(server.batches) == 1
+
+        # повторный resume ничего не делает: всё уже разобрано
+        assert gpt_batch_api.resume_pending_jobs() == []
+        assert len(server.batches) == 1
+
+    _check_ingested(job, stores)
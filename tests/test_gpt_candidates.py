@@ -0,0 +1,47 @@
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from gpt_candidates import URGENCY_FLOOR, URGENT_DAYS, _urgency, rank_candidates
+
+NOW = datetime(2026, 3, 2, 12, 0)
+
+
+def _item(number: str, days_left: float | None):
+    end = None if days_left is None else NOW + timedelta(days=days_left)
+    tender = SimpleNamespace(number=number, end_datetime=end, published=None)
+    local = SimpleNamespace(priority_level=1, matched_keywords=["сикг"])
+    return tender, local
+
+
+def test_urgency_is_monotonic():
+    steps = [d / 4 for d in range(0, 4 * (URGENT_DAYS + 3))]
+    values = [_urgency(NOW + timedelta(days=d), NOW)[0] for d in steps]
+    assert all(a >= b for a, b in zip(values, values[1:]))
+    assert values[0] == 1.0
+    assert min(values) == URGENCY_FLOOR
+
+
+def test_unknown_deadline_is_not_urgent():
+    assert _urgency(None, NOW) == (URGENCY_FLOOR, False)
+    assert _urgency(NOW - timedelta(hours=1), NOW) == (0.0, True)
+
+
+def test_deadline_inside_window_ranks_above_outside():
+    # при равном приоритете и ключах тендер с заявками до конца окна — выше, чем за окном
+    ranked = rank_candidates(
+        [
+            _item("later", URGENT_DAYS + 0.5),
+            _item("unknown", None),
+            _item("edge", URGENT_DAYS - 0.1),
+            _item("soon", 1),
+            _item("closed", -1),
+        ],
+        now=NOW,
+    )
+    order = [c.tender.number for c in ranked]
+    assert order[:2] == ["soon", "edge"]
+    assert set(order[2:4]) == {"later", "unknown"}
+    assert order[-1] == "closed"
+    assert ranked[-1].closed
@@ -0,0 +1,38 @@
+from __future__ import annotations
+
+import gpt_eval
+from gpt_eval import EVAL_FIXTURE_PATH, build_configs, evaluate, labels_responder, load_labeled
+
+
+def test_fixture_is_labeled():
+    items = load_labeled(EVAL_FIXTURE_PATH)
+    assert len(items) >= 10
+    assert {i.expected for i in items} == {True, False}
+
+
+def test_scripted_answers_give_full_accuracy():
+    items = load_labeled(EVAL_FIXTURE_PATH)
+    reports = evaluate(items, build_configs([1, 5], [2]), responder=labels_responder(items))
+
+    assert [r.config for r in reports] == ["batch=1 conc=2", "batch=5 conc=2"]
+    for report in reports:
+        assert report.answered == report.total == len(items)
+        assert report.accuracy == 1.0
+        assert not report.dropped
+    # пакет по 5 — меньше запросов, чем по одному
+    assert reports[1].requests < reports[0].requests == len(items)
+
+
+def test_flipped_answers_lower_accuracy():
+    items = load_labeled(EVAL_FIXTURE_PATH)
+    [report] = evaluate(items, build_configs([1], [4]), responder=labels_responder(items, flip=0.5, seed=3))
+    assert report.answered == len(items)
+    assert report.accuracy < 1.0
+
+
+def test_keyword_responder_finds_profile_tenders():
+    items = load_labeled(EVAL_FIXTURE_PATH)
+    [report] = evaluate(items, build_configs([5], [None]))
+    assert report.answered == len(items)
+    assert report.tp > 0
+    assert "точн." in gpt_eval.format_reports([report])
@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import pytest
+
+from query_filter import (
+    QuerySyntaxError,
+    compile_filters,
+    is_query,
+    parse_query,
+    split_query_list,
+    validate_query_list,
+)
+
+
+def _match(include=None, exclude=None, city=None, title="", body="", tender_city=None, region=None) -> bool:
+    return compile_filters(include, exclude, city).matches(title, body, tender_city, region)
+
+
+# ---------- разбор ----------
+
+
+def test_bare_words_are_one_phrase():
+    assert parse_query("узел учета") == ("term", ("узел", "учета"))
+
+
+def test_precedence_or_and_not():
+    # OR < AND < NOT: a OR b c NOT d == a OR (b AND (NOT d))
+    assert parse_query("a OR b AND NOT d") == (
+        "or",
+        [("term", ("a",)), ("and", [("term", ("b",)), ("not", ("term", ("d",)))])],
+    )
+
+
+def test_parentheses_override_precedence():
+    assert parse_query("(a OR b) AND c") == (
+        "and",
+        [("or", [("term", ("a",)), ("term", ("b",))]), ("term", ("c",))],
+    )
+
+
+def test_near_binds_tighter_than_and():
+    assert parse_query("датчик NEAR/3 давления AND газ") == (
+        "and",
+        [("near", [("датчик",), ("давления",)], 3), ("term", ("газ",))],
+    )
+
+
+def test_symbols_minus_and_fields():
+    assert parse_query("газ -ремонт") == ("and", [("term", ("газ",)), ("not", ("term", ("ремонт",)))])
+    assert parse_query("title:ремонт | сикг") == (
+        "or",
+        [("field", "title", ("term", ("ремонт",))), ("term", ("сикг",))],
+    )
+
+
+@pytest.mark.parametrize("query", ["(a OR b", "a OR", "a)", '""', "NEAR/2 a"])
+def test_syntax_errors(query):
+    with pytest.raises(QuerySyntaxError):
+        parse_query(query)
+
+
+def test_split_keeps_commas_inside_quotes_and_parens():
+    assert split_query_list('газ, "узел, учета", (a, b) OR c') == ["газ", '"узел, учета"', "(a, b) OR c"]
+
+
+# ---------- совместимость со списком подстрок ----------
+
+
+@pytest.mark.parametrize("item", ['ООО "Газпром"', "КИПиА (монтаж)", "узел учета", 'кавычка "одна', "-"])
+def test_legacy_items_are_not_queries(item):
+    assert not is_query(item)
+    assert validate_query_list([item]) is None
+
+
+def test_legacy_items_match_as_substrings():
+    assert _match(include=['ООО "Газпром"'], body='Заказчик: ООО "Газпром" трансгаз')
+    assert not _match(include=['ООО "Газпром"'], body="ООО Газпром трансгаз")
+    assert _match(include=["КИПиА (монтаж)"], title="Работы по КИПиА (монтаж) на КС")
+    assert not _match(include=["КИПиА (монтаж)"], title="Монтаж КИПиА")
+    assert _match(include=['кавычка "одна'], body='текст кавычка "одна тут')
+
+
+def test_comma_list_is_or_and_exclude_is_any():
+    include = ["сикг", "узел учета", "хроматограф"]
+    assert _match(include=include, title="Поставка узел учета газа")
+    assert not _match(include=include, title="Поставка мебели")
+    assert not _match(include=include, exclude=["ремонт", "покраска"], title="Ремонт узел учета")
+
+
+def test_legacy_city_filter_is_substring_of_city_region_text():
+    assert _match(city="Москва", tender_city="Москва")
+    assert _match(city="татарстан", region="Республика Татарстан")
+    assert _match(city="Ханты-Мансийск", tender_city="Ханты-Мансийский АО")
+    assert not _match(city="Москва", tender_city="Казань")
+
+
+def test_queries_still_work():
+    assert _match(include=["(сикг OR сикн) AND газ"], title="Поставка СИКГ для газа")
+    assert not _match(include=["(сикг OR сикн) AND газ"], title="Поставка СИКН для нефти")
+    assert _match(include=["датчик NEAR/2 давления"], body="датчик избыточного давления")
+    assert not _match(include=["датчик NEAR/1 давления"], body="датчик для измерения избыточного давления")
+    assert _match(city="Москва OR Казань", tender_city="Казань")
+
+
+def test_broken_query_is_reported():
+    assert validate_query_list(["газ AND (сикг"]) is not None
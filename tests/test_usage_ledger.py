@@ -0,0 +1,56 @@
+from __future__ import annotations
+
+import pytest
+
+import usage_ledger
+from usage_ledger import BUDGET_EXCEEDED, BUDGET_OK, BudgetExceeded, UsageLedger, track_run
+
+
+@pytest.fixture
+def ledgers(tmp_path, monkeypatch):
+    """Два экземпляра на один файл — как бот и gpt_batch_api в разных процессах."""
+
+    def make() -> UsageLedger:
+        return UsageLedger(path=str(tmp_path / "usage_ledger.json"), log_dir=str(tmp_path / "usage"))
+
+    first, second = make(), make()
+    monkeypatch.setattr(usage_ledger, "_ledger", first)
+    return first, second, make
+
+
+def test_flush_adds_to_file_instead_of_overwriting(ledgers):
+    first, second, make = ledgers
+    # оба успели прочитать пустой файл
+    assert first.spent_today() == second.spent_today() == 0
+
+    with track_run(chat_id=1):
+        first.record("gpt-4o-mini", 100, 10, 0, 0.25)
+        # второй сохраняет сразу, первый — в конце track_run
+        second.record("gpt-4o", 200, 20, 50, 0.5, source="batch")
+        second.flush()
+        first.record("gpt-4o-mini", 100, 10, 0, 0.25)
+
+    day = make().day()
+    assert day["total"]["requests"] == 3
+    assert day["total"]["prompt_tokens"] == 400
+    assert day["total"]["cost"] == pytest.approx(1.0)
+    assert day["models"]["gpt-4o-mini"]["requests"] == 2
+    assert day["models"]["gpt-4o"]["cached_tokens"] == 50
+    assert day["chats"]["1"]["requests"] == 3
+    assert make().month()["total"]["requests"] == 3
+    assert len(make().recent_runs()) == 1
+
+    # оба экземпляра видят общий итог
+    assert first.spent_today() == second.spent_today() == pytest.approx(1.0)
+
+
+def test_budget_sees_spend_of_other_process(ledgers, monkeypatch):
+    first, second, _make = ledgers
+    monkeypatch.setattr(usage_ledger, "GPT_DAILY_BUDGET_USD", 1.0)
+    assert first.budget_status() == BUDGET_OK
+
+    second.record("gpt-4o", 1000, 100, 0, 1.5, source="batch")
+
+    assert first.budget_status() == BUDGET_EXCEEDED
+    with pytest.raises(BudgetExceeded):
+        first.check_budget()
@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+import asyncio
+from contextlib import asynccontextmanager
+
+import httpx
+from telegram.ext import ApplicationBuilder, CommandHandler
+
+import tg_bot
+from mock_telegram import MockTelegramServer
+from tg_sender import close_send_scheduler, get_send_scheduler
+from tg_webhook import WebhookApp
+
+SECRET = "s3cret"
+PATH = "/telegram"
+
+
+@asynccontextmanager
+async def running_bot(mock: MockTelegramServer):
+    """
+    Бот без Updater, как в режиме вебхука, против заглушки Bot API;
+    вебхук — WebhookApp, в который ходим напрямую через ASGI-транспорт httpx.
+    """
+    application = (
+        ApplicationBuilder()
+        .token("123:abc")
+        .base_url(f"{mock.base_url}/bot")
+        .base_file_url(f"{mock.base_url}/file/bot")
+        .updater(None)
+        .build()
+    )
+    application.add_handler(CommandHandler("start", tg_bot.start))
+    transport = httpx.ASGITransport(app=WebhookApp(application, PATH, SECRET, serve_metrics=True))
+    async with application:
+        await application.start()
+        async with httpx.AsyncClient(transport=transport, base_url="http://bot") as client:
+            try:
+                yield application, client
+            finally:
+                await close_send_scheduler()
+                await application.stop()
+
+
+async def _post_update(client: httpx.AsyncClient, update: dict, secret: str = SECRET) -> int:
+    resp = await client.post(PATH, json=update, headers={"X-Telegram-Bot-Api-Secret-Token": secret})
+    return resp.status_code
+
+
+async def _wait_for(predicate, timeout: float = 5.0) -> bool:
+    deadline = asyncio.get_running_loop().time() + timeout
+    while asyncio.get_running_loop().time() < deadline:
+        if predicate():
+            return True
+        await asyncio.sleep(0.05)
+    return predicate()
+
+
+def test_secret_is_checked():
+    async def scenario():
+        with MockTelegramServer() as mock:
+            async with running_bot(mock) as (application, client):
+                assert await _post_update(client, mock.text_update("/start"), secret="wrong") == 403
+                assert await _post_update(client, mock.text_update("/start"), secret="") == 403
+                assert await _post_update(client, mock.text_update("/start")) == 200
+                assert (await client.get("/healthz")).text == "ok"
+                assert (await client.get(PATH)).status_code == 405
+
+    asyncio.run(scenario())
+
+
+def test_update_reaches_handler_and_reply_reaches_api():
+    async def scenario():
+        with MockTelegramServer() as mock:
+            async with running_bot(mock) as (application, client):
+                assert await _post_update(client, mock.text_update("/start", chat_id=42)) == 200
+                assert await _wait_for(lambda: mock.calls_of("sendMessage"))
+                [reply] = mock.calls_of("sendMessage")
+                assert int(reply["chat_id"]) == 42
+                assert reply["text"].startswith("Привет!")
+
+                # отклонённый по секрету апдейт до обработчика не доходит
+                await _post_update(client, mock.text_update("/start", chat_id=7), secret="wrong")
+                await asyncio.sleep(0.3)
+                assert len(mock.calls_of("sendMessage")) == 1
+
+    asyncio.run(scenario())
+
+
+def test_retry_after_is_retried():
+    async def scenario():
+        with MockTelegramServer(retry_after_every=2, retry_after=1) as mock:
+            async with running_bot(mock) as (application, client):
+                sender = get_send_scheduler(application.bot)
+                first = await sender.send(1, "первое")
+                second = await sender.send(1, "второе")
+
+                assert first.text == "первое" and second.text == "второе"
+                assert sender.retry_after == 1
+                # второе сообщение ушло дважды: 429, потом повтор
+                assert [p["text"] for p in mock.calls_of("sendMessage")] == ["первое", "второе", "второе"]
+
+    asyncio.run(scenario())
@@ -1,17 +1,22 @@
 from __future__ import annotations
 
+import asyncio
+import html
 import logging
+import math
 import os
 import re
-from asyncio import to_thread
+import time
+from asyncio import gather, shield, to_thread
+from datetime import datetime
 from typing import Any
 
-from dotenv import load_dotenv
 from telegram import (
     Update,
     InlineKeyboardButton,
     InlineKeyboardMarkup,
 )
+from telegram.error import TelegramError
 from telegram.ext import (
     ApplicationBuilder,
     CommandHandler,
@@ -21,9 +26,59 @@ from telegram.ext import (
     filters,
 )
 
-from rostender_filter_parser import fetch_rostender_tenders_filtered
+import env_loader  # noqa: F401  (.env — до остальных модулей проекта)
+from rostender_filter_parser import fetch_rostender_tenders_filtered, fill_details
 from mce_filter import analyze_tender
-from gpt_client import ask_gpt_about_tenders
+from gpt_client import GPT_MODEL_TIERS, GPTRunStats, close_async_client, iter_gpt_verdicts, verdict_fingerprint
+from dedup_index import DedupIndex
+from crawl_schedule import (
+    SCHEDULE_INTERVAL_MIN,
+    SCHEDULE_WARM_SECONDS,
+    get_subscriptions,
+    in_quiet_hours,
+    next_run,
+    parse_quiet_hours,
+    schedule_all,
+    schedule_chat,
+    schedule_slot,
+    unschedule_chat,
+)
+from gpt_candidates import CandidatePlan, plan_candidates
+from token_budget import warm_encoders
+from delivery_ledger import STATUS_CHANGED, STATUS_SEEN, get_delivery_ledger
+from tg_sender import close_send_scheduler, get_send_scheduler, pending_total
+from metrics import (
+    CACHE_LOOKUPS,
+    JOBS_RUNNING,
+    METRICS_PORT,
+    TELEGRAM_QUEUE,
+    start_metrics_server,
+    stop_metrics_server,
+)
+from job_registry import Job, get_job_registry
+from digest_export import available_formats, export_digest
+from tg_webhook import TELEGRAM_WEBHOOK_URL, serve_webhook
+import run_profile
+from results_cache import (
+    KIND_LOCAL,
+    KIND_MATCHED,
+    KIND_ORDER,
+    KIND_REJECTED,
+    KIND_SEEN,
+    KIND_TITLES,
+    ResultItem,
+    ResultSet,
+    get_results_cache,
+)
+from query_filter import split_query_list, validate_query_list
+from usage_ledger import (
+    BUDGET_EXCEEDED,
+    BUDGET_OK,
+    GPT_DAILY_BUDGET_USD,
+    GPT_MONTHLY_BUDGET_USD,
+    get_ledger,
+    track_run,
+)
 from config_store import (
     get_keywords,
     set_keywords,
@@ -32,20 +87,24 @@ from config_store import (
     get_city,
     set_city,
     get_gpt_filter_text,
+    get_gpt_rubric_text,
     set_gpt_filter_text,
+    set_gpt_rubric_text,
     get_search_days,
     set_search_days,
     get_max_pages,
     set_max_pages,
+    get_compact_mode,
+    set_compact_mode,
 )
 
 # ================== CONFIG & LOGGING ==================
 
-load_dotenv()
-
+# токен проверяем при запуске, а не при импорте: модуль импортируют и без него
+# (бенчмарк старта, проверки с заглушками)
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN", "").strip()
-if not TELEGRAM_BOT_TOKEN:
-    raise RuntimeError("Не задан TELEGRAM_BOT_TOKEN в .env")
+# другой адрес Bot API: свой telegram-bot-api сервер или заглушка mock_telegram.py
+TELEGRAM_API_BASE_URL = os.getenv("TELEGRAM_API_BASE_URL", "").strip().rstrip("/")
 
 logging.basicConfig(
     level=logging.INFO,
@@ -54,7 +113,14 @@ logging.basicConfig(
 
 log = logging.getLogger(__name__)
 
-MAX_GPT_TENDERS = 12  # максимум тендеров, которые отправляем в GPT за один запуск
+# не чаще одной правки статус-сообщения за столько секунд (лимиты Telegram на edit)
+STATUS_EDIT_INTERVAL = 3.0
+
+QUERY_SYNTAX_HELP = (
+    "Можно и выражения: <code>\"узел учета\" AND газ</code>, "
+    "<code>сикг OR сикн</code>, <code>газ -ремонт</code>, "
+    "<code>title:ремонт</code>, <code>датчик NEAR/3 давления</code>."
+)
 
 
 # ================== КЛАВИАТУРЫ ==================
@@ -68,6 +134,10 @@ def main_menu_keyboard() -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(keyboard)
 
 
+def cancel_keyboard() -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup([[InlineKeyboardButton("⛔ Отменить", callback_data="cancel_job")]])
+
+
 def settings_menu_keyboard() -> InlineKeyboardMarkup:
     keyboard = [
         [
@@ -81,6 +151,12 @@ def settings_menu_keyboard() -> InlineKeyboardMarkup:
         [
             InlineKeyboardButton("⏱ Период и страницы", callback_data="set_period"),
         ],
+        [
+            InlineKeyboardButton(
+                "🗜 Компактный режим: " + ("вкл" if get_compact_mode() else "выкл"),
+                callback_data="toggle_compact",
+            ),
+        ],
         [
             InlineKeyboardButton("ℹ Текущие фильтры", callback_data="show_filters"),
         ],
@@ -101,14 +177,17 @@ def _format_filters_text() -> str:
     days = get_search_days()
     pages = get_max_pages()
 
-    kw = ", ".join(kw_list) if kw_list else "—"
-    ex = ", ".join(ex_list) if ex_list else "—"
-    ct = city if city else "—"
+    # в выражениях бывают & и кавычки — экранируем под HTML
+    kw = html.escape(", ".join(kw_list)) if kw_list else "—"
+    ex = html.escape(", ".join(ex_list)) if ex_list else "—"
+    ct = html.escape(city) if city else "—"
 
     gpt = get_gpt_filter_text()
     short_gpt = gpt.strip()
     if len(short_gpt) > 500:
         short_gpt = short_gpt[:500] + "…"
+    rubric = get_gpt_rubric_text().strip()
+    rubric_info = f"{len(rubric)} символов, /set_gpt_rubric — заменить" if rubric else "—"
 
     text = (
         "<b>Текущие фильтры:</b>\n\n"
@@ -116,9 +195,11 @@ def _format_filters_text() -> str:
         f"<b>Исключающие слова:</b> {ex}\n"
         f"<b>Город:</b> {ct}\n"
         f"<b>Период поиска:</b> последние {days} дн.\n"
-        f"<b>Страниц Ростендера:</b> {pages}\n\n"
+        f"<b>Страниц Ростендера:</b> {pages}\n"
+        f"<b>Компактный режим:</b> {'вкл' if get_compact_mode() else 'выкл'}\n\n"
         "<b>Фильтр GPT (начало текста):</b>\n"
-        f"{short_gpt or '—'}"
+        f"{short_gpt or '—'}\n\n"
+        f"<b>Профиль и примеры для GPT:</b> {rubric_info}"
     )
     return text
 
@@ -180,7 +261,13 @@ def _build_pretty_description(t: Any) -> str:
     return "\n".join(f"• {l}" for l in cleaned)
 
 
-def _format_tender_message(t: Any, reason: str) -> str:
+def _format_tender_message(
+    t: Any,
+    reason: str,
+    duplicates: list[str] | None = None,
+    confidence: float | None = None,
+    local_only: bool = False,
+) -> str:
     """
     Формируем максимально информативное сообщение по тендеру,
     но аккуратно и читаемо.
@@ -223,7 +310,10 @@ def _format_tender_message(t: Any, reason: str) -> str:
 
     parts: list[str] = []
 
-    parts.append("🟢 <b>ПОДХОДИТ (по мнению ИИ)</b>")
+    if local_only:
+        parts.append("🟡 <b>ПОДХОДИТ (по локальному фильтру, без ИИ)</b>")
+    else:
+        parts.append("🟢 <b>ПОДХОДИТ (по мнению ИИ)</b>")
     parts.append(title)
     parts.append(f"№ {number}")
     parts.append("")
@@ -240,16 +330,344 @@ def _format_tender_message(t: Any, reason: str) -> str:
         parts.append(pretty_desc)
         parts.append("")
 
-    parts.append("<b>Комментарий ИИ:</b>")
+    parts.append("<b>Комментарий фильтра:</b>" if local_only else "<b>Комментарий ИИ:</b>")
     parts.append(reason or "Комментарий отсутствует")
+    if confidence is not None:
+        parts.append(f"<i>Уверенность ИИ: {confidence:.0%}</i>")
     parts.append("")
 
+    if duplicates:
+        parts.append("<b>Похоже на перепубликацию, дубликаты:</b>")
+        parts.append(", ".join(f"№ {n}" for n in duplicates))
+        parts.append("")
+
     if url:
         parts.append(f'<a href="{url}">Открыть тендер на сайте</a>')
 
     return "\n".join(parts)
 
 
+def _format_tender_card_compact(
+    t: Any,
+    reason: str,
+    confidence: float | None = None,
+    local_only: bool = False,
+    mark: str | None = None,
+) -> str:
+    """
+    Короткая карточка для компактного режима: несколько таких склеиваются
+    в одно сообщение (до 4096 символов).
+    """
+    title = html.escape(getattr(t, "title", "") or "Без названия")
+    if len(title) > 200:
+        title = title[:200] + "…"
+    number = html.escape(getattr(t, "number", "") or "—")
+
+    end_dt = getattr(t, "end_datetime", None)
+    try:
+        end_str = end_dt.strftime("%d.%m.%Y") if end_dt is not None else "—"
+    except Exception:
+        end_str = str(end_dt)
+    price_raw = getattr(t, "price_raw", None) or getattr(t, "price", None)
+    price_str = html.escape(str(price_raw)) if price_raw is not None else "—"
+    geo = html.escape(getattr(t, "city", "") or getattr(t, "region", "") or "—")
+
+    reason = html.escape(reason or "")
+    if len(reason) > 300:
+        reason = reason[:300] + "…"
+    if mark is None:
+        mark = "🟡" if local_only else "🟢"
+    if confidence is not None:
+        reason = f"{reason} ({confidence:.0%})" if reason else f"{confidence:.0%}"
+
+    url = getattr(t, "url", "") or ""
+    head = f'{mark} <a href="{html.escape(url)}">№ {number}</a>' if url else f"{mark} № {number}"
+    lines = [
+        f"{head} — {title}",
+        f"💰 {price_str} · ⏳ до {end_str} · 📍 {geo}",
+    ]
+    if reason:
+        lines.append(f"<i>{reason}</i>")
+    return "\n".join(lines)
+
+
+def _format_stats_text(
+    total_tenders: int,
+    clusters: int,
+    known_verdicts: int,
+    local_found: int,
+    sent_to_gpt: int,
+    gpt_answers: int,
+    matched_count: int,
+    gpt_stats: GPTRunStats | None = None,
+    budget_note: str | None = None,
+    plan: CandidatePlan | None = None,
+    seen_clusters: int = 0,
+    changed_clusters: int = 0,
+    new_clusters: int = 0,
+    reshow: bool = False,
+) -> str:
+    text = (
+        "📊 <b>Статистика запуска</b>\n\n"
+        f"• Всего тендеров с Ростендера: <b>{total_tenders}</b>\n"
+        f"• Уникальных после склейки дублей: <b>{clusters}</b>\n"
+    )
+    if reshow:
+        text += "• Показаны все, включая уже присланные раньше\n"
+    else:
+        # в журнал доставки попадают только присланные, поэтому «новые» — по индексу
+        # дублей: тендеры, которых бот раньше не видел ни в одном запуске
+        line = f"• Впервые найдены: <b>{new_clusters}</b>, уже присылал: <b>{seen_clusters}</b>"
+        if changed_clusters:
+            line += f" (изменились с прошлого раза: {changed_clusters})"
+        earlier = max(clusters - new_clusters - seen_clusters - changed_clusters, 0)
+        if earlier:
+            line += f", встречались раньше, но не присылались: <b>{earlier}</b>"
+        text += line + "\n"
+    text += (
+        f"• Вердикт известен из прошлых запусков: <b>{known_verdicts}</b>\n"
+        f"• Прошли локальный фильтр МЦЭ: <b>{local_found}</b>\n"
+        f"• Отправлено в GPT: <b>{sent_to_gpt}</b>\n"
+        f"• Ответов от GPT: <b>{gpt_answers}</b>\n"
+        f"• GPT признал подходящими: <b>{matched_count}</b>\n"
+    )
+    if plan is not None and (plan.selected or plan.closed):
+        text += f"• Бюджет ИИ: {plan.summary()}\n"
+        if plan.left_out:
+            text += f"• Не вошли в бюджет ИИ (смотри «{KIND_TITLES[KIND_LOCAL]}»): <b>{len(plan.left_out)}</b>\n"
+    if budget_note:
+        text += f"• ⚠ {budget_note}\n"
+    if gpt_stats is not None and gpt_stats.dropped:
+        # отдельно от «не подходит»: по этим тендерам вердикта просто нет
+        text += f"• Не удалось проверить (ошибки/лимиты ИИ): <b>{len(gpt_stats.dropped)}</b>\n"
+    if gpt_stats is not None and (gpt_stats.retries or gpt_stats.throttled):
+        text += (
+            f"• Повторов запросов к GPT: <b>{gpt_stats.retries}</b>, "
+            f"из них по лимитам (429/503): {gpt_stats.throttled}\n"
+        )
+    if gpt_stats is not None and gpt_stats.requests:
+        mode = "пакетами" if gpt_stats.mode == "batch" else "по одному"
+        text += (
+            f"• Запросов к GPT: <b>{gpt_stats.requests}</b> ({mode}), "
+            f"токенов: <b>{gpt_stats.total_tokens}</b>\n"
+        )
+    if gpt_stats is not None and (len(gpt_stats.tiers) > 1 or gpt_stats.cost):
+        for tier in gpt_stats.tiers.values():
+            if not tier.tenders:
+                continue
+            line = (
+                f"  ◦ {html.escape(tier.model)}: тендеров {tier.tenders}, запросов {tier.requests}, "
+                f"ср. ответ {tier.avg_latency:.1f} с, ${tier.cost:.4f}"
+            )
+            if tier.escalated:
+                line += f", эскалировано {tier.escalated}"
+            text += line + "\n"
+        text += f"• Стоимость GPT за запуск: <b>${gpt_stats.cost:.4f}</b>\n"
+    if gpt_stats is not None and gpt_stats.cached_tokens:
+        line = (
+            f"• Кэш префикса промпта: <b>{gpt_stats.prefix_hit_rate:.0%}</b> prompt-токенов, "
+            f"сэкономлено ${gpt_stats.cache_savings:.4f}"
+        )
+        gain = gpt_stats.prefix_latency_gain
+        if gain is not None:
+            line += f", ответ быстрее на {gain:.1f} с" if gain >= 0 else f", ответ медленнее на {-gain:.1f} с"
+        text += line + "\n"
+    if gpt_stats is not None and gpt_stats.tokens_saved:
+        text += (
+            f"• Сэкономлено токенов на описаниях: <b>{gpt_stats.tokens_saved}</b> "
+            f"из {gpt_stats.description_tokens}\n"
+        )
+    if gpt_stats is not None and gpt_stats.cache_hits + gpt_stats.cache_misses:
+        text += (
+            f"• Кэш вердиктов GPT: <b>{gpt_stats.cache_hits}</b> из "
+            f"{gpt_stats.cache_hits + gpt_stats.cache_misses} "
+            f"({gpt_stats.cache_hit_rate:.0%})\n"
+        )
+    return text
+
+
+def _results_summary_keyboard(result: ResultSet) -> InlineKeyboardMarkup | None:
+    rows = []
+    for kind in KIND_ORDER:
+        count = result.count(kind)
+        if count:
+            rows.append(
+                [InlineKeyboardButton(f"{KIND_TITLES[kind]} ({count})", callback_data=f"res:{result.run_id}:{kind}:0")]
+            )
+    if rows:
+        # весь список одним файлом
+        rows.append(
+            [
+                InlineKeyboardButton(f"📎 {fmt.upper()}", callback_data=f"res:{result.run_id}:x:{fmt}")
+                for fmt in available_formats()
+            ]
+        )
+    if result.count(KIND_SEEN):
+        rows.append([InlineKeyboardButton("🔁 Проверить и прислать все заново", callback_data="rerun_all")])
+    return InlineKeyboardMarkup(rows) if rows else None
+
+
+def _results_page_keyboard(result: ResultSet, kind: str, page: int) -> InlineKeyboardMarkup:
+    pages = result.pages(kind)
+    nav = []
+    if page > 0:
+        nav.append(InlineKeyboardButton("◀", callback_data=f"res:{result.run_id}:{kind}:{page - 1}"))
+    if page + 1 < pages:
+        nav.append(InlineKeyboardButton("▶", callback_data=f"res:{result.run_id}:{kind}:{page + 1}"))
+    rows = [nav] if nav else []
+    # переход между разделами, чтобы не возвращаться каждый раз к статистике
+    other = [
+        InlineKeyboardButton(f"{KIND_TITLES[k]} ({result.count(k)})", callback_data=f"res:{result.run_id}:{k}:0")
+        for k in KIND_ORDER
+        if k != kind and result.count(k)
+    ]
+    rows.extend([b] for b in other)
+    rows.append([InlineKeyboardButton("📊 К статистике", callback_data=f"res:{result.run_id}:s")])
+    return InlineKeyboardMarkup(rows)
+
+
+def _format_results_page(result: ResultSet, kind: str, page: int) -> str:
+    items = result.page(kind, page)
+    header = (
+        f"<b>{KIND_TITLES[kind]}</b> — {result.count(kind)} шт., "
+        f"стр. {page + 1}/{result.pages(kind)}"
+    )
+    if not items:
+        return header + "\n\nПусто."
+    mark = {KIND_REJECTED: "🔴", KIND_LOCAL: "🟡", KIND_SEEN: "👁"}.get(kind)
+    cards = [
+        _format_tender_card_compact(item, item.reason, item.confidence, local_only=item.local_only, mark=mark)
+        for item in items
+    ]
+    return header + "\n\n" + "\n\n".join(cards)
+
+
+def _budget_note(status: str) -> str:
+    ledger = get_ledger()
+    caps = []
+    if GPT_DAILY_BUDGET_USD > 0:
+        caps.append(f"за день ${ledger.spent_today():.2f} из ${GPT_DAILY_BUDGET_USD:.2f}")
+    if GPT_MONTHLY_BUDGET_USD > 0:
+        caps.append(f"за месяц ${ledger.spent_month():.2f} из ${GPT_MONTHLY_BUDGET_USD:.2f}")
+    head = "Лимит расходов на ИИ исчерпан" if status == BUDGET_EXCEEDED else "Лимит расходов на ИИ почти исчерпан"
+    return f"{head} ({'; '.join(caps)}), ИИ не вызывался"
+
+
+def _format_usage_counter(counter: dict) -> str:
+    return (
+        f"${counter['cost']:.4f}, запросов {counter['requests']}, "
+        f"токенов {counter['prompt_tokens'] + counter['completion_tokens']} "
+        f"(из кэша {counter['cached_tokens']})"
+    )
+
+
+def _format_usage_text(chat_id: int) -> str:
+    ledger = get_ledger()
+    day = ledger.day()
+    month = ledger.month()
+
+    parts = ["💰 <b>Расход на ИИ</b>", ""]
+    for title, bucket, cap in (
+        ("Сегодня", day, GPT_DAILY_BUDGET_USD),
+        ("За месяц", month, GPT_MONTHLY_BUDGET_USD),
+    ):
+        line = f"<b>{title}:</b> {_format_usage_counter(bucket['total'])}"
+        if cap > 0:
+            line += f" — лимит ${cap:.2f} ({bucket['total']['cost'] / cap:.0%})"
+        parts.append(line)
+
+    if month["models"]:
+        parts.append("")
+        parts.append("<b>По моделям за месяц:</b>")
+        for model, counter in sorted(month["models"].items(), key=lambda kv: -kv[1]["cost"]):
+            parts.append(f"• {html.escape(model)}: {_format_usage_counter(counter)}")
+
+    chat_counter = month["chats"].get(str(chat_id))
+    if chat_counter:
+        parts.append("")
+        parts.append(f"<b>Этот чат за месяц:</b> {_format_usage_counter(chat_counter)}")
+
+    runs = ledger.recent_runs(limit=5, chat_id=chat_id)
+    if runs:
+        parts.append("")
+        parts.append("<b>Последние запуски в этом чате:</b>")
+        for run in reversed(runs):
+            parts.append(f"• {run['started'].replace('T', ' ')}: {_format_usage_counter(run['totals'])}")
+
+    status = ledger.budget_status()
+    if status != BUDGET_OK:
+        parts.append("")
+        parts.append(f"⚠ {_budget_note(status)} — проверки идут только по локальному фильтру.")
+    return "\n".join(parts)
+
+
+class _LiveStatus:
+    """
+    Статус-сообщение запуска, которое правится по ходу работы: этап + счётчики.
+    Промежуточные правки — не чаще STATUS_EDIT_INTERVAL и только если текст
+    поменялся; force=True — для смены этапа и финала.
+    Под сообщением держим кнопку отмены, пока reply_markup не сброшен;
+    этап дублируем в задачу чата — его показывает /status.
+    msg=None — фоновая проверка: сообщения нет, этап виден только в /status.
+    """
+
+    COUNTERS = (
+        ("fetched", "Загружено с Ростендера"),
+        ("local", "Прошли локальный фильтр"),
+        ("sent", "Отправлено в ИИ"),
+        ("answered", "Ответов ИИ"),
+        ("matched", "Подходит"),
+    )
+
+    def __init__(self, msg: Any, job: Job | None = None, reply_markup: Any = None, sender: Any = None) -> None:
+        self.msg = msg
+        self.sender = sender
+        self.job = job
+        self.reply_markup = reply_markup
+        self.stage = getattr(msg, "text", None) or ""
+        self.counters: dict[str, int] = {}
+        self._last_text = self.stage
+        self._last_edit = 0.0
+
+    def render(self) -> str:
+        lines = [self.stage]
+        shown = [(label, self.counters[key]) for key, label in self.COUNTERS if key in self.counters]
+        if shown:
+            lines.append("")
+            lines.extend(f"• {label}: {value}" for label, value in shown)
+        return "\n".join(lines)
+
+    async def update(self, stage: str | None = None, force: bool = False, **counters: int) -> None:
+        if stage is not None:
+            self.stage = stage
+            if self.job is not None:
+                self.job.stage = stage.splitlines()[0]
+        self.counters.update(counters)
+        if self.msg is None:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_edit < STATUS_EDIT_INTERVAL:
+            return
+        text = self.render()
+        if text == self._last_text:
+            return
+        markup = self.reply_markup
+        try:
+            if self.sender is not None:
+                # через планировщик: правки статуса делят лимит чата с карточками
+                await self.sender.call(
+                    self.msg.chat_id, lambda: self.msg.edit_text(text, reply_markup=markup), retry=force
+                )
+            else:
+                await self.msg.edit_text(text, reply_markup=markup)
+        except TelegramError as e:
+            # «message is not modified», flood control и т.п. — статус не критичен
+            log.debug("Не удалось обновить статус: %s", e)
+            return
+        self._last_text = text
+        self._last_edit = now
+
+
 # ================== КОМАНДЫ ==================
 
 
@@ -263,7 +681,15 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "Пользуйся кнопками ниже 👇\n\n"
         "Дополнительно доступны команды:\n"
         "/filters — показать текущие фильтры\n"
-        "/rost_mce — запустить проверку вручную\n"
+        "/rost_mce — запустить проверку вручную (только новые тендеры)\n"
+        "/rost_mce all — то же, но прислать и уже присланные раньше\n"
+        "/rost_mce now — проверить заново, даже если есть свежая фоновая проверка\n"
+        "/subscribe [минут] [тихие часы, напр. 22-8] — проверять в фоне и присылать новое\n"
+        "/unsubscribe — выключить фоновую проверку\n"
+        "/usage — расход токенов и денег на ИИ\n"
+        "/status — что сейчас выполняется\n"
+        "/profile [N] — где тратится время в последних N запусках\n"
+        "/export [csv|xlsx|html] — все кандидаты последней проверки одним файлом\n"
     )
     await update.message.reply_text(
         text,
@@ -277,52 +703,274 @@ async def filters_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(text, parse_mode="HTML")
 
 
+async def usage_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    text = await to_thread(_format_usage_text, update.effective_chat.id)
+    await update.message.reply_text(text, parse_mode="HTML")
+
+
+def _format_status_text(chat_id: int, pending: int = 0, next_at: datetime | None = None) -> str:
+    jobs = get_job_registry().all()
+    mine = [j for j in jobs if j.chat_id == chat_id]
+    if not mine:
+        text = "✅ В этом чате сейчас ничего не выполняется."
+    else:
+        job = mine[0]
+        text = (
+            "⏳ <b>Идёт проверка тендеров</b>\n\n"
+            f"• Запущена: {job.started_at.strftime('%H:%M:%S')} ({job.elapsed:.0f} с назад)\n"
+            f"• Этап: {html.escape(job.stage or '—')}"
+        )
+        if job.cancelled:
+            text += "\n• Отмена запрошена, дожидаюсь остановки…"
+    if pending:
+        text += f"\n• В очереди на отправку сообщений: {pending}"
+    sub = get_subscriptions().get(chat_id)
+    if sub is not None:
+        text += f"\n\n🔔 Фоновая проверка: каждые {sub.interval_min} мин"
+        text += f", тихие часы {sub.quiet_hours}" if sub.quiet_hours else ""
+        if next_at is not None:
+            text += f"; следующая в {next_at.astimezone().strftime('%H:%M')}"
+        if sub.last_run:
+            text += f"\n• Последняя: {sub.last_run.replace('T', ' ')}, новых подходящих — {sub.last_new}"
+    if len(jobs) > len(mine):
+        text += f"\n\nВсего задач в боте: {len(jobs)}"
+    return text
+
+
+async def status_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    chat_id = update.effective_chat.id
+    job = get_job_registry().get(chat_id)
+    # без подписки JobQueue не трогаем: PTB предупреждает, если его нет
+    next_at = next_run(context.job_queue, chat_id) if get_subscriptions().get(chat_id) else None
+    await update.message.reply_text(
+        _format_status_text(chat_id, get_send_scheduler(context.bot).pending(chat_id), next_at),
+        parse_mode="HTML",
+        reply_markup=cancel_keyboard() if job is not None and not job.cancelled else None,
+    )
+
+
+def _format_profile_text(chat_id: int, limit: int) -> str:
+    profiles = run_profile.recent_profiles(limit=limit, chat_id=chat_id)
+    if not profiles:
+        return "⏱ Профилей запусков пока нет — запусти проверку."
+    summary = run_profile.summarize(profiles)
+    parts = [f"⏱ <b>Профиль последних {len(profiles)} запусков</b> (p50 / p95)", ""]
+    for name, value in summary["stages"].items():
+        parts.append(f"• {run_profile.STAGE_LABELS[name]}: {value['p50']:.1f} с / {value['p95']:.1f} с")
+    if summary["counters"]:
+        parts.append("")
+        for name, value in summary["counters"].items():
+            parts.append(f"• {run_profile.COUNTER_LABELS[name]}: {value['p50']:.0f} / {value['p95']:.0f}")
+    last = profiles[-1]
+    parts.append("")
+    parts.append(f"Последний запуск: {last['started'].replace('T', ' ')}, {last['stages'].get('total', 0):.1f} с")
+    if last.get("capture"):
+        parts.append(f"Снимки cProfile/tracemalloc: <code>{html.escape(last['capture'])}.*</code>")
+    return "\n".join(parts)
+
+
+async def profile_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    chat_id = update.effective_chat.id
+    args = context.args or []
+    if args and args[0].lower() == "capture":
+        run_profile.request_capture(chat_id)
+        await update.message.reply_text(
+            "🔬 Следующий запуск в этом чате сниму с cProfile и tracemalloc "
+            "(файлы — в data/profiles/)."
+        )
+        return
+    try:
+        limit = max(1, min(int(args[0]), run_profile.KEEP_PROFILES)) if args else 10
+    except ValueError:
+        limit = 10
+    text = await to_thread(_format_profile_text, chat_id, limit)
+    await update.message.reply_text(text, parse_mode="HTML")
+
+
+async def export_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    chat_id = update.effective_chat.id
+    result = get_results_cache().latest(chat_id)
+    if result is None:
+        await update.message.reply_text("Выгружать нечего — сначала запусти проверку.")
+        return
+    fmt = (context.args or [None])[0]
+    await _send_digest(context.bot, chat_id, result, fmt)
+
+
 async def cmd_rost_mce(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await rost_mce(update, context, from_callback=False)
+    args = {a.lower() for a in context.args or []}
+    await rost_mce(
+        update,
+        context,
+        from_callback=False,
+        reshow=bool(args & {"all", "все"}),
+        fresh=bool(args & {"now", "сейчас"}),
+    )
+
+
+async def subscribe_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    chat_id = update.effective_chat.id
+    if context.job_queue is None:
+        await update.message.reply_text(
+            "Фоновая проверка недоступна: не установлен JobQueue "
+            "(pip install \"python-telegram-bot[job-queue]\")."
+        )
+        return
+    args = context.args or []
+    try:
+        interval = int(args[0]) if args else None
+        quiet = None
+        if len(args) > 1:
+            quiet = args[1] if parse_quiet_hours(args[1]) else ""
+    except ValueError:
+        await update.message.reply_text(
+            "Формат: /subscribe [минут] [тихие часы]\n"
+            f"Например: /subscribe 30 22-8 или /subscribe 60 нет (по умолчанию — {SCHEDULE_INTERVAL_MIN} мин)."
+        )
+        return
+    sub = get_subscriptions().subscribe(chat_id, interval, quiet)
+    schedule_chat(context.job_queue, sub, scheduled_check)
+    await update.message.reply_text(
+        f"🔔 Фоновая проверка включена: каждые {sub.interval_min} мин"
+        + (f", кроме {sub.quiet_hours} ч" if sub.quiet_hours else "")
+        + ".\n\nНовые подходящие тендеры пришлю сам. Кнопка «Проверить тендеры» "
+        f"в течение {SCHEDULE_WARM_SECONDS / 60:.0f} мин после фоновой проверки отвечает сразу, без обхода."
+    )
+
+
+async def unsubscribe_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    chat_id = update.effective_chat.id
+    removed = get_subscriptions().unsubscribe(chat_id)
+    if removed and context.job_queue is not None:
+        unschedule_chat(context.job_queue, chat_id)
+    await update.message.reply_text(
+        "🔕 Фоновая проверка выключена." if removed else "Фоновая проверка и так не включена."
+    )
 
 
 # ================== ОСНОВНАЯ ЛОГИКА ПОИСКА ==================
 
 
-async def rost_mce(update: Update, context: ContextTypes.DEFAULT_TYPE, from_callback: bool = False):
+async def rost_mce(
+    update: Update,
+    context: ContextTypes.DEFAULT_TYPE,
+    from_callback: bool = False,
+    reshow: bool = False,
+    fresh: bool = False,
+):
     """
     1) Тянем тендеры с Ростендера с учётом keywords/exclude/city и параметров поиска.
-    2) Прогоняем через локальный фильтр MCE.
-    3) Если локальный фильтр никого не нашёл — отправляем в GPT первые N тендеров.
-    4) GPT решает, что подходит.
+    2) Склеиваем почти-дубликаты в кластеры; для кластеров с известным вердиктом
+       (из прошлых запусков) дальше ничего не делаем. Кластеры, уже присланные
+       в этот чат, пропускаем совсем (reshow=True — присылаем заново).
+       Если чат подписан и фоновая проверка была недавно — сразу отдаём её
+       результаты из кэша (fresh=True — всё равно проверяем заново).
+    3) Прогоняем представителей кластеров через локальный фильтр MCE.
+    4) Кандидатов ранжируем (приоритет МЦЭ, срок, ключи) и отдаём в GPT столько,
+       сколько влезает в бюджет запуска по времени и деньгам (gpt_candidates.py);
+       если локальный фильтр никого не нашёл — ранжируем всех.
+    5) GPT решает, что подходит; вердикт разносим на весь кластер.
+    6) Подходящие присылаем сразу по мере ответов ИИ, статус-сообщение
+       обновляем счётчиками, итоговую статистику — в самом конце.
     """
     chat_id = update.effective_chat.id
+    warm = None if reshow or fresh else _warm_results(chat_id)
+    if warm is not None:
+        await _send_warm_results(context.bot, chat_id, warm)
+        return
 
-    if from_callback:
-        query = update.callback_query
-        msg = await context.bot.edit_message_text(
-            chat_id=chat_id,
-            message_id=query.message.message_id,
-            text="⏳ Загружаю тендеры Ростендера...",
+    registry = get_job_registry()
+    sender = get_send_scheduler(context.bot)
+    job = registry.start(chat_id, "rost_mce")
+    if job is None:
+        # обход уже идёт: второй параллельно не запускаем
+        running = registry.get(chat_id)
+        await sender.send(
+            chat_id,
+            f"⏳ Проверка уже идёт ({running.elapsed:.0f} с): {running.stage or 'запуск'}\n"
+            "Дождись результата или отмени её.",
+            reply_markup=cancel_keyboard(),
         )
-    else:
-        msg = await context.bot.send_message(chat_id, "⏳ Загружаю тендеры Ростендера...")
+        return
 
+    try:
+        if from_callback:
+            query = update.callback_query
+            msg = await sender.call(
+                chat_id,
+                lambda: context.bot.edit_message_text(
+                    chat_id=chat_id,
+                    message_id=query.message.message_id,
+                    text="⏳ Загружаю тендеры Ростендера...",
+                    reply_markup=cancel_keyboard(),
+                ),
+            )
+        else:
+            msg = await sender.send(chat_id, "⏳ Загружаю тендеры Ростендера...", reply_markup=cancel_keyboard())
+        status = _LiveStatus(msg, job=job, reply_markup=cancel_keyboard(), sender=sender)
+
+        # сама проверка — отдельной задачей, чтобы кнопка «Отменить» могла её прервать;
+        # профиль запуска задача получает через контекст
+        with run_profile.profile_run(chat_id):
+            job.task = asyncio.create_task(_check_tenders(context, chat_id, status, job, reshow=reshow))
+            try:
+                await job.task
+            except asyncio.CancelledError:
+                if not job.cancelled:
+                    raise
+                log.info("Проверка в чате %s отменена через %.0f с", chat_id, job.elapsed)
+                status.reply_markup = None
+                await status.update(stage="⛔ Проверка отменена.", force=True)
+    finally:
+        registry.finish(job)
+
+
+async def _mark_delivered(ledger: Any, chat_id: int, deliveries: list[Any], clusters: list[Any]) -> None:
+    """
+    Ждём карточки из очереди отправки и отмечаем в журнале доставки все тендеры
+    кластеров, чьи карточки дошли.
+    """
+    sent = await gather(*deliveries, return_exceptions=True)
+    delivered = [t for cluster, r in zip(clusters, sent) if not isinstance(r, BaseException) for t in cluster.members]
+    if delivered:
+        await to_thread(ledger.mark, chat_id, delivered)
+
+
+async def _check_tenders(
+    context: ContextTypes.DEFAULT_TYPE,
+    chat_id: int,
+    status: _LiveStatus,
+    job: Job,
+    reshow: bool = False,
+    background: bool = False,
+) -> None:
     include_words = get_keywords()
     exclude_words = get_exclude_keywords()
     city_filter = get_city()
     days = get_search_days()
     pages = get_max_pages()
+    filters_key = _filters_key()
 
     def load_tenders():
+        # детали тянем позже и только для тех, кто реально пойдёт в GPT
         return fetch_rostender_tenders_filtered(
             days=days,
             max_pages=pages,
+            with_details=False,
             include_words=include_words,
             exclude_words=exclude_words,
             city_filter=city_filter,
+            cancel=job.cancel_event,
         )
 
-    tenders = await to_thread(load_tenders)
+    tenders = await to_thread(run_profile.call_profiled, load_tenders)
     total_tenders = len(tenders)
 
     if not tenders:
-        await msg.edit_text(f"⚠ За последние {days} дн. новых тендеров не найдено.")
+        status.reply_markup = None
+        await status.update(stage=f"⚠ За последние {days} дн. новых тендеров не найдено.", force=True)
+        if background:
+            get_subscriptions().touch(chat_id, 0)
         return
 
     log.info(
@@ -331,112 +979,400 @@ async def rost_mce(update: Update, context: ContextTypes.DEFAULT_TYPE, from_call
         days,
         pages,
     )
+    await status.update(stage="🔎 Склеиваю дубликаты и прогоняю локальный фильтр МЦЭ...", fetched=total_tenders)
+
+    # ---------------- ДУБЛИКАТЫ ----------------
+    fingerprint = verdict_fingerprint()
+    with run_profile.stage("dedup"):
+        dedup = await to_thread(DedupIndex.load)
+        clusters = dedup.group(tenders, fingerprint=fingerprint)
+        # уже присланные в этот чат (тот же номер и то же содержимое) дальше не идут:
+        # ни карточек, ни ИИ, ни повторной отправки
+        ledger = get_delivery_ledger()
+        delivery_status = await to_thread(ledger.status, chat_id, tenders)
+    seen_clusters = [] if reshow else [
+        c for c in clusters if all(delivery_status.get(t.number) == STATUS_SEEN for t in c.members)
+    ]
+    seen_ids = {c.cluster_id for c in seen_clusters}
+    fresh_clusters = [c for c in clusters if c.cluster_id not in seen_ids]
+    changed_clusters = sum(
+        1 for c in fresh_clusters if any(delivery_status.get(t.number) == STATUS_CHANGED for t in c.members)
+    )
+    cluster_by_number = {c.representative.number: c for c in clusters}
+    known_clusters = [c for c in fresh_clusters if c.verdict is not None]
+    representatives = [c.representative for c in fresh_clusters if c.verdict is None]
+    CACHE_LOOKUPS.inc("dedup", "hit", value=len(known_clusters))
+    CACHE_LOOKUPS.inc("dedup", "miss", value=len(representatives))
+    log.info(
+        "Дубликаты: %d тендеров -> %d кластеров, уже присылали %d, вердикт уже известен для %d",
+        total_tenders,
+        len(clusters),
+        len(seen_clusters),
+        len(known_clusters),
+    )
 
     # ---------------- ЛОКАЛЬНЫЙ ФИЛЬТР МЦЭ ----------------
     local_items_full: list[tuple[object, object | None]] = []
-    for t in tenders:
-        desc = _get_desc_for_local(t)
-        customer = getattr(t, "customer", None) or (t.city or "") or (t.region or "")
-
-        local = analyze_tender(
-            code=t.number,
-            title=t.title,
-            url=t.url,
-            customer=customer,
-            description=desc,
-        )
+    with run_profile.stage("local_filter"):
+        for t in representatives:
+            desc = _get_desc_for_local(t)
+            customer = getattr(t, "customer", None) or (t.city or "") or (t.region or "")
+
+            local = analyze_tender(
+                code=t.number,
+                title=t.title,
+                url=t.url,
+                customer=customer,
+                description=desc,
+            )
 
-        is_local_match = getattr(local, "is_local_match", getattr(local, "is_match", False))
-        if is_local_match:
-            local_items_full.append((t, local))
+            is_local_match = getattr(local, "is_local_match", getattr(local, "is_match", False))
+            if is_local_match:
+                local_items_full.append((t, local))
 
     local_found = len(local_items_full)
     log.info("Локальный фильтр МЦЭ: нашёл %d тендеров", local_found)
 
-    # выбираем, кого отправлять в GPT
+    # выбираем, кого отправлять в GPT: лучших по рангу, сколько влезает в бюджет запуска;
+    # план и журнал расходов читают файлы с диска — не в event loop
+    candidates = local_items_full or [(t, None) for t in representatives]
+    budget = await to_thread(get_ledger().budget_status) if candidates else BUDGET_OK
+    # у края лимита расходов ИИ не зовём (ниже), а план нужен только для
+    # локальных решений — деньгами его не ограничиваем
+    plan = await to_thread(plan_candidates, candidates, cost_budget=None if budget == BUDGET_OK else math.inf)
+    local_items = plan.selected
+    sent_to_gpt = len(local_items)
     if local_found:
-        local_items_full.sort(
-            key=lambda pair: (
-                getattr(pair[1], "priority_level", 0),
-                getattr(pair[0], "published", None),
-                getattr(pair[0], "number", ""),
-            ),
-            reverse=True,
+        await status.update(
+            stage=f"🤖 Локальный фильтр МЦЭ нашёл {local_found} кандидатов. Отправляю в ИИ {sent_to_gpt} лучших...",
+            local=local_found,
+            sent=sent_to_gpt,
+            force=True,
         )
-        local_items = local_items_full[:MAX_GPT_TENDERS]
-        sent_to_gpt = len(local_items)
-        await msg.edit_text(
-            f"🤖 Локальный фильтр МЦЭ нашёл {local_found} кандидатов. "
-            f"Отправляю в ИИ {sent_to_gpt} лучших..."
-        )
-    else:
+    elif representatives:
         # fallback: если локальный фильтр никого не нашёл — всё равно что-то отдадим в GPT
-        sent_to_gpt = min(MAX_GPT_TENDERS, total_tenders)
-        local_items = [(t, None) for t in tenders[:sent_to_gpt]]
         log.info(
             "Локальный фильтр МЦЭ не нашёл подходящих тендеров. "
-            "Отправляю в GPT первые %d тендеров без локального отбора.",
+            "Отправляю в GPT %d тендеров без локального отбора.",
             sent_to_gpt,
         )
-        await msg.edit_text(
-            "⚠ Локальный фильтр МЦЭ не нашёл подходящих тендеров.\n"
-            f"Отправляю в ИИ первые {sent_to_gpt} тендеров для проверки."
+        await status.update(
+            stage=(
+                "⚠ Локальный фильтр МЦЭ не нашёл подходящих тендеров.\n"
+                f"Отправляю в ИИ {sent_to_gpt} самых срочных тендеров для проверки."
+            ),
+            local=0,
+            sent=sent_to_gpt,
+            force=True,
         )
 
-    # --- GPT в отдельном потоке ---
-    def gpt_job():
-        return ask_gpt_about_tenders(local_items)
-
-    gpt_results = await to_thread(gpt_job)
-    gpt_answers = len(gpt_results)
+    # --- лимит расходов: у самого края решаем только локальным фильтром ---
+    budget_note = None
+    local_only: list[tuple[Any, Any]] = []
+    if budget != BUDGET_OK:
+        budget_note = _budget_note(budget)
+        local_only = [
+            (t, local) for (t, local) in local_items if getattr(local, "priority_level", 0) == 1
+        ]
+        log.warning("GPT пропущен: %s; локальных решений %d", budget_note, len(local_only))
+        local_items = []
+        sent_to_gpt = 0
+
+    # --- результаты отправляем по мере готовности, не дожидаясь всего прогона ---
+    # карточки идут через общий планировщик: он держит лимиты Telegram и ждёт
+    # RetryAfter сам, а в компактном режиме склеивает карточки из очереди
+    matched_count = 0
+    results = get_results_cache().new(chat_id)
+    compact = get_compact_mode()
+    sender = get_send_scheduler(context.bot)
+    packed_before = sender.packed
+    deliveries: list[Any] = []
+    # кластер каждой карточки: после доставки отмечаем в журнале всех его участников
+    delivery_clusters: list[Any] = []
+    # результаты локального фильтра — для выгрузки (приоритет, ключевые слова)
+    local_by_number = {t.number: local for (t, local) in local_items_full}
+
+    async def send_card(t: Any, reason: str, cluster: Any, confidence: float | None, without_ai: bool = False):
+        nonlocal matched_count
+        matched_count += 1
+        results.add(
+            KIND_MATCHED,
+            ResultItem.from_tender(t, reason, confidence, local_only=without_ai, local=local_by_number.get(t.number)),
+        )
+        if compact:
+            text = _format_tender_card_compact(t, reason, confidence=confidence, local_only=without_ai)
+        else:
+            duplicates = [d.number for d in cluster.duplicates] + cluster.earlier_numbers
+            text = _format_tender_message(
+                t,
+                reason,
+                duplicates=duplicates,
+                confidence=confidence,
+                local_only=without_ai,
+            )
+        deliveries.append(
+            sender.submit(
+                chat_id,
+                text,
+                pack=compact,
+                parse_mode="HTML",
+                disable_web_page_preview=compact,
+            )
+        )
+        delivery_clusters.append(cluster)
+
+    try:
+        for cluster in seen_clusters:
+            verdict = cluster.verdict or {}
+            results.add(
+                KIND_SEEN,
+                ResultItem.from_tender(cluster.representative, verdict.get("reason", ""), verdict.get("confidence")),
+            )
 
-    if not gpt_results:
-        await msg.edit_text("⚠ ИИ не вернул ни одного подходящего тендера (или произошла ошибка).")
-        # даже если ошибка, покажем статистику до этого места
-        stats_text = (
-            "📊 <b>Статистика запуска</b>\n\n"
-            f"• Всего тендеров с Ростендера: <b>{total_tenders}</b>\n"
-            f"• Прошли локальный фильтр МЦЭ: <b>{local_found}</b>\n"
-            f"• Отправлено в GPT: <b>{sent_to_gpt}</b>\n"
-            f"• Ответов от GPT: <b>{gpt_answers}</b>\n"
-            f"• GPT признал подходящими: <b>0</b>\n"
+        # вердикты из прошлых запусков известны сразу; самые уверенные — первыми
+        known_matches = [c for c in known_clusters if c.verdict.get("is_match")]
+        known_matches.sort(
+            key=lambda c: c.verdict.get("confidence") if c.verdict.get("confidence") is not None else 0.5,
+            reverse=True,
         )
-        await context.bot.send_message(chat_id, stats_text, parse_mode="HTML")
-        return
+        for cluster in known_matches:
+            await send_card(
+                cluster.representative,
+                cluster.verdict.get("reason", ""),
+                cluster,
+                cluster.verdict.get("confidence"),
+            )
+        for cluster in known_clusters:
+            if not cluster.verdict.get("is_match"):
+                results.add(
+                    KIND_REJECTED,
+                    ResultItem.from_tender(
+                        cluster.representative, cluster.verdict.get("reason", ""), cluster.verdict.get("confidence")
+                    ),
+                )
 
-    good_codes = {r.code for r in gpt_results if r.is_match}
-    good_reasons = {r.code: r.reason for r in gpt_results if r.is_match}
-    good_tenders = [t for (t, _local) in local_items if t.number in good_codes]
-    matched_count = len(good_tenders)
+        # решения без ИИ в кластеры не пишем: при следующем запуске их проверит GPT
+        for t, local in local_only:
+            cluster = cluster_by_number.get(t.number)
+            if cluster is not None:
+                keywords = ", ".join(sorted(getattr(local, "matched_keywords", []) or []))
+                reason = f"Профильные ключи: {keywords}" if keywords else "Высокий приоритет по профилю МЦЭ"
+                await send_card(t, reason, cluster, None, without_ai=True)
+        local_only_count = matched_count - len(known_matches)
+
+        # кандидаты, которые до ИИ не дошли (бюджет запуска, лимит расходов, срок) — для просмотра
+        evaluated = {t.number for (t, _local) in local_items} | {t.number for (t, _local) in local_only}
+        left_out = [(t, local, budget_note) for (t, local) in plan.selected] if budget_note else []
+        left_out += [(c.tender, c.local, "не вошёл в бюджет ИИ") for c in plan.left_out]
+        left_out += [(c.tender, c.local, "приём заявок закончился") for c in plan.closed]
+        for t, local, why in left_out:
+            if t.number in evaluated:
+                continue
+            keywords = ", ".join(sorted(getattr(local, "matched_keywords", []) or []))
+            reason = f"{why}; профильные ключи: {keywords}" if keywords else why
+            results.add(KIND_LOCAL, ResultItem.from_tender(t, reason[:1].upper() + reason[1:], local=local))
+
+        # --- детали в отдельном потоке, GPT — параллельно на общем async-клиенте ---
+        gpt_answers = 0
+        gpt_stats = GPTRunStats()
+        if local_items:
+            await status.update(
+                stage=f"📄 Загружаю карточки {sent_to_gpt} тендеров для ИИ...",
+                matched=matched_count,
+                force=True,
+            )
+            await to_thread(
+                run_profile.call_profiled, fill_details, [t for (t, _local) in local_items], job.cancel_event
+            )
+            await status.update(stage="🤖 ИИ проверяет кандидатов, подходящие присылаю сразу...", force=True)
+            with run_profile.stage("gpt"), track_run(chat_id):
+                async for r in iter_gpt_verdicts(local_items, stats=gpt_stats):
+                    gpt_answers += 1
+                    # разносим вердикт на кластер и запоминаем его для следующих запусков
+                    cluster = cluster_by_number.get(r.code)
+                    if cluster is not None:
+                        dedup.set_verdict(
+                            cluster.cluster_id, r.is_match, r.reason, fingerprint=fingerprint, confidence=r.confidence
+                        )
+                        if r.is_match:
+                            await send_card(cluster.representative, r.reason, cluster, r.confidence)
+                        else:
+                            results.add(
+                                KIND_REJECTED,
+                                ResultItem.from_tender(
+                                    cluster.representative,
+                                    r.reason,
+                                    r.confidence,
+                                    local=local_by_number.get(cluster.representative.number),
+                                ),
+                            )
+                    await status.update(answered=gpt_answers, matched=matched_count)
+            run_profile.add("gpt_tenders", len(local_items))
+            run_profile.add("gpt_requests", gpt_stats.requests)
+            run_profile.add("gpt_tokens", gpt_stats.total_tokens)
+        await to_thread(dedup.save)
+        if gpt_stats.dropped:
+            by_number = {t.number: t for (t, _local) in local_items}
+            for code in gpt_stats.dropped:
+                if code in by_number:
+                    results.add(
+                        KIND_LOCAL,
+                        ResultItem.from_tender(
+                            by_number[code], "ИИ не ответил (ошибка или лимит API)", local=local_by_number.get(code)
+                        ),
+                    )
+
+        stats_text = _format_stats_text(
+            total_tenders=total_tenders,
+            clusters=len(clusters),
+            known_verdicts=len(known_clusters),
+            local_found=local_found,
+            sent_to_gpt=sent_to_gpt,
+            gpt_answers=gpt_answers,
+            matched_count=matched_count,
+            gpt_stats=gpt_stats,
+            budget_note=budget_note,
+            plan=plan,
+            seen_clusters=len(seen_clusters),
+            changed_clusters=changed_clusters,
+            new_clusters=sum(1 for c in fresh_clusters if c.first_seen),
+            reshow=reshow,
+        )
 
-    # сначала всегда шлём статистику
-    stats_text = (
-        "📊 <b>Статистика запуска</b>\n\n"
-        f"• Всего тендеров с Ростендера: <b>{total_tenders}</b>\n"
-        f"• Прошли локальный фильтр МЦЭ: <b>{local_found}</b>\n"
-        f"• Отправлено в GPT: <b>{sent_to_gpt}</b>\n"
-        f"• Ответов от GPT: <b>{gpt_answers}</b>\n"
-        f"• GPT признал подходящими: <b>{matched_count}</b>\n"
+        if not fresh_clusters:
+            stage = f"🟢 Новых тендеров нет: все {len(seen_clusters)} найденных уже присылал."
+        elif local_items and not gpt_answers and not matched_count:
+            if gpt_stats.dropped:
+                stage = f"⚠ ИИ не смог проверить {len(gpt_stats.dropped)} тендер(ов) из-за ошибок или лимитов API."
+            else:
+                stage = "⚠ ИИ не вернул ни одного подходящего тендера (или произошла ошибка)."
+        elif not matched_count:
+            if budget_note:
+                stage = f"⚠ {budget_note}. Локальный фильтр уверенных кандидатов не нашёл."
+            else:
+                stage = "❌ ИИ не нашёл подходящих тендеров среди кандидатов."
+        elif local_only_count:
+            stage = (
+                f"🟡 {budget_note}. Найдено {matched_count} тендер(ов), "
+                f"из них {local_only_count} — только по локальному фильтру."
+            )
+        else:
+            stage = f"🟢 Готово: подходящих тендеров — {matched_count}."
+        status.reply_markup = None
+        await status.update(stage=stage, answered=gpt_answers, matched=matched_count, force=True)
+
+        # ждём, пока уйдут все карточки: очередь чата отдаёт их по порядку
+        with run_profile.stage("telegram"):
+            sent = await shield(gather(*deliveries, return_exceptions=True))
+    finally:
+        # в журнал — только то, что реально дошло: недоставленное пришлём в следующий раз.
+        # Отмена проверки очередь не чистит — уже поставленные карточки дождёмся и тоже
+        # отметим, иначе следующий запуск покажет их снова
+        await shield(_mark_delivered(ledger, chat_id, deliveries, delivery_clusters))
+    failed = sum(1 for r in sent if isinstance(r, BaseException))
+    if failed:
+        log.warning("Не доставлено карточек: %d из %d", failed, len(sent))
+    packed = sender.packed - packed_before
+    if packed:
+        stats_text += f"• Компактный режим: карточек склеено в общие сообщения: <b>{packed}</b>\n"
+
+    # итоговая статистика — в конце, когда всё уже пришло; к ней кнопки просмотра
+    # результатов из кэша (без повторного парсинга и ИИ)
+    results.summary = stats_text
+    results.scheduled = background
+    results.filters_key = filters_key
+    get_results_cache().put(results)
+    summary_text = stats_text
+    if background:
+        # фоновая проверка молчит, если нового нет; полная статистика — по кнопке из кэша
+        get_subscriptions().touch(chat_id, matched_count)
+        if not matched_count:
+            run_profile.add("tg_messages", len(deliveries))
+            return
+        summary_text = f"🔔 <b>Фоновая проверка</b>: новых подходящих тендеров — {matched_count}."
+    with run_profile.stage("telegram"):
+        await sender.send(chat_id, summary_text, parse_mode="HTML", reply_markup=_results_summary_keyboard(results))
+    run_profile.add("tg_messages", len(deliveries) + 1)
+
+
+def _filters_key() -> str:
+    # результат фоновой проверки годится для выдачи, только если настройки с тех пор не менялись
+    return repr(
+        (
+            get_keywords(),
+            get_exclude_keywords(),
+            get_city(),
+            get_search_days(),
+            get_max_pages(),
+            get_gpt_filter_text(),
+            get_gpt_rubric_text(),
+        )
     )
-    await context.bot.send_message(chat_id, stats_text, parse_mode="HTML")
 
-    if not good_tenders:
-        await msg.edit_text("❌ ИИ не нашёл подходящих тендеров среди кандидатов.")
-        return
 
-    await msg.edit_text(
-        f"🟢 ИИ нашёл {matched_count} подходящих тендер(ов). Отправляю детальный список..."
+def _warm_results(chat_id: int) -> ResultSet | None:
+    if get_subscriptions().get(chat_id) is None:
+        return None
+    result = get_results_cache().latest(chat_id)
+    if result is None or not result.scheduled:
+        return None
+    if time.monotonic() - result.created > SCHEDULE_WARM_SECONDS:
+        return None
+    if result.filters_key != _filters_key():
+        return None
+    return result
+
+
+async def _send_warm_results(bot: Any, chat_id: int, result: ResultSet) -> None:
+    age = (time.monotonic() - result.created) / 60
+    rows = [list(row) for row in (_results_summary_keyboard(result) or InlineKeyboardMarkup([])).inline_keyboard]
+    rows.append([InlineKeyboardButton("🔄 Проверить сейчас", callback_data="run_now")])
+    await get_send_scheduler(bot).send(
+        chat_id,
+        f"⚡ Результаты фоновой проверки {age:.0f} мин назад — новые подходящие я уже присылал.\n\n"
+        + result.summary,
+        parse_mode="HTML",
+        reply_markup=InlineKeyboardMarkup(rows),
     )
 
-    for t in good_tenders:
-        reason = good_reasons.get(t.number, "")
-        text = _format_tender_message(t, reason)
-        await context.bot.send_message(
-            chat_id,
-            text,
-            parse_mode="HTML",
-            disable_web_page_preview=False,
-        )
+
+async def scheduled_check(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Задача JobQueue: фоновая проверка подписанного чата без статус-сообщения;
+    присылает только новые подходящие тендеры (журнал доставки отсекает остальное).
+    """
+    chat_id = context.job.chat_id
+    sub = get_subscriptions().get(chat_id)
+    if sub is None:
+        context.job.schedule_removal()
+        return
+    if in_quiet_hours(sub.quiet_hours):
+        log.info("Фоновая проверка чата %s пропущена: тихие часы %s", chat_id, sub.quiet_hours)
+        return
+
+    # общий лимит: фоновые проверки разных чатов не идут к Ростендеру и ИИ разом
+    async with schedule_slot():
+        registry = get_job_registry()
+        job = registry.start(chat_id, "schedule")
+        if job is None:
+            log.info("Фоновая проверка чата %s пропущена: уже идёт проверка", chat_id)
+            return
+        try:
+            with run_profile.profile_run(chat_id):
+                job.task = asyncio.create_task(
+                    _check_tenders(context, chat_id, _LiveStatus(None, job=job), job, background=True)
+                )
+                try:
+                    await job.task
+                except asyncio.CancelledError:
+                    if not job.cancelled:
+                        raise
+                    log.info("Фоновая проверка чата %s отменена", chat_id)
+        except Exception:
+            # упавшая фоновая проверка не должна снимать задачу с расписания
+            log.exception("Фоновая проверка чата %s упала", chat_id)
+        finally:
+            registry.finish(job)
 
 
 # ================== НАСТРОЙКИ ЧЕРЕЗ КНОПКИ/ТЕКСТ ==================
@@ -446,7 +1382,8 @@ async def set_keywords_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     context.user_data["awaiting"] = "keywords"
     await update.message.reply_text(
         "Введи <b>ключевые слова</b> через запятую.\n\n"
-        "Пример: узел учета, сикг, газоанализ",
+        "Пример: узел учета, сикг, газоанализ\n\n"
+        f"{QUERY_SYNTAX_HELP}",
         parse_mode="HTML",
         reply_markup=settings_menu_keyboard(),
     )
@@ -456,7 +1393,8 @@ async def set_exclude_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     context.user_data["awaiting"] = "exclude"
     await update.message.reply_text(
         "Введи <b>исключающие слова</b> через запятую.\n\n"
-        "Пример: строительство, ремонт, благоустройство",
+        "Пример: строительство, ремонт, title:благоустройство\n\n"
+        f"{QUERY_SYNTAX_HELP}",
         parse_mode="HTML",
         reply_markup=settings_menu_keyboard(),
     )
@@ -482,6 +1420,17 @@ async def set_gpt_filter_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE)
     )
 
 
+async def set_gpt_rubric_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    context.user_data["awaiting"] = "gpt_rubric"
+    await update.message.reply_text(
+        "Введи <b>профиль и примеры для GPT</b> — идут в промпт сразу после фильтра: "
+        "что подходит, что нет, примеры оценок.\n\n"
+        "Отправь «-», чтобы оставить только текст фильтра.",
+        parse_mode="HTML",
+        reply_markup=settings_menu_keyboard(),
+    )
+
+
 async def text_router(update: Update, context: ContextTypes.DEFAULT_TYPE):
     mode = context.user_data.get("awaiting")
     txt = (update.message.text or "").strip()
@@ -495,7 +1444,14 @@ async def text_router(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     if mode == "keywords":
-        items = [w.strip() for w in txt.split(",") if w.strip()]
+        items = split_query_list(txt)
+        error = validate_query_list(items)
+        if error:
+            await update.message.reply_text(
+                f"⚠ Ошибка в выражении {error}. Исправь и пришли список ещё раз.",
+                reply_markup=settings_menu_keyboard(),
+            )
+            return
         set_keywords(items)
         context.user_data["awaiting"] = None
         await update.message.reply_text(
@@ -505,7 +1461,14 @@ async def text_router(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     if mode == "exclude":
-        items = [w.strip() for w in txt.split(",") if w.strip()]
+        items = split_query_list(txt)
+        error = validate_query_list(items)
+        if error:
+            await update.message.reply_text(
+                f"⚠ Ошибка в выражении {error}. Исправь и пришли список ещё раз.",
+                reply_markup=settings_menu_keyboard(),
+            )
+            return
         set_exclude_keywords(items)
         context.user_data["awaiting"] = None
         await update.message.reply_text(
@@ -532,6 +1495,15 @@ async def text_router(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return
 
+    if mode == "gpt_rubric":
+        set_gpt_rubric_text("" if txt == "-" else txt)
+        context.user_data["awaiting"] = None
+        await update.message.reply_text(
+            "✅ Профиль и примеры для GPT обновлены.",
+            reply_markup=settings_menu_keyboard(),
+        )
+        return
+
     if mode == "period":
         parts = txt.split()
         if not parts:
@@ -592,10 +1564,32 @@ async def callbacks(update: Update, context: ContextTypes.DEFAULT_TYPE):
     data = query.data
     await query.answer()
 
+    if data.startswith("res:"):
+        await _show_results(query, update.effective_chat.id, data, context.bot)
+        return
+
+    if data == "cancel_job":
+        if not get_job_registry().cancel(update.effective_chat.id):
+            # задача уже закончилась — просто убираем кнопку
+            try:
+                await query.edit_message_reply_markup(reply_markup=None)
+            except TelegramError:
+                pass
+        return
+
     if data == "menu_rost_mce":
         await rost_mce(update, context, from_callback=True)
         return
 
+    if data == "run_now":
+        await rost_mce(update, context, fresh=True)
+        return
+
+    if data == "rerun_all":
+        # статистику прошлого запуска не трогаем — новый статус отдельным сообщением
+        await rost_mce(update, context, reshow=True)
+        return
+
     if data == "menu_settings":
         await query.edit_message_text(
             "⚙ <b>Настройки фильтра</b>\n\n"
@@ -609,7 +1603,8 @@ async def callbacks(update: Update, context: ContextTypes.DEFAULT_TYPE):
         context.user_data["awaiting"] = "keywords"
         await query.edit_message_text(
             "Введи <b>ключевые слова</b> через запятую.\n\n"
-            "Пример: узел учета, сикг, газоанализ",
+            "Пример: узел учета, сикг, газоанализ\n\n"
+            f"{QUERY_SYNTAX_HELP}",
             parse_mode="HTML",
             reply_markup=settings_menu_keyboard(),
         )
@@ -619,7 +1614,8 @@ async def callbacks(update: Update, context: ContextTypes.DEFAULT_TYPE):
         context.user_data["awaiting"] = "exclude"
         await query.edit_message_text(
             "Введи <b>исключающие слова</b> через запятую.\n\n"
-            "Пример: строительство, ремонт, благоустройство",
+            "Пример: строительство, ремонт, title:благоустройство\n\n"
+            f"{QUERY_SYNTAX_HELP}",
             parse_mode="HTML",
             reply_markup=settings_menu_keyboard(),
         )
@@ -664,6 +1660,21 @@ async def callbacks(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return
 
+    if data == "toggle_compact":
+        enabled = not get_compact_mode()
+        set_compact_mode(enabled)
+        await query.edit_message_text(
+            "🗜 <b>Компактный режим</b> " + ("включён" if enabled else "выключен") + ".\n\n"
+            + (
+                "Подходящие тендеры приходят короткими карточками, по нескольку в одном сообщении."
+                if enabled
+                else "Каждый подходящий тендер приходит отдельным подробным сообщением."
+            ),
+            parse_mode="HTML",
+            reply_markup=settings_menu_keyboard(),
+        )
+        return
+
     if data == "show_filters":
         text = _format_filters_text()
         await query.edit_message_text(
@@ -682,22 +1693,118 @@ async def callbacks(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
 
+async def _send_digest(bot: Any, chat_id: int, result: ResultSet, fmt: str | None = None) -> None:
+    document, filename = await to_thread(export_digest, result, fmt)
+    total = sum(result.count(k) for k in KIND_ORDER)
+    caption = (
+        f"📎 Все кандидаты запуска: {total} "
+        f"(подходят {result.count(KIND_MATCHED)}, отклонены {result.count(KIND_REJECTED)}, "
+        f"без ИИ {result.count(KIND_LOCAL)}, уже присылал {result.count(KIND_SEEN)})"
+    )
+
+    async def upload() -> Any:
+        # при повторе после RetryAfter файл читается заново с начала
+        document.seek(0)
+        return await bot.send_document(chat_id, document=document, filename=filename, caption=caption)
+
+    try:
+        await get_send_scheduler(bot).call(chat_id, upload)
+    finally:
+        document.close()
+
+
+async def _show_results(query: Any, chat_id: int, data: str, bot: Any) -> None:
+    # res:<run_id>:s — статистика; res:<run_id>:<раздел>:<страница>; res:<run_id>:x:<формат> — файл
+    parts = data.split(":")
+    result = get_results_cache().get(chat_id, parts[1]) if len(parts) >= 3 else None
+    if result is None:
+        await query.edit_message_reply_markup(reply_markup=None)
+        await query.message.reply_text("⌛ Результаты этого запуска устарели — запусти проверку заново.")
+        return
+
+    if parts[2] == "x":
+        await _send_digest(bot, chat_id, result, parts[3] if len(parts) > 3 else None)
+        return
+
+    if len(parts) < 4 or parts[2] not in KIND_TITLES:
+        text, markup = result.summary, _results_summary_keyboard(result)
+    else:
+        kind = parts[2]
+        try:
+            page = int(parts[3])
+        except ValueError:
+            page = 0
+        page = min(max(page, 0), result.pages(kind) - 1)
+        text, markup = _format_results_page(result, kind, page), _results_page_keyboard(result, kind, page)
+
+    try:
+        await query.edit_message_text(text, parse_mode="HTML", reply_markup=markup, disable_web_page_preview=True)
+    except TelegramError as e:
+        # двойное нажатие: «message is not modified»
+        log.debug("Не удалось показать результаты: %s", e)
+
+
 # ================== MAIN ==================
 
 
+async def _post_init(app) -> None:
+    # словари tiktoken грузим сейчас, а не в первой проверке на цикле событий
+    await to_thread(warm_encoders, GPT_MODEL_TIERS)
+    # подписки переживают перезапуск: ставим фоновые проверки заново
+    if app.job_queue is None:
+        if get_subscriptions().all():
+            log.warning('Есть подписки на фоновую проверку, но JobQueue нет: pip install "python-telegram-bot[job-queue]"')
+        return
+    count = schedule_all(app.job_queue, scheduled_check)
+    if count:
+        log.info("Фоновых проверок по расписанию: %d", count)
+
+
+async def _post_shutdown(app) -> None:
+    # закрываем keep-alive соединения к OpenAI и очередь исходящих сообщений
+    await get_job_registry().cancel_all()
+    await close_async_client()
+    await close_send_scheduler()
+    stop_metrics_server()
+
+
 def main():
-    app = ApplicationBuilder().token(TELEGRAM_BOT_TOKEN).build()
+    if not TELEGRAM_BOT_TOKEN:
+        raise RuntimeError("Не задан TELEGRAM_BOT_TOKEN в .env")
+
+    builder = (
+        ApplicationBuilder()
+        .token(TELEGRAM_BOT_TOKEN)
+        # апдейты обрабатываем параллельно: долгая проверка в одном чате не держит
+        # настройки и кнопки остальных; повторный запуск в том же чате не даёт реестр задач
+        .concurrent_updates(True)
+        .post_init(_post_init)
+        .post_shutdown(_post_shutdown)
+    )
+    if TELEGRAM_API_BASE_URL:
+        builder = builder.base_url(f"{TELEGRAM_API_BASE_URL}/bot").base_file_url(f"{TELEGRAM_API_BASE_URL}/file/bot")
+    if TELEGRAM_WEBHOOK_URL:
+        # апдейты приходят на вебхук, long polling (Updater) не нужен
+        builder = builder.updater(None)
+    app = builder.build()
 
     # команды
     app.add_handler(CommandHandler("start", start))
     app.add_handler(CommandHandler("filters", filters_cmd))
     app.add_handler(CommandHandler("rost_mce", cmd_rost_mce))
+    app.add_handler(CommandHandler("usage", usage_cmd))
+    app.add_handler(CommandHandler("status", status_cmd))
+    app.add_handler(CommandHandler("profile", profile_cmd))
+    app.add_handler(CommandHandler("export", export_cmd))
+    app.add_handler(CommandHandler("subscribe", subscribe_cmd))
+    app.add_handler(CommandHandler("unsubscribe", unsubscribe_cmd))
 
     # доп. команды для ручного вызова (дублируют кнопки)
     app.add_handler(CommandHandler("set_keywords", set_keywords_cmd))
     app.add_handler(CommandHandler("set_exclude", set_exclude_cmd))
     app.add_handler(CommandHandler("set_city", set_city_cmd))
     app.add_handler(CommandHandler("set_gpt_filter", set_gpt_filter_cmd))
+    app.add_handler(CommandHandler("set_gpt_rubric", set_gpt_rubric_cmd))
 
     # callback-кнопки
     app.add_handler(CallbackQueryHandler(callbacks))
@@ -705,8 +1812,17 @@ def main():
     # текст — когда бот кого-то "ждёт"
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, text_router))
 
+    # метрики Prometheus — если задан METRICS_PORT
+    TELEGRAM_QUEUE.set_function(pending_total)
+    JOBS_RUNNING.set_function(lambda: len(get_job_registry().all()))
+    if METRICS_PORT:
+        start_metrics_server()
+
     log.info("Бот запущен. Нажми /start в Telegram.")
-    app.run_polling()
+    if TELEGRAM_WEBHOOK_URL:
+        asyncio.run(serve_webhook(app))
+    else:
+        app.run_polling()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,252 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import timedelta
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+from telegram.error import NetworkError, RetryAfter, TimedOut
+
+from metrics import TELEGRAM_MESSAGES, TELEGRAM_RETRY_AFTER
+
+log = logging.getLogger(__name__)
+
+# Лимиты Telegram Bot API (официально — «примерно»):
+#   ~30 сообщений в секунду на бота, ~1 в секунду в один чат, ~20 в минуту в группу.
+# Берём с запасом, чтобы RetryAfter был исключением, а не нормой.
+TG_GLOBAL_RATE = float(os.getenv("TG_GLOBAL_RATE", "25") or 25)
+TG_CHAT_INTERVAL = float(os.getenv("TG_CHAT_INTERVAL", "1.05") or 1.05)
+TG_GROUP_INTERVAL = float(os.getenv("TG_GROUP_INTERVAL", "3.1") or 3.1)
+TG_SEND_RETRIES = 5
+
+# предел длины текста сообщения Telegram
+MESSAGE_LIMIT = 4096
+PACK_SEPARATOR = "\n\n" + "─" * 12 + "\n\n"
+
+
+def _seconds(value: Any) -> float:
+    # в новых версиях PTB retry_after — timedelta, в старых — int
+    if isinstance(value, timedelta):
+        return value.total_seconds()
+    return float(value or 0)
+
+
+@dataclass
+class _Outgoing:
+    text: str
+    kwargs: dict
+    pack: bool
+    future: asyncio.Future
+    packed_with: List["_Outgoing"] = field(default_factory=list)
+
+
+class SendScheduler:
+    """
+    Очередь исходящих сообщений бота.
+
+    - на каждый чат своя очередь и свой воркер: сообщения в чат уходят по порядку
+      и не чаще TG_CHAT_INTERVAL (для групп — TG_GROUP_INTERVAL);
+    - общий темп по всем чатам — не выше TG_GLOBAL_RATE в секунду;
+    - RetryAfter: ждём, сколько просит Telegram, и повторяем то же сообщение;
+    - pack=True: пока сообщение ждёт своей очереди, соседние «упаковываемые»
+      с теми же параметрами склеиваются в одно, до 4096 символов;
+    - call(): прочие запросы к чату (правка статуса, файл) — мимо очереди,
+      но с тем же темпом и обработкой RetryAfter.
+    """
+
+    def __init__(
+        self,
+        bot: Any,
+        global_rate: float = TG_GLOBAL_RATE,
+        chat_interval: float = TG_CHAT_INTERVAL,
+        group_interval: float = TG_GROUP_INTERVAL,
+    ) -> None:
+        self.bot = bot
+        self.global_interval = 1.0 / global_rate if global_rate > 0 else 0.0
+        self.chat_interval = chat_interval
+        self.group_interval = group_interval
+        self._queues: Dict[int, Deque[_Outgoing]] = {}
+        self._workers: Dict[int, asyncio.Task] = {}
+        self._chat_next: Dict[int, float] = {}
+        self._global_next = 0.0
+        self._global_lock = asyncio.Lock()
+        # счётчики для статистики/метрик
+        self.sent = 0
+        self.packed = 0
+        self.retry_after = 0
+
+    # ---------- постановка в очередь ----------
+
+    def submit(self, chat_id: int, text: str, pack: bool = False, **kwargs: Any) -> asyncio.Future:
+        """
+        Ставим сообщение в очередь и сразу возвращаем future с Message
+        (для склеенных — общий Message).
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(chat_id, deque()).append(
+            _Outgoing(text=text, kwargs=kwargs, pack=pack, future=future)
+        )
+        worker = self._workers.get(chat_id)
+        if worker is None or worker.done():
+            self._workers[chat_id] = asyncio.create_task(self._worker(chat_id))
+        return future
+
+    async def send(self, chat_id: int, text: str, pack: bool = False, **kwargs: Any) -> Any:
+        return await self.submit(chat_id, text, pack=pack, **kwargs)
+
+    async def drain(self, chat_id: int) -> None:
+        """
+        Дождаться, пока очередь чата опустеет.
+        """
+        worker = self._workers.get(chat_id)
+        if worker is not None and not worker.done():
+            await asyncio.shield(worker)
+
+    async def call(self, chat_id: int, request: Callable[[], Awaitable[Any]], retry: bool = True) -> Any:
+        """
+        Любой запрос к Bot API в чат с учётом лимитов: request() вызывается на каждую попытку.
+        retry=False — не повторяем, а отдаём исключение (правки статуса не критичны);
+        паузу из RetryAfter для чата всё равно запоминаем, чтобы не получить следующий.
+        """
+        return await self._request(chat_id, request, retry=retry)
+
+    def pending(self, chat_id: int) -> int:
+        return len(self._queues.get(chat_id) or ())
+
+    async def close(self) -> None:
+        for task in self._workers.values():
+            task.cancel()
+        for queue in self._queues.values():
+            for item in queue:
+                if not item.future.done():
+                    item.future.cancel()
+        self._workers.clear()
+        self._queues.clear()
+
+    # ---------- доставка ----------
+
+    def _take(self, queue: Deque[_Outgoing]) -> _Outgoing:
+        item = queue.popleft()
+        if not item.pack:
+            return item
+        parts = [item.text]
+        length = len(item.text)
+        while queue and queue[0].pack and queue[0].kwargs == item.kwargs:
+            nxt = queue[0]
+            if length + len(PACK_SEPARATOR) + len(nxt.text) > MESSAGE_LIMIT:
+                break
+            queue.popleft()
+            parts.append(nxt.text)
+            length += len(PACK_SEPARATOR) + len(nxt.text)
+            item.packed_with.append(nxt)
+        if item.packed_with:
+            self.packed += len(item.packed_with)
+            item.text = PACK_SEPARATOR.join(parts)
+        return item
+
+    async def _wait_turn(self, chat_id: int) -> None:
+        now = time.monotonic()
+        chat_at = self._chat_next.get(chat_id, 0.0)
+        if chat_at > now:
+            await asyncio.sleep(chat_at - now)
+        async with self._global_lock:
+            now = time.monotonic()
+            if self._global_next > now:
+                await asyncio.sleep(self._global_next - now)
+                now = time.monotonic()
+            self._global_next = now + self.global_interval
+        interval = self.group_interval if chat_id < 0 else self.chat_interval
+        self._chat_next[chat_id] = time.monotonic() + interval
+
+    async def _deliver(self, chat_id: int, item: _Outgoing) -> Any:
+        return await self._request(chat_id, lambda: self.bot.send_message(chat_id, item.text, **item.kwargs))
+
+    async def _request(self, chat_id: int, request: Callable[[], Awaitable[Any]], retry: bool = True) -> Any:
+        attempt = 0
+        while True:
+            await self._wait_turn(chat_id)
+            try:
+                result = await request()
+                self.sent += 1
+                TELEGRAM_MESSAGES.inc("sent")
+                return result
+            except RetryAfter as e:
+                delay = _seconds(e.retry_after)
+                self.retry_after += 1
+                TELEGRAM_RETRY_AFTER.inc()
+                log.warning("Telegram просит подождать %.0f с (чат %s)", delay, chat_id)
+                self._chat_next[chat_id] = time.monotonic() + delay
+                if delay > 5:
+                    # большой RetryAfter обычно значит общий флуд-контроль бота
+                    self._global_next = max(self._global_next, time.monotonic() + delay)
+                if not retry:
+                    raise
+            except (TimedOut, NetworkError) as e:
+                attempt += 1
+                if not retry or attempt > TG_SEND_RETRIES:
+                    raise
+                log.info("Telegram: сетевая ошибка (%s), повтор #%d", e, attempt)
+                await asyncio.sleep(min(2 ** attempt, 30))
+
+    async def _worker(self, chat_id: int) -> None:
+        queue = self._queues.get(chat_id)
+        while queue:
+            item = self._take(queue)
+            futures = [item.future] + [p.future for p in item.packed_with]
+            try:
+                message = await self._deliver(chat_id, item)
+            except asyncio.CancelledError:
+                for future in futures:
+                    if not future.done():
+                        future.cancel()
+                raise
+            except Exception as e:
+                log.error("Не удалось отправить сообщение в чат %s: %s", chat_id, e)
+                TELEGRAM_MESSAGES.inc("error")
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for future in futures:
+                if not future.done():
+                    future.set_result(message)
+        self._workers.pop(chat_id, None)
+        self._queues.pop(chat_id, None)
+
+
+_scheduler: Optional[SendScheduler] = None
+_scheduler_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def get_send_scheduler(bot: Any) -> SendScheduler:
+    """
+    Один планировщик на бота в пределах event loop: лимиты Telegram общие для всех чатов.
+    """
+    global _scheduler, _scheduler_loop
+    loop = asyncio.get_running_loop()
+    if _scheduler is None or _scheduler.bot is not bot or _scheduler_loop is not loop:
+        _scheduler = SendScheduler(bot)
+        _scheduler_loop = loop
+    return _scheduler
+
+
+def pending_total() -> int:
+    """
+    Сколько сообщений ждёт отправки во всех чатах (для метрик).
+    """
+    scheduler = _scheduler
+    if scheduler is None:
+        return 0
+    return sum(len(q) for q in list(scheduler._queues.values()))
+
+
+async def close_send_scheduler() -> None:
+    global _scheduler, _scheduler_loop
+    if _scheduler is not None:
+        await _scheduler.close()
+    _scheduler = None
+    _scheduler_loop = None
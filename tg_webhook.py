@@ -0,0 +1,176 @@
+from __future__ import annotations
+
+import hmac
+import json
+import logging
+import os
+import secrets
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from telegram import Update
+from telegram.ext import Application
+
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, METRICS_PATH, render as render_metrics
+
+log = logging.getLogger(__name__)
+
+# Режим вебхука: Telegram сам присылает апдейты POST-запросом, без long polling.
+# Включается, если задан TELEGRAM_WEBHOOK_URL — публичный адрес (https://bot.example.com),
+# за которым стоит этот процесс.
+#
+# Бот — ОДИН процесс. Задачи чатов (отмена, /status), кэш результатов для кнопок
+# res:… и планировщик отправки живут в памяти процесса, а хранилища data/*.json
+# читаются и пишутся целиком. Несколько процессов за балансировщиком без
+# привязки чата к процессу ломают кнопки и отмену и перетирают друг другу журналы;
+# балансировщик допустим только для TLS/прокси перед одним процессом.
+#
+#   WEBHOOK_LISTEN / WEBHOOK_PORT — где слушает встроенный ASGI-сервер (uvicorn);
+#   WEBHOOK_PATH   — путь, на который Telegram шлёт апдейты;
+#   WEBHOOK_SECRET — сверяем с заголовком X-Telegram-Bot-Api-Secret-Token
+#                    (без него — случайный на каждый запуск, вебхук перерегистрируется);
+#   WEBHOOK_METRICS=1 — отдавать /metrics на том же сервере.
+TELEGRAM_WEBHOOK_URL = os.getenv("TELEGRAM_WEBHOOK_URL", "").strip()
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0").strip() or "0.0.0.0"
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080") or 8080)
+WEBHOOK_PATH = "/" + (os.getenv("WEBHOOK_PATH", "/telegram").strip().strip("/") or "telegram")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "").strip()
+WEBHOOK_METRICS = os.getenv("WEBHOOK_METRICS", "0").strip().lower() in ("1", "true", "yes", "on")
+# апдейт Telegram — единицы килобайт; больше не читаем
+WEBHOOK_MAX_BODY = 1024 * 1024
+
+SECRET_HEADER = b"x-telegram-bot-api-secret-token"
+
+Send = Callable[[Dict[str, Any]], Awaitable[None]]
+Receive = Callable[[], Awaitable[Dict[str, Any]]]
+
+
+class WebhookApp:
+    """
+    Минимальное ASGI-приложение: POST WEBHOOK_PATH -> очередь апдейтов PTB,
+    GET /healthz, и при serve_metrics — GET /metrics.
+    Апдейт кладём в очередь и сразу отвечаем 200: обработка идёт в Application.
+    """
+
+    def __init__(self, application: Application, path: str, secret: str, serve_metrics: bool = False) -> None:
+        self.application = application
+        self.path = path
+        self.secret = secret.encode("utf-8")
+        self.serve_metrics = serve_metrics
+
+    async def __call__(self, scope: Dict[str, Any], receive: Receive, send: Send) -> None:
+        if scope["type"] == "lifespan":
+            while True:
+                message = await receive()
+                if message["type"] == "lifespan.startup":
+                    await send({"type": "lifespan.startup.complete"})
+                elif message["type"] == "lifespan.shutdown":
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+        if scope["type"] != "http":
+            return
+
+        method, path = scope["method"], scope["path"]
+        if path == self.path:
+            if method != "POST":
+                await _respond(send, 405, b"method not allowed")
+                return
+            await self._handle_update(scope, receive, send)
+        elif path == "/healthz" and method == "GET":
+            await _respond(send, 200, b"ok")
+        elif path == METRICS_PATH and method == "GET" and self.serve_metrics:
+            await _respond(send, 200, render_metrics().encode("utf-8"), METRICS_CONTENT_TYPE)
+        else:
+            await _respond(send, 404, b"not found")
+
+    async def _handle_update(self, scope: Dict[str, Any], receive: Receive, send: Send) -> None:
+        headers = dict(scope.get("headers") or [])
+        if not hmac.compare_digest(headers.get(SECRET_HEADER, b""), self.secret):
+            log.warning("Вебхук: неверный секрет от %s", (scope.get("client") or ("?",))[0])
+            await _respond(send, 403, b"forbidden")
+            return
+
+        body = await _read_body(receive, WEBHOOK_MAX_BODY)
+        if body is None:
+            await _respond(send, 413, b"too large")
+            return
+        try:
+            update = Update.de_json(json.loads(body), self.application.bot)
+        except Exception as e:
+            log.warning("Вебхук: не разобрал апдейт: %s", e)
+            await _respond(send, 400, b"bad update")
+            return
+        if update is None:
+            await _respond(send, 400, b"bad update")
+            return
+
+        await self.application.update_queue.put(update)
+        await _respond(send, 200, b"ok")
+
+
+async def _read_body(receive: Receive, limit: int) -> Optional[bytes]:
+    chunks = []
+    size = 0
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            break
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if size > limit:
+            return None
+        chunks.append(chunk)
+        if not message.get("more_body"):
+            break
+    return b"".join(chunks)
+
+
+async def _respond(send: Send, status: int, body: bytes, content_type: str = "text/plain; charset=utf-8") -> None:
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", content_type.encode("latin-1")),
+                (b"content-length", str(len(body)).encode("latin-1")),
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
+
+
+async def serve_webhook(application: Application) -> None:
+    """
+    Поднимаем Application без Updater, регистрируем вебхук в Telegram
+    и обслуживаем его встроенным uvicorn до сигнала остановки.
+    """
+    try:
+        import uvicorn
+    except ImportError as e:
+        raise RuntimeError("Для режима вебхука нужен uvicorn: pip install uvicorn") from e
+
+    secret = WEBHOOK_SECRET
+    if not secret:
+        # Telegram допускает A-Z, a-z, 0-9, _ и -; token_urlsafe как раз такой
+        secret = secrets.token_urlsafe(32)
+        log.info("WEBHOOK_SECRET не задан — сгенерирован случайный на этот запуск")
+
+    url = TELEGRAM_WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH
+    asgi_app = WebhookApp(application, WEBHOOK_PATH, secret, serve_metrics=WEBHOOK_METRICS)
+    server = uvicorn.Server(
+        uvicorn.Config(asgi_app, host=WEBHOOK_LISTEN, port=WEBHOOK_PORT, lifespan="off", log_level="warning")
+    )
+
+    async with application:
+        # run_polling зовёт post_init сам (после initialize, до start), здесь — мы
+        if application.post_init is not None:
+            await application.post_init(application)
+        await application.start()
+        await application.bot.set_webhook(url=url, secret_token=secret, allowed_updates=Update.ALL_TYPES)
+        log.info("Вебхук: %s, слушаю %s:%d", url, WEBHOOK_LISTEN, WEBHOOK_PORT)
+        try:
+            await server.serve()
+        finally:
+            await application.stop()
+            # run_polling зовёт post_shutdown сам, здесь — мы
+            if application.post_shutdown is not None:
+                await application.post_shutdown(application)
@@ -0,0 +1,208 @@
+from __future__ import annotations
+
+import logging
+import os
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence
+
+from mce_filter import OTHER_DIRECTIONS, TOP_DIRECTIONS, find_keywords, normalize_text
+
+log = logging.getLogger(__name__)
+
+# бюджет токенов описания на один тендер и на весь запуск
+GPT_TENDER_TOKEN_BUDGET = int(os.getenv("GPT_TENDER_TOKEN_BUDGET", "500") or 500)
+GPT_RUN_TOKEN_BUDGET = int(os.getenv("GPT_RUN_TOKEN_BUDGET", "8000") or 8000)
+
+# сколько символов на токен считаем, если tiktoken не установлен
+# (смесь кириллицы и латиницы у моделей OpenAI — около 3)
+_CHARS_PER_TOKEN = 3
+
+_SPEC_RE = re.compile(
+    r"\b(лот|наименовани|количеств|характеристик|технические требования|техническое задание|"
+    r"предмет|объект закупки|спецификаци|заказчик|место поставки|срок поставки|нмцк)",
+    re.I,
+)
+# строки таблиц: число + единица измерения
+_UNIT_RE = re.compile(
+    r"\d[\d\s.,]*\s*(шт|ед|компл|комплект|м3|м³|кг|т|мм|м|л|мпа|кпа|бар|°c|квт|в)\b\.?",
+    re.I,
+)
+# навигация, реклама и прочая обвязка страницы Ростендера
+_CHROME_RE = re.compile(
+    r"(войти|регистрац|тариф|подписк|подписать|главная|личный кабинет|cookie|©|"
+    r"политика конфиденциальности|скачать приложение|поддержка|реклама|поиск тендеров|"
+    r"все права защищены|обратная связь)",
+    re.I,
+)
+
+
+@lru_cache(maxsize=8)
+def _encoder(model: str):
+    """
+    Кодировщик tiktoken или None — тогда считаем по длине. None тоже кэшируется:
+    без сети tiktoken не скачает словарь, и повторять попытку на каждый вызов незачем.
+    """
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        log.warning("tiktoken недоступен для %s (%s) — токены считаем по длине текста", model, e)
+        return None
+
+
+def warm_encoders(models: Sequence[str]) -> None:
+    """
+    Загрузить словари tiktoken заранее: первый вызов читает (или скачивает)
+    файл словаря, и в обработчике апдейта это держало бы цикл событий.
+    """
+    for model in dict.fromkeys(models):
+        _encoder(model)
+
+
+def count_tokens(text: str, model: str = "gpt-4o-mini") -> int:
+    """
+    Число токенов для модели: точно через tiktoken (если стоит),
+    иначе — оценка по длине.
+    """
+    if not text:
+        return 0
+    enc = _encoder(model)
+    if enc is not None:
+        return len(enc.encode(text, disallowed_special=()))
+    return len(text) // _CHARS_PER_TOKEN + 1
+
+
+def truncate_tokens(text: str, budget: int, model: str = "gpt-4o-mini") -> str:
+    """
+    Начало текста не длиннее budget токенов.
+    """
+    if budget <= 0 or not text:
+        return ""
+    enc = _encoder(model)
+    if enc is not None:
+        tokens = enc.encode(text, disallowed_special=())
+        return text if len(tokens) <= budget else enc.decode(tokens[:budget])
+    return text[: budget * _CHARS_PER_TOKEN]
+
+
+@dataclass
+class Excerpt:
+    text: str
+    original_tokens: int
+    tokens: int
+
+    @property
+    def saved_tokens(self) -> int:
+        return max(self.original_tokens - self.tokens, 0)
+
+
+def _score_lines(lines: List[str]) -> List[int]:
+    scores = [0] * len(lines)
+    hit_rows = []
+    for i, line in enumerate(lines):
+        if len(line) < 3 or _CHROME_RE.search(line):
+            scores[i] = -10
+            continue
+        norm = normalize_text(line)
+        top = find_keywords(norm, TOP_DIRECTIONS)
+        other = find_keywords(norm, OTHER_DIRECTIONS)
+        score = 6 * len(top) + 3 * len(other)
+        if score:
+            hit_rows.append(i)
+        if _SPEC_RE.search(line):
+            score += 3
+        if _UNIT_RE.search(line):
+            score += 2
+        scores[i] = score
+
+    # соседние строки у попаданий по ключам — обычно это продолжение предложения
+    for i in hit_rows:
+        for j in (i - 1, i + 1):
+            if 0 <= j < len(lines) and scores[j] >= 0:
+                scores[j] += 2
+    return scores
+
+
+def select_passages(text: str, budget: int, model: str = "gpt-4o-mini") -> Excerpt:
+    """
+    Выбираем самые информативные строки описания в пределах бюджета:
+    попадания по ключам mce_filter и их соседей, строки спецификаций и лотов.
+    Обвязку страницы выкидываем. Порядок строк сохраняем, пропуски помечаем «…».
+    """
+    original_tokens = count_tokens(text, model)
+    if original_tokens <= budget:
+        return Excerpt(text=text, original_tokens=original_tokens, tokens=original_tokens)
+
+    lines: List[str] = []
+    seen = set()
+    for raw in (text or "").splitlines():
+        line = raw.strip()
+        if line and line not in seen:
+            seen.add(line)
+            lines.append(line)
+
+    scores = _score_lines(lines)
+    order = sorted(
+        (i for i in range(len(lines)) if scores[i] >= 0),
+        key=lambda i: (-scores[i], i),
+    )
+
+    chosen: List[int] = []
+    used = 0
+    for i in order:
+        cost = count_tokens(lines[i], model) + 1
+        if used + cost > budget:
+            continue
+        chosen.append(i)
+        used += cost
+
+    if not chosen and lines:
+        # ни одна строка целиком не влезла (описание одной длинной строкой) —
+        # режем лучшую под бюджет, а не отдаём пустоту
+        best = lines[order[0]] if order else lines[0]
+        excerpt = truncate_tokens(best, budget - 1, model)
+        return Excerpt(text=excerpt, original_tokens=original_tokens, tokens=count_tokens(excerpt, model))
+
+    chosen.sort()
+    parts: List[str] = []
+    prev = -1
+    for i in chosen:
+        if prev >= 0 and i != prev + 1:
+            parts.append("…")
+        parts.append(lines[i])
+        prev = i
+    excerpt = "\n".join(parts)
+    return Excerpt(text=excerpt, original_tokens=original_tokens, tokens=count_tokens(excerpt, model))
+
+
+def plan_budgets(
+    sizes: Dict[str, int],
+    per_tender: int = GPT_TENDER_TOKEN_BUDGET,
+    per_run: Optional[int] = GPT_RUN_TOKEN_BUDGET,
+) -> Dict[str, int]:
+    """
+    Делим бюджет запуска между тендерами «наливом»: короткие описания берут
+    сколько им нужно, остаток поровну достаётся длинным, но не больше per_tender.
+    sizes: номер -> токенов в полном описании.
+    """
+    budgets: Dict[str, int] = {}
+    remaining = per_run if per_run else None
+    pending: Sequence[str] = sorted(sizes, key=lambda c: sizes[c])
+    for idx, code in enumerate(pending):
+        cap = per_tender
+        if remaining is not None:
+            share = remaining // (len(pending) - idx)
+            cap = min(cap, share)
+        budget = min(sizes[code], cap)
+        budgets[code] = budget
+        if remaining is not None:
+            remaining -= budget
+    return budgets
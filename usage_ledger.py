@@ -0,0 +1,316 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timedelta
+from threading import Lock
+from typing import Dict, Iterator, List, Optional
+
+from json_store import data_path, read_json, write_json_atomic
+
+log = logging.getLogger(__name__)
+
+# Учёт токенов и денег на GPT.
+#
+# data/usage/requests-ГГГГ-ММ.jsonl — по строке на каждый запрос (только дописываем);
+# data/usage_ledger.json             — агрегаты по дням/месяцам (модели, чаты) и последние запуски.
+#
+# Лимиты расходов, $ (0 — без лимита). Когда потрачено GPT_BUDGET_SOFT_RATIO
+# от лимита, бот перестаёт звать GPT и решает по локальному фильтру;
+# при полном исчерпании запросы к GPT не отправляются вовсе.
+GPT_DAILY_BUDGET_USD = float(os.getenv("GPT_DAILY_BUDGET_USD", "0") or 0)
+GPT_MONTHLY_BUDGET_USD = float(os.getenv("GPT_MONTHLY_BUDGET_USD", "0") or 0)
+GPT_BUDGET_SOFT_RATIO = float(os.getenv("GPT_BUDGET_SOFT_RATIO", "0.9") or 0.9)
+
+USAGE_PATH = data_path("usage_ledger.json")
+USAGE_LOG_DIR = data_path("usage")
+KEEP_DAYS = 62
+KEEP_MONTHS = 24
+KEEP_RUNS = 200
+
+BUDGET_OK = "ok"
+BUDGET_NEAR = "near"
+BUDGET_EXCEEDED = "exceeded"
+
+
+class BudgetExceeded(RuntimeError):
+    pass
+
+
+def _counter() -> dict:
+    return {"requests": 0, "prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0, "cost": 0.0}
+
+
+def _add(counter: dict, prompt: int, completion: int, cached: int, cost: float) -> None:
+    counter["requests"] += 1
+    counter["prompt_tokens"] += prompt
+    counter["completion_tokens"] += completion
+    counter["cached_tokens"] += cached
+    counter["cost"] = round(counter["cost"] + cost, 6)
+
+
+def _add_counter(counter: dict, other: dict) -> None:
+    for key in ("requests", "prompt_tokens", "completion_tokens", "cached_tokens"):
+        counter[key] = counter.get(key, 0) + other.get(key, 0)
+    counter["cost"] = round(counter.get("cost", 0.0) + other.get("cost", 0.0), 6)
+
+
+def _empty() -> dict:
+    return {"days": {}, "months": {}, "runs": []}
+
+
+@dataclass
+class RunUsage:
+    """
+    Расход одного запуска проверки (для /usage и статистики).
+    """
+    run_id: str
+    chat_id: Optional[int]
+    started: str
+    totals: dict = field(default_factory=_counter)
+    models: Dict[str, dict] = field(default_factory=dict)
+
+    @property
+    def cost(self) -> float:
+        return self.totals["cost"]
+
+
+# файл учёта общий у всех экземпляров в процессе: чтение-слияние-запись под одним замком
+_file_lock = Lock()
+
+# текущий запуск: задаётся в track_run, задачи asyncio наследуют его вместе с контекстом
+_current_run: ContextVar[Optional[RunUsage]] = ContextVar("usage_run", default=None)
+
+
+class UsageLedger:
+    """
+    Файл учёта пишут несколько процессов (бот, gpt_batch_api, скрипты), поэтому
+    в памяти держим отдельно ещё не сохранённые приращения этого процесса:
+    при сохранении они прибавляются к тому, что сейчас в файле, а при чтении —
+    к свежей версии файла, если его успел переписать кто-то другой.
+    """
+
+    def __init__(self, path: str = USAGE_PATH, log_dir: str = USAGE_LOG_DIR) -> None:
+        self.path = path
+        self.log_dir = log_dir
+        self._lock = Lock()
+        self._data: dict = _empty()
+        self._pending: dict = _empty()
+        self._stamp: Optional[tuple] = None
+        self._loaded = False
+        self._dirty = False
+
+    def _file_stamp(self) -> Optional[tuple]:
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def _ensure_loaded(self) -> None:
+        # перечитываем, только если файл изменился: check_budget зовут на каждый запрос
+        stamp = self._file_stamp()
+        if self._loaded and stamp == self._stamp:
+            return
+        self._data = self._with_pending(read_json(self.path, {}))
+        self._stamp = stamp
+        self._loaded = True
+
+    def _with_pending(self, raw: dict) -> dict:
+        """
+        Содержимое файла плюс несохранённые приращения этого процесса.
+        """
+        data = {
+            "days": raw.get("days") or {},
+            "months": raw.get("months") or {},
+            "runs": list(raw.get("runs") or []),
+        }
+        for table in ("days", "months"):
+            for key, delta in self._pending[table].items():
+                bucket = self._bucket(data[table], key)
+                _add_counter(bucket["total"], delta["total"])
+                for part in ("models", "chats"):
+                    for name, counter in delta[part].items():
+                        _add_counter(bucket[part].setdefault(name, _counter()), counter)
+        data["runs"] = (data["runs"] + self._pending["runs"])[-KEEP_RUNS:]
+        return data
+
+    @staticmethod
+    def _bucket(table: dict, key: str) -> dict:
+        if key not in table:
+            table[key] = {"total": _counter(), "models": {}, "chats": {}}
+        return table[key]
+
+    # ---------- запись ----------
+
+    def record(
+        self,
+        model: str,
+        prompt_tokens: int,
+        completion_tokens: int,
+        cached_tokens: int,
+        cost: float,
+        chat_id: Optional[int] = None,
+        run_id: Optional[str] = None,
+        source: str = "chat",
+    ) -> None:
+        run = _current_run.get()
+        if run is not None:
+            chat_id = run.chat_id if chat_id is None else chat_id
+            run_id = run_id or run.run_id
+            _add(run.totals, prompt_tokens, completion_tokens, cached_tokens, cost)
+            _add(run.models.setdefault(model, _counter()), prompt_tokens, completion_tokens, cached_tokens, cost)
+
+        now = datetime.now()
+        line = {
+            "at": now.isoformat(timespec="seconds"),
+            "source": source,
+            "model": model,
+            "chat_id": chat_id,
+            "run_id": run_id,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "cached_tokens": cached_tokens,
+            "cost": round(cost, 6),
+        }
+        with self._lock:
+            self._ensure_loaded()
+            chat_key = str(chat_id) if chat_id is not None else "—"
+            for data in (self._data, self._pending):
+                for table, key in (("days", now.strftime("%Y-%m-%d")), ("months", now.strftime("%Y-%m"))):
+                    bucket = self._bucket(data[table], key)
+                    _add(bucket["total"], prompt_tokens, completion_tokens, cached_tokens, cost)
+                    _add(bucket["models"].setdefault(model, _counter()), prompt_tokens, completion_tokens, cached_tokens, cost)
+                    _add(bucket["chats"].setdefault(chat_key, _counter()), prompt_tokens, completion_tokens, cached_tokens, cost)
+            self._dirty = True
+            try:
+                os.makedirs(self.log_dir, exist_ok=True)
+                log_path = os.path.join(self.log_dir, f"requests-{now.strftime('%Y-%m')}.jsonl")
+                with open(log_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(line, ensure_ascii=False) + "\n")
+            except OSError as e:
+                log.warning("Не удалось дописать журнал запросов GPT: %s", e)
+
+        # вне запуска бота (скрипты) сохраняем сразу, в запуске — в конце track_run
+        if run is None:
+            self.flush()
+
+    def finish_run(self, run: RunUsage) -> None:
+        if not run.totals["requests"]:
+            return
+        with self._lock:
+            self._ensure_loaded()
+            self._data["runs"] = (self._data["runs"] + [asdict(run)])[-KEEP_RUNS:]
+            self._pending["runs"].append(asdict(run))
+            self._dirty = True
+        self.flush()
+
+    def flush(self) -> None:
+        """
+        Прибавляем приращения этого процесса к тому, что сейчас лежит в файле
+        (его мог переписать другой процесс), а не затираем файл своей копией.
+        """
+        with _file_lock, self._lock:
+            if not self._dirty:
+                return
+            data = self._with_pending(read_json(self.path, {}))
+            today = datetime.now()
+            oldest_day = (today - timedelta(days=KEEP_DAYS)).strftime("%Y-%m-%d")
+            data["days"] = {k: v for k, v in data["days"].items() if k >= oldest_day}
+            months = sorted(data["months"])
+            for key in months[:-KEEP_MONTHS]:
+                del data["months"][key]
+            try:
+                write_json_atomic(self.path, data)
+            except Exception as e:
+                log.warning("Не удалось сохранить учёт расходов GPT: %s", e)
+                return
+            self._pending = _empty()
+            self._dirty = False
+            # между записью и stat файл мог переписать другой процесс — перечитаем при чтении
+            self._loaded = False
+
+    # ---------- чтение ----------
+
+    def day(self, when: Optional[datetime] = None) -> dict:
+        key = (when or datetime.now()).strftime("%Y-%m-%d")
+        with self._lock:
+            self._ensure_loaded()
+            return json.loads(json.dumps(self._data["days"].get(key) or self._bucket({}, key)))
+
+    def month(self, when: Optional[datetime] = None) -> dict:
+        key = (when or datetime.now()).strftime("%Y-%m")
+        with self._lock:
+            self._ensure_loaded()
+            return json.loads(json.dumps(self._data["months"].get(key) or self._bucket({}, key)))
+
+    def recent_runs(self, limit: int = 5, chat_id: Optional[int] = None) -> List[dict]:
+        with self._lock:
+            self._ensure_loaded()
+            runs = [r for r in self._data["runs"] if chat_id is None or r.get("chat_id") == chat_id]
+            return runs[-limit:]
+
+    def spent_today(self) -> float:
+        return self.day()["total"]["cost"]
+
+    def spent_month(self) -> float:
+        return self.month()["total"]["cost"]
+
+    def budget_status(self) -> str:
+        """
+        ok — тратим спокойно; near — почти упёрлись в лимит (дальше только
+        локальные решения); exceeded — лимит исчерпан.
+        Считаем по свежему файлу: расходы других процессов (Batch API) тоже в лимите.
+        """
+        status = BUDGET_OK
+        for spent, cap in (
+            (self.spent_today(), GPT_DAILY_BUDGET_USD),
+            (self.spent_month(), GPT_MONTHLY_BUDGET_USD),
+        ):
+            if cap <= 0:
+                continue
+            if spent >= cap:
+                return BUDGET_EXCEEDED
+            if spent >= cap * GPT_BUDGET_SOFT_RATIO:
+                status = BUDGET_NEAR
+        return status
+
+    def check_budget(self) -> None:
+        if self.budget_status() == BUDGET_EXCEEDED:
+            raise BudgetExceeded("исчерпан лимит расходов на GPT")
+
+
+_ledger: Optional[UsageLedger] = None
+_ledger_lock = Lock()
+
+
+def get_ledger() -> UsageLedger:
+    global _ledger
+    with _ledger_lock:
+        if _ledger is None:
+            _ledger = UsageLedger()
+        return _ledger
+
+
+@contextmanager
+def track_run(chat_id: Optional[int] = None) -> Iterator[RunUsage]:
+    """
+    Все запросы к GPT внутри блока (в том числе из дочерних задач asyncio)
+    записываются на этот запуск и чат.
+    """
+    run = RunUsage(
+        run_id=uuid.uuid4().hex[:12],
+        chat_id=chat_id,
+        started=datetime.now().isoformat(timespec="seconds"),
+    )
+    token = _current_run.set(run)
+    try:
+        yield run
+    finally:
+        _current_run.reset(token)
+        get_ledger().finish_run(run)